@@ -1,117 +1,50 @@
+import hashlib
+import io
+import os
 from datetime import datetime
 from pathlib import Path
-from typing import List
+from secrets import token_hex, token_urlsafe
+from threading import Lock
+from typing import Optional
 
+import click
 from flask import (
-    Flask, render_template, request, redirect, url_for,
-    flash, send_file, jsonify, abort
+    Blueprint, Flask, Response, render_template, request, redirect, url_for,
+    flash, send_file, jsonify, abort, make_response, session, stream_with_context
 )
-from sqlalchemy import create_engine, Integer, String, Text, DateTime
-from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, sessionmaker, Session
-import markdown as md
-import bleach
-import io
-from sqlalchemy import Boolean
-from secrets import token_urlsafe
-from flask_socketio import SocketIO, emit, join_room, leave_room
-from threading import Lock
-from sqlalchemy import ForeignKey, Boolean, select
-from sqlalchemy.orm import relationship
-from flask import render_template, request, redirect, url_for, flash
-from typing import Optional
+from flask.cli import with_appcontext
+from flask_login import UserMixin, login_user, logout_user, current_user, login_required
+from flask_socketio import emit, join_room, leave_room
+from sqlalchemy import create_engine, Integer, String, Text, DateTime, ForeignKey, Boolean, func, insert, select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, relationship, sessionmaker, Session
+from werkzeug.http import is_resource_modified
 from werkzeug.security import generate_password_hash, check_password_hash
-from flask_login import (
-    LoginManager, UserMixin, login_user, logout_user,
-    current_user, login_required
-)
-from typing import Optional
-from sqlalchemy import Boolean, ForeignKey
-from sqlalchemy.orm import Mapped, mapped_column
-from datetime import datetime
-from secrets import token_urlsafe
-from sqlalchemy import select
-from flask_login import login_required, current_user
-from flask import render_template, request, redirect, url_for, flash, abort
-from biblio import biblio, BibEntry
-from extensions import db
-import os
-from biblio_bp import biblio_bp
-from organizer import organizer_bp
-from flask import Flask, redirect, url_for, session
-from authlib.integrations.flask_client import OAuth
-from integrations import integrations_bp, init_oauth, oauth
+
+from extensions import db, login_manager, socketio
+from biblio import biblio, ensure_biblio_schema
+from organizer import organizer_bp, ensure_organizer_schema
+from integrations import integrations_bp
+from integration_sync import start_sync_worker
+from ttlcache import TTLCache
+from rendering import render, previews, RenderError, RenderSuperseded, RenderTooLarge, RENDER_MAX_INPUT, RENDER_PIPELINE
+import exports
+import metrics
+import sqlprofile
+import workspace
 
 
 APP_DIR = Path(__file__).parent
 DB_PATH = APP_DIR / "docs.sqlite3"
 
-# -----------------------------
-# Flask
-# -----------------------------
-app = Flask(__name__)
-app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite:///nmbc.sqlite3"
-app.config["SECRET_KEY"] = os.urandom(10).hex()
-# app.config["SERVER_NAME"] = "127.0.0.1:90"  # or "localhost:5000"
-
-db.init_app(app)
-init_oauth(app)
-
-# # in app.py after creating app
-# def _mask(v):
-#     if not v: return "MISSING"
-#     return f"{v[:6]}...{v[-4:]}"
-# print("[OAUTH] GOOGLE_CLIENT_ID:", _mask(os.getenv("GOOGLE_CLIENT_ID")))
-# print("[OAUTH] GOOGLE_CLIENT_SECRET:", _mask(os.getenv("GOOGLE_CLIENT_SECRET")))
-# print("[OAUTH] SERVER_NAME:", app.config.get("SERVER_NAME"))
-
-
-
-# google = oauth.register(
-#     name='google',
-#     client_id="YOUR_GOOGLE_CLIENT_ID",
-#     client_secret="YOUR_GOOGLE_CLIENT_SECRET",
-#     access_token_url="https://accounts.google.com/o/oauth2/token",
-#     access_token_params=None,
-#     authorize_url="https://accounts.google.com/o/oauth2/auth",
-#     authorize_params={"prompt": "select_account"},
-#     api_base_url="https://www.googleapis.com/oauth2/v1/",
-#     userinfo_endpoint="https://openidconnect.googleapis.com/v1/userinfo",
-#     client_kwargs={"scope": "openid email profile"},
-# )
-
-with app.app_context():
-    db.create_all()
-
-app.register_blueprint(biblio,url_prefix="/bib")
-app.register_blueprint(organizer_bp)
-app.register_blueprint(integrations_bp)
-
-# app.register_blueprint(biblio_bp)
-
-
-# --- Socket.IO setup ---
-socketio = SocketIO(
-    app,
-    cors_allowed_origins="*",
-    async_mode="threading"   # <— force threading; avoids eventlet/gevent import
-) # eventlet/gevent best; threads fallback OK
+# Core document/auth routes; create_app() registers them with the other blueprints.
+docs_bp = Blueprint("docs", __name__)
 save_lock = Lock()
 
-login_manager = LoginManager(app)
-login_manager.login_view = "login"
-
 # -----------------------------
 # SQLAlchemy
 # -----------------------------
 
-# --- imports/snips you likely already have ---
-from datetime import datetime
-from typing import Optional
-from sqlalchemy import (
-    create_engine, Integer, String, Text, DateTime, ForeignKey, Boolean, select
-)
-from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, relationship, sessionmaker
-
 # 1) Single Base for EVERY model
 class Base(DeclarativeBase):
     pass
@@ -173,38 +106,21 @@ class DocumentRevision(Base):
     content: Mapped[str] = mapped_column(Text, default="")
     created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
 
-# 4) Engine + create_all AFTER all models are defined
+class DocumentRender(Base):
+    """Sanitized HTML of a document's latest version, built once and served to view-only shares."""
+    __tablename__ = "document_renders"
+    document_id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    version: Mapped[int] = mapped_column(Integer)
+    content_sha: Mapped[str] = mapped_column(String(64))  # owner edits change content without a new version
+    pipeline: Mapped[str] = mapped_column(String(16), default="")  # RENDER_PIPELINE that produced html
+    html: Mapped[str] = mapped_column(Text, default="")
+    rendered_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+
+# 4) Engine AFTER all models are defined (tables come from migrate_schema())
 engine = create_engine(f"sqlite:///docs.sqlite3", future=True)
-Base.metadata.create_all(engine)
 SessionLocal = sessionmaker(bind=engine, autoflush=False, expire_on_commit=False)
 
 
-# -----------------------------
-# Markdown -> HTML (server-side)
-# We keep math as-is ($...$, $$...$$) and let KaTeX render it on the client.
-# -----------------------------
-MD_EXTS = [
-    "fenced_code",
-    "tables",
-    "toc",
-    "sane_lists",
-    "admonition",
-]
-
-ALLOWED_TAGS: List[str] = bleach.sanitizer.ALLOWED_TAGS.union(
-    {"p","pre","code","span","div","h1","h2","h3","h4","h5","h6",
-     "table","thead","tbody","tr","th","td","hr","br","blockquote","ul","ol","li"}
-)
-ALLOWED_ATTRS = {
-    **bleach.sanitizer.ALLOWED_ATTRIBUTES,
-    "a": ["href", "title", "target", "rel"],
-    "span": ["class"],
-    "div": ["class"],
-    "code": ["class"],
-    "pre": ["class"],
-}
-ALLOWED_PROTOCOLS = ["http", "https", "mailto"]
-
 def ensure_schema():
     with engine.begin() as conn:
         # create missing tables
@@ -214,19 +130,28 @@ def ensure_schema():
         names = {c[1] for c in cols}
         if "owner_id" not in names:
             conn.exec_driver_sql("ALTER TABLE documents ADD COLUMN owner_id INTEGER")
-ensure_schema()
+        cols = conn.exec_driver_sql("PRAGMA table_info(document_renders)").fetchall()
+        if "pipeline" not in {c[1] for c in cols}:
+            conn.exec_driver_sql("ALTER TABLE document_renders ADD COLUMN pipeline VARCHAR(16) DEFAULT ''")
 
-def render_markdown(text: str) -> str:
-    # Convert markdown to HTML, leaving $...$ for KaTeX to handle in the browser.
-    html = md.markdown(text, extensions=MD_EXTS, output_format="html5")
-    safe = bleach.clean(html, tags=ALLOWED_TAGS, attributes=ALLOWED_ATTRS,
-                        protocols=ALLOWED_PROTOCOLS, strip=True)
-    return safe
+def migrate_schema():
+    """Create missing tables/columns/indexes in both databases. Needs an app context."""
+    ensure_schema()
+    db.create_all()
+    ensure_biblio_schema()
+    ensure_organizer_schema()
+
+@click.command("migrate-schema")
+@with_appcontext
+def migrate_schema_command():
+    """Bring the database schema up to date (run after deploys, not on every start)."""
+    migrate_schema()
+    click.echo("Schema is up to date.")
 
-from typing import Optional
 def get_share(token: str, db: Session) -> Optional[SharedLink]:
     return db.query(SharedLink).filter(SharedLink.token == token).first()
 
+@metrics.timed("get_latest_version")
 def get_latest_version(doc_id: int, db: Session) -> int:
     rev = (
         db.query(DocumentRevision)
@@ -236,6 +161,64 @@ def get_latest_version(doc_id: int, db: Session) -> int:
     )
     return rev.version if rev else 1
 
+def latest_versions(doc_ids, db: Session) -> dict:
+    """{doc_id: latest version} for many documents in one query (1 when no revisions)."""
+    rows = (
+        db.query(DocumentRevision.document_id, func.max(DocumentRevision.version))
+        .filter(DocumentRevision.document_id.in_(list(doc_ids)))
+        .group_by(DocumentRevision.document_id)
+        .all()
+    )
+    found = dict(rows)
+    return {i: found.get(i, 1) for i in doc_ids}
+
+def rendered_html(doc: Document, version: int, db: Session) -> str:
+    """The stored render of doc at `version`; renders and stores it on first request."""
+    sha = hashlib.sha256((doc.content or "").encode("utf-8")).hexdigest()
+    row = db.get(DocumentRender, doc.id)
+    if row is not None and row.version == version and row.content_sha == sha and row.pipeline == RENDER_PIPELINE:
+        return row.html
+    html = render(doc.content or "")
+    stmt = sqlite_insert(DocumentRender).values(document_id=doc.id, version=version, content_sha=sha,
+                                                pipeline=RENDER_PIPELINE, html=html)
+    db.execute(stmt.on_conflict_do_update(
+        index_elements=[DocumentRender.document_id],
+        set_={"version": version, "content_sha": sha, "pipeline": RENDER_PIPELINE, "html": html,
+              "rendered_at": datetime.utcnow()}))
+    db.commit()
+    return html
+
+# Collab previews: one render per (document, version, content), shared by the whole room.
+PREVIEW_CACHE_SECONDS = 10 * 60
+_preview_cache = TTLCache(ttl=PREVIEW_CACHE_SECONDS, maxsize=512, name="preview_renders")
+
+def preview_html(doc_id: int, version: int, content: str) -> str:
+    """Raises RenderError (see rendering.render); a newer version's render supersedes this one."""
+    key = (RENDER_PIPELINE, doc_id, version, hashlib.sha256((content or "").encode("utf-8")).hexdigest())
+    html = _preview_cache.get(key)
+    if html is None:
+        # versions are the room's sequence numbers: bursts of edits render only the newest
+        html = previews.submit(("room", doc_id), version, content or "")
+        _preview_cache.set(key, html)
+    return html
+
+def emit_preview(doc_id: int, version: int, content: str, **kwargs):
+    try:
+        payload = {"version": version, "html": preview_html(doc_id, version, content)}
+    except RenderSuperseded:
+        return  # a newer version is being rendered for this room
+    except RenderError as ex:
+        payload = {"version": version, "html": None, "error": str(ex) or "Preview unavailable."}
+    emit("preview", payload, **kwargs)
+
+def watch_room(doc_id: int) -> str:
+    """Socket.IO room of read-only viewers; it only ever receives "version" pings."""
+    return f"doc:{doc_id}:watch"
+
+def notify_watchers(doc: Document, version: int):
+    socketio.emit("version", {"version": version, "updated_at": doc.updated_at.isoformat() if doc.updated_at else None},
+                  to=watch_room(doc.id))
+
 def create_revision(doc: Document, new_content: str, db: Session) -> int:
     # bump version, write revision, persist
     current_version = get_latest_version(doc.id, db)
@@ -247,15 +230,49 @@ def create_revision(doc: Document, new_content: str, db: Session) -> int:
     db.commit()
     return new_version
 
+# -----------------------------
+# Conditional GET
+# -----------------------------
+# Bump when templates or rendering change what an unchanged document looks like.
+REPRESENTATION_REVISION = "3"
+
+def doc_validators(doc: Document, version: int, variant: str):
+    """
+    (strong ETag, Last-Modified) for one representation of a document. Any
+    write to the row bumps updated_at and every collab edit bumps version,
+    so the tag changes whenever the bytes can.
+    """
+    stamp = doc.updated_at.isoformat() if doc.updated_at else ""
+    raw = f"{REPRESENTATION_REVISION}:{variant}:{doc.id}:{version}:{stamp}"
+    return hashlib.sha256(raw.encode()).hexdigest()[:32], doc.updated_at
+
+def not_modified(etag: str, last_modified, cache_control: str):
+    """A 304 for the current request if its validators match, else None."""
+    if is_resource_modified(request.environ, etag=etag, last_modified=last_modified):
+        return None
+    return with_validators(Response(status=304), etag, last_modified, cache_control)
+
+def with_validators(resp, etag: str, last_modified, cache_control: str):
+    resp.set_etag(etag)
+    if last_modified:
+        resp.last_modified = last_modified
+    resp.headers["Cache-Control"] = cache_control
+    return resp
+
+# Owner downloads and editable shares: always revalidate, never stored by shared caches.
+CACHE_PRIVATE = "private, no-cache"
+# View-only share pages carry nothing per-user, so proxies may keep them briefly.
+CACHE_SHARED_VIEW = "public, max-age=60, stale-while-revalidate=300"
+
 # -----------------------------
 # Routes
 # -----------------------------
-@app.route("/login/google")
+@docs_bp.route("/login/google")
 def login_google():
-    redirect_uri = url_for("auth_google_callback", _external=True)
+    redirect_uri = url_for("docs.auth_google_callback", _external=True)
     return google.authorize_redirect(redirect_uri)
 
-@app.route("/auth/callback/google")
+@docs_bp.route("/auth/callback/google")
 def auth_google_callback():
     token = google.authorize_access_token()
     userinfo = google.parse_id_token(token)
@@ -272,7 +289,7 @@ def _doc_for_user_or_404(db, doc_id: int):
         abort(404)
     return d
 
-@app.route("/doc/<int:doc_id>/shares")
+@docs_bp.route("/doc/<int:doc_id>/shares")
 @login_required
 def list_shares(doc_id: int):
     with SessionLocal() as db:
@@ -282,7 +299,7 @@ def list_shares(doc_id: int):
         ).scalars().all()
         return render_template("shares.html", doc=d, shares=shares)
 
-@app.route("/doc/<int:doc_id>/shares/create", methods=["POST"])
+@docs_bp.route("/doc/<int:doc_id>/shares/create", methods=["POST"])
 @login_required
 def create_share_for_doc(doc_id: int):
     can_edit = (request.form.get("can_edit") == "on")
@@ -296,11 +313,11 @@ def create_share_for_doc(doc_id: int):
             if get_latest_version(d.id, db) == 1:
                 db.add(DocumentRevision(document_id=d.id, version=1, content=d.content))
         db.commit()
-        link = url_for("open_shared", token=tok, _external=True)
+        link = url_for("docs.open_shared", token=tok, _external=True)
         flash(("Edit" if can_edit else "View") + f" link created: {link}", "ok")
-        return redirect(url_for("list_shares", doc_id=d.id))
+        return redirect(url_for("docs.list_shares", doc_id=d.id))
 
-@app.route("/share/<string:token>/toggle", methods=["POST"])
+@docs_bp.route("/share/<string:token>/toggle", methods=["POST"])
 @login_required
 def toggle_share(token: str):
     with SessionLocal() as db:
@@ -311,9 +328,9 @@ def toggle_share(token: str):
         s.can_edit = not s.can_edit
         db.add(s); db.commit()
         flash(f"Permissions updated: {'Editable' if s.can_edit else 'View only'}", "ok")
-        return redirect(url_for("list_shares", doc_id=d.id))
+        return redirect(url_for("docs.list_shares", doc_id=d.id))
 
-@app.route("/share/<string:token>/revoke", methods=["POST"])
+@docs_bp.route("/share/<string:token>/revoke", methods=["POST"])
 @login_required
 def revoke_share(token: str):
     with SessionLocal() as db:
@@ -323,12 +340,12 @@ def revoke_share(token: str):
         d = _doc_for_user_or_404(db, s.document_id)
         db.delete(s); db.commit()
         flash("Link revoked.", "ok")
-        return redirect(url_for("list_shares", doc_id=d.id))
+        return redirect(url_for("docs.list_shares", doc_id=d.id))
 
-@app.route("/register", methods=["GET", "POST"])
+@docs_bp.route("/register", methods=["GET", "POST"])
 def register():
     if current_user.is_authenticated:
-        return redirect(url_for("index"))
+        return redirect(url_for("docs.index"))
     if request.method == "POST":
         email = (request.form.get("email") or "").strip().lower()
         username = (request.form.get("username") or "").strip()
@@ -349,14 +366,14 @@ def register():
             db.commit()
             login_user(u)
             flash("Welcome!", "ok")
-            return redirect(url_for("index"))
+            return redirect(url_for("docs.index"))
     return render_template("auth_register.html")
 
 
-@app.route("/login", methods=["GET", "POST"])
+@docs_bp.route("/login", methods=["GET", "POST"])
 def login():
     if current_user.is_authenticated:
-        return redirect(url_for("index"))
+        return redirect(url_for("docs.index"))
     if request.method == "POST":
         email_or_username = (request.form.get("id") or "").strip()
         password = request.form.get("password") or ""
@@ -369,18 +386,18 @@ def login():
                 return render_template("auth_login.html")
             login_user(u)
             flash("Logged in.", "ok")
-            return redirect(url_for("index"))
+            return redirect(url_for("docs.index"))
     return render_template("auth_login.html")
 
 
-@app.route("/logout")
+@docs_bp.route("/logout")
 @login_required
 def logout():
     logout_user()
     flash("Logged out.", "ok")
-    return redirect(url_for("login"))
+    return redirect(url_for("docs.login"))
 
-@app.route("/")
+@docs_bp.route("/")
 @login_required
 def index():
     with SessionLocal() as db:
@@ -392,7 +409,7 @@ def index():
         )
     return render_template("index.html", docs=docs)
 
-@app.route("/new", methods=["GET", "POST"])
+@docs_bp.route("/new", methods=["GET", "POST"])
 @login_required
 def new_doc():
     if request.method == "POST":
@@ -403,10 +420,10 @@ def new_doc():
             db.add(d)
             db.commit()
             flash("Document created.", "ok")
-            return redirect(url_for("edit_doc", doc_id=d.id))
+            return redirect(url_for("docs.edit_doc", doc_id=d.id))
     return render_template("editor.html", doc=None)
 
-@app.route("/edit/<int:doc_id>", methods=["GET", "POST"])
+@docs_bp.route("/edit/<int:doc_id>", methods=["GET", "POST"])
 @login_required
 def edit_doc(doc_id: int):
     with SessionLocal() as db:
@@ -418,41 +435,149 @@ def edit_doc(doc_id: int):
             d.content = request.form.get("content") or ""
             db.add(d)
             db.commit()
+            notify_watchers(d, get_latest_version(d.id, db))
             flash("Document saved.", "ok")
-            return redirect(url_for("edit_doc", doc_id=doc_id))
+            return redirect(url_for("docs.edit_doc", doc_id=doc_id))
     return render_template("editor.html", doc=d)
 
-@app.route("/api/preview", methods=["POST"])
+def _preview_client():
+    """Stable id for this browser session (signed-in user or a random id kept in the session)."""
+    if current_user.is_authenticated:
+        return f"user:{current_user.get_id()}"
+    if "preview_client" not in session:
+        session["preview_client"] = token_hex(8)
+    return session["preview_client"]
+
+@docs_bp.route("/api/preview", methods=["POST"])
 def api_preview():
+    """
+    JSON {text, doc_id?, tab?, seq?} -> {html, seq}. With tab + seq (increasing per
+    tab), requests from one tab and document are coalesced: only the newest
+    text is rendered, and overtaken requests answer {"superseded": true}.
+    """
     data = request.get_json(silent=True) or {}
     text = data.get("text", "")
-    html = render_markdown(text)
-    return jsonify({"html": html})
-
-@app.route("/download/<int:doc_id>")
+    seq = data.get("seq")
+    try:
+        if isinstance(seq, int):
+            key = (_preview_client(), data.get("doc_id"), str(data.get("tab") or ""))
+            html = previews.submit(key, seq, text)
+        else:
+            html = render(text)
+    except RenderSuperseded:
+        return jsonify({"html": None, "superseded": True, "seq": seq})
+    except RenderTooLarge as ex:
+        return jsonify({"html": None, "error": str(ex), "seq": seq}), 413
+    except RenderError as ex:
+        return jsonify({"html": None, "error": str(ex), "seq": seq}), 503
+    return jsonify({"html": html, "seq": seq})
+
+@docs_bp.route("/download/<int:doc_id>")
 def download_md(doc_id: int):
     with SessionLocal() as db:
         d = db.get(Document, doc_id)
         if not d:
             abort(404)
+        etag, modified = doc_validators(d, get_latest_version(d.id, db), "md")
+        cached = not_modified(etag, modified, CACHE_PRIVATE)
+        if cached is not None:
+            return cached
         buf = io.BytesIO(d.content.encode("utf-8"))
         filename = f"{d.title or 'document'}.md"
-        return send_file(buf, as_attachment=True, download_name=filename, mimetype="text/markdown")
+        resp = send_file(buf, as_attachment=True, download_name=filename, mimetype="text/markdown")
+        return with_validators(resp, etag, modified, CACHE_PRIVATE)
 
-@app.route("/export/html/<int:doc_id>")
+@docs_bp.route("/export/html/<int:doc_id>")
 def export_html(doc_id: int):
     with SessionLocal() as db:
         d = db.get(Document, doc_id)
         if not d:
             abort(404)
-        body_html = render_markdown(d.content)
-        full_html = render_template("export.html", title=d.title, body_html=body_html)
-        buf = io.BytesIO(full_html.encode("utf-8"))
+        version = get_latest_version(d.id, db)
+        etag, modified = doc_validators(d, version, "html")
+        cached = not_modified(etag, modified, CACHE_PRIVATE)
+        if cached is not None:
+            return cached
         filename = f"{d.title or 'document'}.html"
-        return send_file(buf, as_attachment=True, download_name=filename, mimetype="text/html")
+        rows = [(d.id, version, d.title, d.content)]
+        path = exports.cached(exports.cache_key("html", rows), "html")
+        if path is None:
+            # a miss renders in the export pool like pdf/zip (the pages POST /export/<id>/html)
+            if len(d.content or "") > RENDER_MAX_INPUT:
+                abort(413)
+            owner = current_user.id if current_user.is_authenticated else None
+            job = exports.submit(owner, "html", rows, filename)
+            return redirect(url_for("docs.export_job_status", job_id=job["id"]), 303)
+        resp = send_file(path, as_attachment=True, download_name=filename, mimetype="text/html",
+                         conditional=False, etag=False)
+        return with_validators(resp, etag, modified, CACHE_PRIVATE)
+
+# -----------------------------
+# Export jobs (rendered in a process pool, see exports.py)
+# -----------------------------
+def _job_json(job):
+    body = {"id": job["id"], "format": job["format"], "status": job["status"], "error": job["error"],
+            "status_url": url_for("docs.export_job_status", job_id=job["id"])}
+    if job["status"] == "done":
+        body["download_url"] = url_for("docs.export_job_download", job_id=job["id"])
+    return body
+
+def _export_rows(db, doc_ids):
+    q = db.query(Document).filter(Document.owner_id == current_user.id)
+    if doc_ids is not None:
+        q = q.filter(Document.id.in_(doc_ids))
+    docs = q.order_by(Document.id).limit(exports.BUNDLE_MAX_DOCS).all()
+    versions = latest_versions([d.id for d in docs], db)
+    return [(d.id, versions[d.id], d.title, d.content) for d in docs]
+
+@docs_bp.route("/export/<int:doc_id>/<string:fmt>", methods=["POST"])
+@login_required
+def export_document(doc_id: int, fmt: str):
+    """Queue an HTML or PDF export; 202 + status URL, or 200 if the version is already exported."""
+    if fmt not in ("html", "pdf"):
+        abort(404)
+    with SessionLocal() as db:
+        rows = _export_rows(db, [doc_id])
+    if not rows:
+        abort(404)
+    job = exports.submit(current_user.id, fmt, rows, f"{rows[0][2] or 'document'}.{fmt}")
+    return jsonify(_job_json(job)), (200 if job["status"] == "done" else 202)
+
+@docs_bp.route("/export/bundle", methods=["POST"])
+@login_required
+def export_bundle():
+    """Zip of .md + .html for the given doc_ids (JSON or form), or all of the user's documents."""
+    data = request.get_json(silent=True) or {}
+    ids = data.get("doc_ids") or request.form.getlist("doc_ids", type=int) or None
+    with SessionLocal() as db:
+        rows = _export_rows(db, [int(i) for i in ids] if ids else None)
+    if not rows:
+        abort(404)
+    job = exports.submit(current_user.id, "zip", rows, "documents.zip")
+    return jsonify(_job_json(job)), (200 if job["status"] == "done" else 202)
+
+@docs_bp.route("/export/jobs/<string:job_id>")
+@login_required
+def export_job_status(job_id: str):
+    job = exports.get_job(job_id, current_user.id)
+    if job is None:
+        abort(404)
+    return jsonify(_job_json(job))
+
+@docs_bp.route("/export/jobs/<string:job_id>/download")
+@login_required
+def export_job_download(job_id: str):
+    job = exports.get_job(job_id, current_user.id)
+    if job is None:
+        abort(404)
+    path = exports.job_path(job)
+    if path is None:
+        return jsonify(_job_json(job)), 409
+    return send_file(path, as_attachment=True, download_name=job["filename"],
+                     mimetype=exports.FORMATS[job["format"]][0])
 
 # Helpful: quick seed route (optional)
-@app.route("/seed")
+@docs_bp.route("/seed")
 def seed():
     example = r"""
 # Markdown + LaTeX Demo
@@ -477,9 +602,8 @@ def hello():
     return "world"```
 """
 
-from flask import make_response
 
-@app.route("/share/<int:doc_id>", methods=["POST"])
+@docs_bp.route("/share/<int:doc_id>", methods=["POST"])
 def create_share(doc_id: int):
     """Create a share link. POST form fields: can_edit=on/off."""
     can_edit = (request.form.get("can_edit") == "on")
@@ -495,14 +619,19 @@ def create_share(doc_id: int):
         if get_latest_version(doc_id, db) == 1:
             db.add(DocumentRevision(document_id=doc_id, version=1, content=d.content))
         db.commit()
-        link = url_for("open_shared", token=token, _external=True)
+        link = url_for("docs.open_shared", token=token, _external=True)
         flash(("Edit" if can_edit else "View") + " link created.", "ok")
         # Return the link as plain text (or redirect back to editor with flash)
         return make_response(link, 201)
 
-@app.route("/s/<string:token>")
+@docs_bp.route("/s/<string:token>")
 def open_shared(token: str):
-    """Open communal editor/viewer using a token room."""
+    """
+    Edit links open the communal editor. View-only links get a static page of
+    pre-rendered HTML (see rendered_html) that is the same for every reader,
+    so it is publicly cacheable; readers learn about new versions through the
+    lightweight watch room instead of joining the editor room.
+    """
     with SessionLocal() as db:
         s = get_share(token, db)
         if not s:
@@ -511,16 +640,39 @@ def open_shared(token: str):
         if not doc:
             abort(404)
         version = get_latest_version(doc.id, db)
-        # Render collaborative editor (view-only if can_edit=False)
-        return render_template("collab.html",
-                               token=token,
-                               can_edit=s.can_edit,
-                               doc_id=doc.id,
-                               title=doc.title,
-                               initial_content=doc.content,
-                               version=version)
-
-@app.route("/api/share/<string:token>", methods=["GET"])
+        if not s.can_edit:
+            etag, modified = doc_validators(doc, version, "view")
+            cached = not_modified(etag, modified, CACHE_SHARED_VIEW)
+            if cached is not None:
+                return cached
+            try:
+                body_html = rendered_html(doc, version, db)
+            except RenderTooLarge:
+                abort(413)
+            except RenderError:
+                abort(503)
+            resp = make_response(render_template("share_view.html",
+                                                 token=token,
+                                                 title=doc.title,
+                                                 body_html=body_html,
+                                                 version=version,
+                                                 updated_at=doc.updated_at))
+            return with_validators(resp, etag, modified, CACHE_SHARED_VIEW)
+
+        etag, modified = doc_validators(doc, version, f"edit:{current_user.get_id()}")
+        cached = not_modified(etag, modified, CACHE_PRIVATE)
+        if cached is not None:
+            return cached
+        resp = make_response(render_template("collab.html",
+                                             token=token,
+                                             can_edit=s.can_edit,
+                                             doc_id=doc.id,
+                                             title=doc.title,
+                                             initial_content=doc.content,
+                                             version=version))
+        return with_validators(resp, etag, modified, CACHE_PRIVATE)
+
+@docs_bp.route("/api/share/<string:token>", methods=["GET"])
 def api_share_state(token: str):
     """Return the latest content + version for resync."""
     with SessionLocal() as db:
@@ -531,17 +683,27 @@ def api_share_state(token: str):
         if not doc:
             abort(404)
         version = get_latest_version(doc.id, db)
-        return jsonify({
+        # resyncing clients revalidate every time; unchanged state costs a 304
+        etag, modified = doc_validators(doc, version, f"state:{s.can_edit}")
+        cached = not_modified(etag, modified, "no-cache")
+        if cached is not None:
+            return cached
+        resp = jsonify({
             "title": doc.title,
             "content": doc.content,
             "version": version,
             "can_edit": s.can_edit,
             "doc_id": doc.id
         })
+        return with_validators(resp, etag, modified, "no-cache")
 # In-memory presence map: {room_token: {sid: username}}
 presence: dict[str, dict[str, str]] = {}
+metrics.Collected("socketio_rooms", "Share rooms with at least one member.", [],
+                  lambda: {(): sum(1 for users in presence.values() if users)})
+metrics.Collected("socketio_room_members", "Members across all share rooms.", [],
+                  lambda: {(): sum(len(users) for users in presence.values())})
 
-@app.route("/render", methods=["GET", "POST"])
+@docs_bp.route("/render", methods=["GET", "POST"])
 def render_index():
     if request.method == "POST":
         uploaded_file = request.files.get("file")
@@ -550,14 +712,19 @@ def render_index():
             filepath = f"uploads/{uploaded_file.filename}"
             uploaded_file.save(filepath)
             flash("File uploaded successfully!", "success")
-            return redirect(url_for("render_index"))
+            return redirect(url_for("docs.render_index"))
     return render_template("index_render.html")
 
 ###################
 ## Socket.IO Logic
 ###################
 
+@socketio.on("connect")
+def ws_connect(auth=None):
+    metrics.SOCKET_CONNECTIONS.inc()
+
 @socketio.on("join")
+@metrics.track_event
 def ws_join(data):
     token = (data or {}).get("token")
     username = (data or {}).get("username") or (current_user.username if current_user.is_authenticated else "guest")
@@ -568,7 +735,20 @@ def ws_join(data):
     emit("presence", {"users": list(presence[token].values())}, to=token)
 
 
+@socketio.on("watch")
+@metrics.track_event
+def ws_watch(data):
+    """Read-only viewers: join the document's watch room (no presence, cursors or content)."""
+    token = (data or {}).get("token")
+    if not token:
+        return
+    with SessionLocal() as db:
+        s = get_share(token, db)
+    if s:
+        join_room(watch_room(s.document_id))
+
 @socketio.on("leave")
+@metrics.track_event
 def ws_leave(data):
     token = (data or {}).get("token")
     if token:
@@ -578,7 +758,9 @@ def ws_leave(data):
         emit("presence", {"users": list(presence[token].values())}, to=token)
 
 @socketio.on("disconnect")
+@metrics.track_event
 def ws_disconnect():
+    metrics.SOCKET_CONNECTIONS.dec()
     # remove from any room presence
     for token, users in list(presence.items()):
         if request.sid in users:
@@ -586,6 +768,7 @@ def ws_disconnect():
             emit("presence", {"users": list(users.values())}, to=token)
 
 @socketio.on("cursor")
+@metrics.track_event
 def ws_cursor(data):
     """
     data: { token, index, username }
@@ -600,6 +783,7 @@ def ws_cursor(data):
     }, to=token, include_self=False)
 
 @socketio.on("edit")
+@metrics.track_event
 def ws_edit(data):
     """
     data: { token, content, base_version, username }
@@ -613,7 +797,7 @@ def ws_edit(data):
     if not token:
         return
 
-    with SessionLocal() as db, save_lock:
+    with SessionLocal() as db, metrics.waited(save_lock, "save_lock"):
         s = get_share(token, db)
         if not s:
             emit("error", {"message": "Invalid share token."})
@@ -639,6 +823,7 @@ def ws_edit(data):
 
         # Accept edit -> create new revision
         new_version = create_revision(doc, new_content, db)
+        notify_watchers(doc, new_version)
 
         # Broadcast to room (including the editor to unify state)
         emit("content", {
@@ -646,13 +831,201 @@ def ws_edit(data):
             "version": new_version,
             "editor": (data or {}).get("username") or "guest",
         }, to=token)
+        doc_id = doc.id
+
+    # render once, outside save_lock, and share the result with the whole room
+    emit_preview(doc_id, new_version, new_content, to=token)
+
+@socketio.on("preview")
+@metrics.track_event
+def ws_preview(data):
+    """
+    data: { token }. Sends the sender the rendered HTML of the room's current
+    version (on join and after a resync); edits push previews to the room.
+    """
+    token = (data or {}).get("token")
+    if not token:
+        return
+    with SessionLocal() as db:
+        s = get_share(token, db)
+        doc = db.get(Document, s.document_id) if s else None
+        if not doc:
+            emit("error", {"message": "Invalid share token."})
+            return
+        version = get_latest_version(doc.id, db)
+    emit_preview(doc.id, version, doc.content)
+
 
+# -----------------------------
+# Workspace archive (format + organizer/citation sections in workspace.py)
+# -----------------------------
+def _workspace_sections(user_id: int, history: bool):
+    """Document sections, each read with yield_per while the archive streams."""
+    owned = select(Document.id).where(Document.owner_id == user_id)
+
+    def rows(stmt, exclude=()):
+        with SessionLocal() as db:
+            for obj in db.scalars(stmt.execution_options(yield_per=workspace.BATCH)):
+                yield workspace.to_row(obj, exclude)
+
+    sections = [("documents", rows(select(Document).where(Document.owner_id == user_id)
+                                   .order_by(Document.id), ("owner_id",)))]
+    if history:
+        sections.append(("revisions", rows(select(DocumentRevision).where(DocumentRevision.document_id.in_(owned))
+                                           .order_by(DocumentRevision.id))))
+    sections.append(("shares", rows(select(SharedLink).where(SharedLink.document_id.in_(owned))
+                                    .order_by(SharedLink.id), ("owner_id",))))
+    return sections + workspace.user_sections(user_id)
+
+def export_workspace(user: User, history: bool = False):
+    """Iterator over the bytes of the user's workspace archive."""
+    manifest = {"user": {"username": user.username, "email": user.email},
+                "exported_at": datetime.utcnow().isoformat(), "history": history}
+    return workspace.stream_archive(manifest, _workspace_sections(user.id, history))
+
+def import_workspace(fileobj, user_id: int) -> dict:
+    """
+    Load an archive into `user_id`'s workspace as new rows (ids are remapped).
+    Documents and the organizer/citations live in different databases, so the
+    two halves commit separately. Returns per-section counts.
+    """
+    zf, _ = workspace.open_archive(fileobj)
+    counts = {"documents": 0, "revisions": 0, "shares": 0}
+    with SessionLocal() as db:
+        doc_ids = {}
+        for batch in workspace.batches(workspace.read_section(zf, "documents")):
+            values = [dict(workspace.from_row(Document, r), owner_id=user_id) for r in batch]
+            stmt = insert(Document).returning(Document.id, sort_by_parameter_order=True)
+            doc_ids.update(zip((r["id"] for r in batch), db.scalars(stmt, values).all()))
+            counts["documents"] += len(batch)
+        for batch in workspace.batches(workspace.read_section(zf, "revisions")):
+            values = [dict(workspace.from_row(DocumentRevision, r), document_id=doc_ids[r["document_id"]])
+                      for r in batch if r.get("document_id") in doc_ids]
+            if values:
+                db.execute(insert(DocumentRevision), values)
+            counts["revisions"] += len(values)
+        for batch in workspace.batches(workspace.read_section(zf, "shares")):
+            values = [dict(workspace.from_row(SharedLink, r), document_id=doc_ids[r["document_id"]], owner_id=user_id)
+                      for r in batch if r.get("document_id") in doc_ids]
+            if values:
+                # a token that already exists here (re-import) keeps pointing at its document
+                stmt = sqlite_insert(SharedLink).on_conflict_do_nothing(index_elements=["token"])
+                result = db.connection().execute(stmt, values)
+                counts["shares"] += result.rowcount  # skipped tokens are not imported
+        db.commit()
+    counts.update(workspace.import_user_sections(zf, user_id))
+    return counts
+
+@docs_bp.route("/workspace/export")
+@login_required
+def workspace_export():
+    """Stream the whole workspace as a zip; ?history=1 adds every revision."""
+    history = request.args.get("history") == "1"
+    with SessionLocal() as db:
+        user = db.get(User, current_user.id)
+    filename = f"workspace-{user.username}-{datetime.utcnow():%Y%m%d}.zip"
+    return Response(stream_with_context(export_workspace(user, history)), mimetype="application/zip",
+                    headers={"Content-Disposition": f'attachment; filename="{filename}"'})
+
+@docs_bp.route("/workspace/import", methods=["POST"])
+@login_required
+def workspace_import():
+    f = request.files.get("archive")
+    if not f:
+        return jsonify({"error": "upload the archive as 'archive'"}), 400
+    try:
+        counts = import_workspace(f.stream, current_user.id)
+    except ValueError as ex:
+        return jsonify({"error": str(ex)}), 400
+    return jsonify({"ok": True, "imported": counts})
+
+def _cli_user(ident: str) -> User:
+    with SessionLocal() as db:
+        u = db.execute(select(User).where((User.username == ident) | (User.email == ident.lower()))).scalar()
+        if u is None and ident.isdigit():
+            u = db.get(User, int(ident))
+    if u is None:
+        raise click.ClickException(f"no user {ident!r}")
+    return u
+
+@click.command("workspace-export")
+@click.argument("user")
+@click.option("-o", "--output", type=click.Path(dir_okay=False, writable=True), required=True)
+@click.option("--history", is_flag=True, help="Include every document revision.")
+@with_appcontext
+def workspace_export_command(user, output, history):
+    """Write USER's (id, username or email) workspace archive to a file."""
+    u = _cli_user(user)
+    with open(output, "wb") as out:
+        for chunk in export_workspace(u, history):
+            out.write(chunk)
+    click.echo(f"Exported {u.username} to {output}")
+
+@click.command("workspace-import")
+@click.argument("user")
+@click.argument("archive", type=click.Path(exists=True, dir_okay=False))
+@with_appcontext
+def workspace_import_command(user, archive):
+    """Load a workspace archive into USER's workspace."""
+    u = _cli_user(user)
+    with open(archive, "rb") as f:
+        try:
+            counts = import_workspace(f, u.id)
+        except ValueError as ex:
+            raise click.ClickException(str(ex))
+    click.echo(", ".join(f"{k}: {v}" for k, v in counts.items()))
+
+# -----------------------------
+# Flask
+# -----------------------------
+def create_app(config: Optional[dict] = None) -> Flask:
+    """
+    Build and configure the app. Heavy optional integrations (authlib, Google
+    and GitHub clients, pypdf, markdown) are imported on first use, and
+    schema work runs in `flask migrate-schema` instead of on every import;
+    set AUTO_MIGRATE=1 (or config AUTO_MIGRATE) to migrate at startup.
+    """
+    app = Flask(__name__)
+    app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite:///nmbc.sqlite3"
+    app.config["SECRET_KEY"] = os.urandom(10).hex()
+    # app.config["SERVER_NAME"] = "127.0.0.1:90"  # or "localhost:5000"
+    app.config["AUTO_MIGRATE"] = os.getenv("AUTO_MIGRATE") == "1"
+    app.config["METRICS_TOKEN"] = os.getenv("METRICS_TOKEN")  # bearer token for /metrics; open if unset
+    app.config["SQL_PROFILE"] = os.getenv("SQL_PROFILE") == "1"  # per-request SQL profiles, /_sqlprofile
+    app.config.update(config or {})
+
+    db.init_app(app)
+    metrics.init_app(app)
+    sqlprofile.init_app(app)
+    login_manager.init_app(app)
+    login_manager.login_view = "docs.login"
+    # force threading; avoids eventlet/gevent import
+    socketio.init_app(app, cors_allowed_origins="*", async_mode="threading")
+
+    app.register_blueprint(docs_bp)
+    app.register_blueprint(biblio, url_prefix="/bib")
+    app.register_blueprint(organizer_bp)
+    app.register_blueprint(integrations_bp)
+    # app.register_blueprint(biblio_bp)
+    app.cli.add_command(migrate_schema_command)
+    app.cli.add_command(workspace_export_command)
+    app.cli.add_command(workspace_import_command)
+
+    if app.config["AUTO_MIGRATE"]:
+        with app.app_context():
+            migrate_schema()
+    return app
+
+app = create_app()
 
 if __name__ == "__main__":
+    with app.app_context():
+        migrate_schema()
     # Prefer eventlet for WebSocket support
     # try:
         # import eventlet
         # eventlet.monkey_patch()
+    start_sync_worker(app)
     socketio.run(app, host="0.0.0.0", port=90, allow_unsafe_werkzeug=True)#, debug=True)
     # except Exception:
         # Fallback (long-polling may be used)
@@ -0,0 +1,61 @@
+"""
+parse_bibtex and the /bib/biblio/import route on generated .bib files of
+1k-100k entries. Imports run against a fresh isolated database per size;
+the second import of the same file measures the all-conflicts (update) path.
+"""
+import io
+import random
+import time
+
+from common import isolated_app, login, measure
+
+SIZES = [1_000, 10_000, 100_000]
+
+def synthetic_bib(n: int, seed: int = 0) -> str:
+    rnd = random.Random(seed)
+    surnames = ["Smith", "Nguyen", "Garcia", "Müller", "Okafor", "Tanaka", "Rossi", "Kowalski"]
+    out = []
+    for i in range(n):
+        a, b = rnd.sample(surnames, 2)
+        year = 1990 + i % 35
+        doi = f"  doi = {{10.{1000 + i % 9000}/bench.{i}}},\n" if i % 3 else ""
+        out.append(
+            f"@article{{{a.lower()}{year}_{i},\n"
+            f"  title = {{A study of item {i} in {rnd.choice(['graphs', 'proteins', 'markets', 'compilers'])}}},\n"
+            f"  author = {{{a}, J. and {b}, K.}},\n"
+            f"  journal = {{Journal of Benchmarks}},\n"
+            f"  year = {{{year}}},\n"
+            f"{doi}"
+            f"  url = {{https://example.org/{i}}},\n"
+            f"}}\n"
+        )
+    return "\n".join(out)
+
+def run(quick=False):
+    from biblio import parse_bibtex
+    sizes = SIZES[:1] if quick else SIZES
+    results = {}
+    for n in sizes:
+        text = synthetic_bib(n)
+        r = measure(lambda: parse_bibtex(text), repeat=1 if n >= 100_000 else 3)
+        r["entries"] = n
+        r["entries_per_s"] = round(n / (r["median_ms"] / 1000))
+        results[f"parse_bibtex_{n // 1000}k"] = r
+
+    for n in sizes:
+        data = synthetic_bib(n).encode("utf-8")
+        with isolated_app() as app:
+            client, _ = login(app)
+            for phase in ("insert", "reimport"):
+                start = time.perf_counter()
+                resp = client.post("/bib/biblio/import", content_type="multipart/form-data",
+                                   data={"bibfile": (io.BytesIO(data), "bench.bib"), "on_conflict": "update"})
+                elapsed = time.perf_counter() - start
+                assert resp.status_code in (200, 302), resp.status_code
+                results[f"import_bib_{n // 1000}k_{phase}"] = {
+                    "entries": n, "ms": round(elapsed * 1000, 1), "entries_per_s": round(n / elapsed)}
+    return results
+
+if __name__ == "__main__":
+    import json
+    print(json.dumps(run(), indent=2))
@@ -0,0 +1,68 @@
+"""
+Socket.IO load on the collab handlers: N share rooms x M clients, driven
+through Flask-SocketIO's in-process test client (no network). Every client
+joins its room; then each round, one client per room sends an edit against
+the current version and every other client sends a cursor update. Reports
+per-event handling latency and overall events/second.
+"""
+import time
+
+from common import isolated_app, login, stats
+
+def run(quick=False, rooms=None, clients=None, rounds=None):
+    rooms = rooms or (5 if quick else 20)
+    clients = clients or (4 if quick else 10)
+    rounds = rounds or (5 if quick else 20)
+    from app import socketio
+
+    with isolated_app() as app:
+        http, _ = login(app)
+        tokens = []
+        for r in range(rooms):
+            http.post("/new", data={"title": f"room {r}", "content": "# start\n"})
+        for doc_id in range(1, rooms + 1):
+            link = http.post(f"/share/{doc_id}", data={"can_edit": "on"}).get_data(as_text=True)
+            tokens.append(link.rsplit("/", 1)[-1])
+
+        timings = {"join": [], "edit": [], "cursor": []}
+
+        def timed(event, sc, payload):
+            start = time.perf_counter()
+            sc.emit(event, payload)
+            timings[event].append(time.perf_counter() - start)
+
+        conns = []
+        for token in tokens:
+            members = [socketio.test_client(app, flask_test_client=http) for _ in range(clients)]
+            for i, sc in enumerate(members):
+                timed("join", sc, {"token": token, "username": f"user{i}"})
+            conns.append((token, members))
+
+        versions = {token: 1 for token in tokens}
+        started = time.perf_counter()
+        events = 0
+        for rnd in range(rounds):
+            for token, members in conns:
+                editor = members[rnd % len(members)]
+                timed("edit", editor, {"token": token, "content": f"# start\n\nround {rnd}\n",
+                                       "base_version": versions[token], "username": "editor"})
+                versions[token] += 1
+                events += 1
+                for i, sc in enumerate(members):
+                    if sc is not editor:
+                        timed("cursor", sc, {"token": token, "index": rnd * 3 + i, "username": f"user{i}"})
+                        events += 1
+        elapsed = time.perf_counter() - started
+        for _, members in conns:
+            for sc in members:
+                sc.get_received()
+                sc.disconnect()
+
+    results = {f"socketio_{event}": stats(samples) for event, samples in timings.items() if samples}
+    results["socketio_load"] = {"rooms": rooms, "clients_per_room": clients, "rounds": rounds,
+                                "events": events, "events_per_s": round(events / elapsed, 1)}
+    return results
+
+if __name__ == "__main__":
+    import json
+    print(json.dumps(run(), indent=2))
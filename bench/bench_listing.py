@@ -0,0 +1,63 @@
+"""
+Listing and search latency on seeded databases: the document index, the
+bibliography list and its substring search, and the organizer task list.
+"""
+import random
+from datetime import datetime, timedelta
+
+from common import isolated_app, login, measure
+
+def seed(user_id, docs, entries, tasks, seed=0):
+    from app import SessionLocal, Document
+    from biblio import BibEntry, make_fingerprint
+    from extensions import db
+    from organizer import Project, Task
+
+    rnd = random.Random(seed)
+    now = datetime.utcnow()
+    with SessionLocal() as s:
+        s.execute(Document.__table__.insert(), [
+            {"title": f"Note {i}", "content": f"# Note {i}\n\n" + "text " * 200, "owner_id": user_id,
+             "created_at": now, "updated_at": now - timedelta(minutes=i)}
+            for i in range(docs)])
+        s.commit()
+    db.session.execute(BibEntry.__table__.insert(), [
+        {"key": f"key{i}", "title": f"On {rnd.choice(['graphs', 'proteins', 'markets'])} number {i}",
+         "authors": "Smith, J.; Doe, A.", "venue": "Journal", "year": 1990 + i % 35,
+         "fingerprint": make_fingerprint(f"On number {i}", "Smith, J.", 1990 + i % 35),
+         "created_at": now, "updated_at": now}
+        for i in range(entries)])
+    projects = [Project(owner_id=user_id, name=f"Project {p}") for p in range(10)]
+    db.session.add_all(projects)
+    db.session.flush()
+    db.session.execute(Task.__table__.insert(), [
+        {"owner_id": user_id, "project_id": projects[i % 10].id, "title": f"Task {i}",
+         "priority": 1 + i % 3, "status": ("todo", "doing", "done")[i % 3],
+         "due_date": now + timedelta(hours=i % 300), "created_at": now, "updated_at": now}
+        for i in range(tasks)])
+    db.session.commit()
+
+def run(quick=False):
+    docs, entries, tasks = (500, 1_000, 1_000) if quick else (5_000, 20_000, 10_000)
+    results = {}
+    with isolated_app() as app:
+        client, user_id = login(app)
+        seed(user_id, docs, entries, tasks)
+        pages = {
+            "list_documents": "/",
+            "list_bib_entries": "/bib/biblio",
+            "search_bib_entries": "/bib/biblio?q=proteins",
+            "list_organizer_tasks": "/organizer",
+        }
+        for name, url in pages.items():
+            def get(url=url):
+                resp = client.get(url)
+                assert resp.status_code == 200, (url, resp.status_code)
+            results[name] = dict(measure(get, repeat=3 if not quick else 2), rows={
+                "list_documents": docs, "list_bib_entries": entries,
+                "search_bib_entries": entries, "list_organizer_tasks": tasks}[name])
+    return results
+
+if __name__ == "__main__":
+    import json
+    print(json.dumps(run(), indent=2))
@@ -0,0 +1,82 @@
+"""
+render_markdown throughput on synthetic documents (headings, paragraphs with
+inline math, tables, fenced code, lists, display math) from 1 KB to 1 MB, and
+preview re-renders of a note with many code listings where one block changes
+per keystroke (highlighted blocks come from the cache) against a cold cache.
+"""
+import random
+
+from common import measure
+
+SIZES = [1_000, 10_000, 100_000, 1_000_000]
+
+def synthetic_markdown(size: int, seed: int = 0) -> str:
+    """Deterministic Markdown of roughly `size` bytes mixing every construct the editor sees."""
+    rnd = random.Random(seed)
+    words = ("lorem ipsum dolor sit amet consectetur adipiscing elit sed do eiusmod tempor "
+             "incididunt ut labore et dolore magna aliqua matrix vector integral").split()
+    sentence = lambda n: " ".join(rnd.choice(words) for _ in range(n))
+    blocks = [
+        lambda i: f"## Section {i}\n\n{sentence(40)} with $x_{i}^2 + y = {i}$ inline.\n",
+        lambda i: "| a | b | c |\n|---|---|---|\n" + "".join(f"| {i} | {sentence(2)} | {i * 3} |\n" for _ in range(6)),
+        lambda i: f"```python\ndef f{i}(x):\n    return [v * {i} for v in range(x)]\n```\n",
+        lambda i: "".join(f"- {sentence(6)}\n" for _ in range(5)),
+        lambda i: f"$$\n\\int_0^{{{i}}} e^{{-t^2}} dt = \\frac{{\\sqrt\\pi}}{{2}}\n$$\n",
+        lambda i: f"> {sentence(20)} [link](https://example.com/{i}) and `code {i}`.\n",
+    ]
+    parts, total, i = [], 0, 0
+    while total < size:
+        block = blocks[i % len(blocks)](i) + "\n"
+        parts.append(block)
+        total += len(block)
+        i += 1
+    return "".join(parts)[:size]
+
+def code_listings(n: int, seed: int = 0) -> str:
+    """A note with `n` fenced listings in a few languages, prose in between."""
+    rnd = random.Random(seed)
+    listings = [
+        ("python", "def handler_{i}(request):\n    data = request.json or {{}}\n"
+                   "    return {{\"id\": {i}, \"ok\": bool(data)}}  # reply\n"),
+        ("javascript", "async function load{i}(id) {{\n  const res = await fetch(`/api/${{id}}`);\n"
+                       "  return res.ok ? res.json() : null;\n}}\n"),
+        ("sql", "SELECT id, title FROM documents\nWHERE owner_id = {i} AND updated_at > :since\n"
+                "ORDER BY updated_at DESC LIMIT 50;\n"),
+        ("bash", "for f in notes/*.md; do\n  grep -c 'TODO {i}' \"$f\" || true\ndone\n"),
+    ]
+    parts = []
+    for i in range(n):
+        lang, body = rnd.choice(listings)
+        parts.append(f"### Listing {i}\n\nSee below.\n\n```{lang}\n{body.format(i=i) * 6}```\n")
+    return "\n".join(parts)
+
+def run(quick=False):
+    import highlight
+    from rendering import render_markdown
+    results = {}
+    for size in SIZES[:3] if quick else SIZES:
+        text = synthetic_markdown(size)
+        repeat = 1 if size >= 1_000_000 else (3 if size >= 100_000 else 10)
+        r = measure(lambda: render_markdown(text), repeat=repeat)
+        r["bytes"] = len(text)
+        r["mb_per_s"] = round(len(text) / 1e6 / (r["median_ms"] / 1000), 3)
+        results[f"render_markdown_{size // 1000}kb"] = r
+
+    listings = 20 if quick else 60
+    text = code_listings(listings)
+    def cold():
+        highlight._cache.clear()
+        render_markdown(text)
+    edits = iter(range(10**9))
+    def one_block_edited():
+        render_markdown(text.replace("See below.", f"See below ({next(edits)}).", 1)
+                        .replace("ORDER BY", f"ORDER BY {next(edits)},", 1))
+    for name, fn in (("cold_cache", cold), ("one_block_edited", one_block_edited)):
+        r = measure(fn, repeat=5)
+        r["listings"] = listings
+        results[f"render_code_listings_{name}"] = r
+    return results
+
+if __name__ == "__main__":
+    import json
+    print(json.dumps(run(), indent=2))
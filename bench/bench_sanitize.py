@@ -0,0 +1,35 @@
+"""
+HTML sanitizing cost on rendered synthetic documents: the in-pipeline
+sanitizer.py pass against the bleach.clean() reparse it replaced (skipped
+when bleach is not installed), plus end-to-end render_markdown.
+"""
+from common import measure
+from bench_render import SIZES, synthetic_markdown
+
+def run(quick=False):
+    import markdown
+    import rendering
+    try:
+        import bleach
+    except ImportError:
+        bleach = None
+
+    results = {}
+    for size in SIZES[:3] if quick else SIZES:
+        text = synthetic_markdown(size)
+        html = markdown.markdown(text, extensions=rendering.MD_EXTS, output_format="html5")
+        repeat = 1 if size >= 1_000_000 else (3 if size >= 100_000 else 10)
+        kb = size // 1000
+        ours = measure(lambda: rendering._sanitizer.clean(html), repeat=repeat)
+        results[f"sanitize_{kb}kb"] = dict(ours, bytes=len(html))
+        if bleach is not None:
+            ref = measure(lambda: bleach.clean(html, tags=rendering.ALLOWED_TAGS, attributes=rendering.ALLOWED_ATTRS,
+                                               protocols=rendering.ALLOWED_PROTOCOLS, strip=True), repeat=repeat)
+            results[f"bleach_clean_{kb}kb"] = dict(ref, bytes=len(html))
+            results[f"sanitize_{kb}kb"]["speedup_vs_bleach"] = round(ref["median_ms"] / ours["median_ms"], 1)
+        results[f"render_markdown_{kb}kb"] = measure(lambda: rendering.render_markdown(text), repeat=repeat)
+    return results
+
+if __name__ == "__main__":
+    import json
+    print(json.dumps(run(), indent=2))
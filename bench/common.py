@@ -0,0 +1,115 @@
+"""
+Shared helpers for the benchmark scripts: timing stats, an isolated app
+(temporary working directory and databases, so a run never touches real
+data), and JSON result files.
+"""
+import json
+import os
+import platform
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(ROOT, "bench", "results")
+
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+def stats(samples):
+    """Summary of a list of durations in seconds (reported in ms)."""
+    ordered = sorted(samples)
+    p95 = ordered[min(len(ordered) - 1, int(round(0.95 * (len(ordered) - 1))))]
+    return {
+        "runs": len(ordered),
+        "min_ms": round(ordered[0] * 1000, 3),
+        "median_ms": round(statistics.median(ordered) * 1000, 3),
+        "mean_ms": round(statistics.fmean(ordered) * 1000, 3),
+        "p95_ms": round(p95 * 1000, 3),
+    }
+
+def measure(fn, repeat=5, warmup=1):
+    """Call fn() warmup + repeat times; stats over the timed calls."""
+    for _ in range(warmup):
+        fn()
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return stats(samples)
+
+@contextmanager
+def isolated_app():
+    """
+    Yield a migrated app whose two databases and upload/export folders live in
+    a temporary directory; the repo's own databases are never opened.
+    """
+    import app as app_module
+    from sqlalchemy import create_engine
+    from extensions import db
+
+    cwd = os.getcwd()
+    original_engine = app_module.engine
+    with tempfile.TemporaryDirectory(prefix="notes-bench-") as tmp:
+        os.chdir(tmp)
+        engine = create_engine(f"sqlite:///{os.path.join(tmp, 'docs.sqlite3')}", future=True)
+        app_module.engine = engine
+        app_module.SessionLocal.configure(bind=engine)
+        try:
+            app = app_module.create_app({
+                "SQLALCHEMY_DATABASE_URI": f"sqlite:///{os.path.join(tmp, 'nmbc.sqlite3')}",
+                "TESTING": True,
+            })
+            with app.app_context():
+                app_module.migrate_schema()
+                try:
+                    yield app
+                finally:
+                    db.session.remove()
+                    db.engine.dispose()
+        finally:
+            engine.dispose()
+            app_module.engine = original_engine
+            app_module.SessionLocal.configure(bind=original_engine)
+            os.chdir(cwd)
+
+def login(app, name="bench"):
+    """Test client logged in as a fresh user `name`; returns (client, user id)."""
+    from app import SessionLocal, User
+    client = app.test_client()
+    client.post("/register", data={"email": f"{name}@bench.local", "username": name, "password": "pw"})
+    client.post("/login", data={"id": name, "password": "pw"})
+    with SessionLocal() as s:
+        user_id = s.query(User.id).filter(User.username == name).scalar()
+    return client, user_id
+
+def environment():
+    try:
+        rev = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+                             capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        rev = None
+    return {
+        "git_rev": rev,
+        "python": platform.python_version(),
+        "sqlite": sqlite3.sqlite_version,
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+
+def write_results(results, path=None):
+    """Write {"env": ..., "results": ...} to `path` (default bench/results/<time>-<rev>.json)."""
+    env = environment()
+    if path is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        stamp = env["timestamp"].replace(":", "").replace("-", "")
+        path = os.path.join(RESULTS_DIR, f"{stamp}-{env['git_rev'] or 'norev'}.json")
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"env": env, "results": results}, f, indent=2)
+    return path
@@ -0,0 +1,80 @@
+"""
+Import-time guard for app.py.
+
+Runs `python -X importtime -c "import app"` in a fresh interpreter from an
+empty working directory, and fails (exit 1) when:
+  * a module that should load lazily (markdown, bleach, pygments, authlib,
+    pypdf, the Google/GitHub clients, alembic) is imported by `import app`,
+  * importing creates files (databases, upload folders),
+  * the cumulative import time of `app` exceeds --budget-ms.
+
+    python bench/import_time.py [--budget-ms 1500] [--runs 3] [--json]
+"""
+import argparse
+import json
+import os
+import re
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+LAZY_MODULES = ["markdown", "bleach", "pygments", "authlib", "pypdf", "googleapiclient", "github", "alembic", "flask_migrate"]
+LINE_RE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|(\s*)(\S+)$")
+
+def measure():
+    """One cold import. Returns {"total_ms", "modules": {name: cumulative_us}, "created": [...]}."""
+    with tempfile.TemporaryDirectory() as cwd:
+        code = f"import sys; sys.path.insert(0, {ROOT!r}); import app"
+        proc = subprocess.run([sys.executable, "-X", "importtime", "-c", code],
+                              cwd=cwd, capture_output=True, text=True)
+        if proc.returncode != 0:
+            raise RuntimeError(proc.stderr[-2000:])
+        created = sorted(os.listdir(cwd))
+    modules = {}
+    for line in proc.stderr.splitlines():
+        m = LINE_RE.match(line)
+        if m:
+            modules[m.group(4)] = int(m.group(2))
+    return {"total_ms": modules.get("app", 0) / 1000, "modules": modules, "created": created}
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    ap.add_argument("--budget-ms", type=float, default=1500.0, help="max cumulative import time of app")
+    ap.add_argument("--runs", type=int, default=3, help="best of N cold imports")
+    ap.add_argument("--json", action="store_true", help="print a JSON report")
+    args = ap.parse_args()
+
+    runs = [measure() for _ in range(max(1, args.runs))]
+    best = min(runs, key=lambda r: r["total_ms"])
+    eager = [m for m in LAZY_MODULES if any(name == m or name.startswith(m + ".") for name in best["modules"])]
+    slowest = sorted(((us / 1000, name) for name, us in best["modules"].items() if "." not in name and name != "app"),
+                     reverse=True)[:10]
+    failures = []
+    if eager:
+        failures.append(f"imported eagerly: {', '.join(eager)}")
+    if best["created"]:
+        failures.append(f"import created files: {', '.join(best['created'])}")
+    if best["total_ms"] > args.budget_ms:
+        failures.append(f"import took {best['total_ms']:.0f} ms (budget {args.budget_ms:.0f} ms)")
+
+    report = {
+        "total_ms": round(best["total_ms"], 1),
+        "runs_ms": [round(r["total_ms"], 1) for r in runs],
+        "budget_ms": args.budget_ms,
+        "slowest_top_level": [{"module": n, "ms": round(ms, 1)} for ms, n in slowest],
+        "failures": failures,
+    }
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print(f"import app: {report['total_ms']} ms (best of {len(runs)}, budget {args.budget_ms:.0f} ms)")
+        for row in report["slowest_top_level"]:
+            print(f"  {row['ms']:8.1f} ms  {row['module']}")
+        for f in failures:
+            print(f"FAIL: {f}")
+    return 1 if failures else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
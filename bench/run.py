@@ -0,0 +1,73 @@
+"""
+Benchmark suite: markdown rendering and sanitizing, BibTeX parse/import,
+Socket.IO collab load, and listing/search pages. Runs locally with no
+network, against temporary databases, and writes one JSON file per run so
+results can be compared across commits.
+
+    python bench/run.py                        # everything -> bench/results/<time>-<rev>.json
+    python bench/run.py render biblio --quick  # a subset, smaller inputs
+    python bench/run.py --out base.json
+    python bench/run.py --compare base.json    # also print ratios against an earlier run
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from common import write_results  # noqa: E402
+
+SUITES = ["render", "sanitize", "biblio", "collab", "listing"]
+
+def _load(name):
+    return __import__(f"bench_{name}")
+
+def _headline(row: dict):
+    for key in ("median_ms", "ms"):
+        if key in row:
+            return key, row[key]
+    for key in ("events_per_s",):
+        if key in row:
+            return key, row[key]
+    return None, None
+
+def compare(results, baseline_path):
+    with open(baseline_path, encoding="utf-8") as f:
+        base = json.load(f)["results"]
+    print(f"\n{'benchmark':48} {'baseline':>12} {'now':>12} {'ratio':>8}")
+    for suite, rows in results.items():
+        for name, row in rows.items():
+            old = base.get(suite, {}).get(name)
+            key, now = _headline(row)
+            if old is None or key is None or key not in old:
+                continue
+            ratio = now / old[key] if old[key] else float("inf")
+            print(f"{suite + '.' + name + ' (' + key + ')':48} {old[key]:>12} {now:>12} {ratio:>8.2f}")
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    ap.add_argument("suites", nargs="*", choices=SUITES + [[]], help="default: all")
+    ap.add_argument("--quick", action="store_true", help="smaller inputs, fewer repeats")
+    ap.add_argument("--out", help="result file (default bench/results/<time>-<rev>.json)")
+    ap.add_argument("--compare", metavar="JSON", help="earlier result file to compare against")
+    args = ap.parse_args()
+
+    logging.disable(logging.WARNING)  # keep per-request log lines out of the report
+    results = {}
+    for name in args.suites or SUITES:
+        start = time.perf_counter()
+        print(f"running {name} ...", file=sys.stderr)
+        results[name] = _load(name).run(quick=args.quick)
+        print(f"  done in {time.perf_counter() - start:.1f} s", file=sys.stderr)
+    path = write_results(results, args.out)
+    print(json.dumps(results, indent=2))
+    print(f"\nwrote {path}", file=sys.stderr)
+    if args.compare:
+        compare(results, args.compare)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,164 @@
+"""
+Differential check of sanitizer.py against the bleach configuration it replaced.
+
+  * The allow-list must still equal bleach's defaults plus EXTRA_TAGS/EXTRA_ATTRS.
+  * For Markdown output (synthetic documents and a corpus of notes with raw
+    HTML, entities and links) the sanitizer must produce exactly what
+    bleach.clean(..., strip=True) produced.
+  * For malformed or hostile HTML the output may differ from bleach (no
+    html5lib tree fix-ups), but every tag, attribute and URL in it must be
+    on the allow-list, and it must contain no comments.
+
+Exits 1 on any failure. Needs bleach installed (it is not used at runtime).
+
+    python bench/sanitize_check.py [--seeds 20] [--fuzz 5000] [-v]
+"""
+import argparse
+import sys
+from html.parser import HTMLParser
+
+from common import ROOT  # noqa: F401  (puts the repo on sys.path)
+from bench_render import synthetic_markdown
+from highlight import highlight_code_blocks
+
+NOTES = [
+    "# Title\n\nSome *em* and **strong** and `code <b>`.\n",
+    "AT&T, &copy; 2024, &bogus; and &#169; &#xA9; & a < b > c \"quoted\" 'single'\n",
+    "[rel](/docs/1?a=1&b=2) [frag](#top) [mail](mailto:a@example.com) [ftp](ftp://x/y) "
+    "[js](javascript:alert(1)) [js2](JaVaScRiPt:alert(1)) [port](localhost:8080) <https://example.com/auto>\n",
+    '[title](https://example.com "a \\"quoted\\" <title> & more")\n',
+    "![img](https://example.com/x.png)\n",
+    "Inline <span class=\"hl\" style=\"color:red\" onclick=\"x()\">raw</span> and <kbd>kbd</kbd>.\n",
+    '<div class="note" id="n1">\nblock html\n</div>\n\nafter\n',
+    "<script>alert(1)</script>\n\n<style>p { color: red }</style>\n",
+    "<!-- a comment -->\n\ntext <!-- inline --> more\n",
+    '<a href="java&#x09;script:alert(1)">tab</a> <a href="  javascript:x">sp</a> '
+    '<a href="https://ok.example" target="_blank" rel="noopener">ok</a>\n',
+    "| a | b |\n|---|:-:|\n| `x|y` | <b>b</b> |\n| 1 | 2 |\n",
+    "```html\n<script>alert('x')</script>\n&amp; &lt;\n```\n",
+    "    indented <code> & stuff\n",
+    "!!! note \"Heads up\"\n    Admonition *body*.\n\n!!! danger\n    <em>raw</em>\n",
+    "[TOC]\n\n# One\n\n## Two & three\n",
+    "1. one\n2. two\n    * nested <i>i</i>\n\n- a\n- b\n",
+    "> quote with $x^2$ and $$\\int_0^1 f$$\n>\n> > nested\n",
+    "line one  \nline two\n\n---\n\n***\n",
+    "<p>explicit <abbr title=\"HyperText\">HTML</abbr> <acronym title=\"x\">X</acronym></p>\n",
+    "<A HREF=\"http://EXAMPLE.com\" TITLE=t>upper</A> <a title>bare</a> <a href=\"\">empty</a>\n",
+    "<h1 id=\"x\" class=\"y\">raw heading</h1>\n\n<pre class=\"c\"><code class=\"language-py\">x</code></pre>\n",
+    "emoji 🎉 and non-BMP 𝔘 and nbsp&nbsp;and &NotEqualTilde; and &amp\n",
+    "<table><thead><tr><th>h</th></tr></thead><tbody><tr><td>c</td></tr></tbody></table>\n",
+]
+
+MALFORMED = [
+    "<p>x</span></p></div><b><i>y</b></i>",
+    "<p><div>z</div></p>",
+    "<table><tr><td>a</td></tr>junk</table>",
+    "<ul><li>a<li>b</ul>",
+    "<img src=x onerror=alert(1)><iframe src=x>in</iframe><textarea><b>t</b></textarea>",
+    "<script>alert(\"<b>\")</script>",
+    "<![CDATA[x]]><?pi?><!DOCTYPE html>q</ x>",
+    "x<y and a<b>c</b> 3 < 4",
+    "<a href='javascript:alert(1)'>q</a><a href=javascript:alert(1)>u</a>",
+    "<a href=\"&#106;avascript:alert(1)\">ent</a><a href=\"java\0script:x\">nul</a>",
+    "<svg><a xlink:href=\"javascript:x\">s</a></svg><math><mi>x</mi></math>",
+    "<b onclick=x>b<!-- unterminated",
+    "<a href=\"https://x\"<b>>odd</a>",
+    "<span class=\"a\" class=\"b\">dup</span>",
+    "<<b>>double<</b>>",
+    "unterminated <b",
+    "<p><b x=1 y>unclosed bold</p>\n<p>next paragraph</p>",
+]
+
+def _config():
+    import bleach
+    import rendering
+    tags = bleach.sanitizer.ALLOWED_TAGS | rendering.EXTRA_TAGS
+    attrs = {**bleach.sanitizer.ALLOWED_ATTRIBUTES, **rendering.EXTRA_ATTRS}
+    return bleach, rendering, tags, attrs
+
+class _Audit(HTMLParser):
+    """Collects everything in `html` that the allow-list should have removed."""
+
+    def __init__(self, bleach, tags, attrs, protocols):
+        super().__init__(convert_charrefs=True)
+        self.tags, self.attrs, self.problems = tags, attrs, []
+        self._uri_ok = lambda v: bleach.sanitizer.BleachSanitizerFilter(
+            None, allowed_protocols=protocols).sanitize_uri_value(v, protocols) is not None
+
+    def handle_starttag(self, tag, attrs):
+        if tag not in self.tags:
+            self.problems.append(f"tag <{tag}>")
+        for name, value in attrs:
+            if name not in self.attrs.get(tag, ()):
+                self.problems.append(f"attribute {tag}.{name}")
+            elif name == "href" and not self._uri_ok(value or ""):
+                self.problems.append(f"href {value!r}")
+
+    def handle_comment(self, data):
+        self.problems.append("comment")
+
+FRAGMENTS = ["<", ">", "&", "/", "=", '"', "'", " ", "\n", "!--", "-->", "a", "b", "script", "span",
+             "href", "class", "onclick", "title", "javascript:", "http://x", "#", "&#106;", "&amp;", "&lt;",
+             "<a ", "<b>", "</b>", "<p>", "</a>", "<!", "<?", "x"]
+
+def _fuzz_inputs(n, seed=0):
+    import random
+    rnd = random.Random(seed)
+    return ["".join(rnd.choice(FRAGMENTS) for _ in range(rnd.randint(5, 40))) for _ in range(n)]
+
+def _markdown(text):
+    """Markdown output before sanitizing (what bleach used to receive)."""
+    import markdown
+    from rendering import MD_EXTS
+    return markdown.markdown(text, extensions=MD_EXTS, output_format="html5")
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    ap.add_argument("--seeds", type=int, default=20, help="synthetic documents per size")
+    ap.add_argument("--fuzz", type=int, default=5000, help="random tag soup inputs to audit")
+    ap.add_argument("-v", "--verbose", action="store_true", help="show malformed-input differences")
+    args = ap.parse_args()
+
+    bleach, rendering, tags, attrs = _config()
+    clean = lambda html: bleach.clean(html, tags=tags, attributes=attrs,
+                                      protocols=rendering.ALLOWED_PROTOCOLS, strip=True)
+    sanitizer = rendering._sanitizer
+    failures = []
+
+    if set(rendering.ALLOWED_TAGS) != set(tags) or \
+            {k: set(v) for k, v in rendering.ALLOWED_ATTRS.items()} != {k: set(v) for k, v in attrs.items()}:
+        failures.append("allow-list differs from bleach defaults + EXTRA_TAGS/EXTRA_ATTRS")
+
+    cases = [(f"note {i}", text) for i, text in enumerate(NOTES)]
+    cases += [(f"synthetic {size}b seed {seed}", synthetic_markdown(size, seed))
+              for size in (2_000, 20_000) for seed in range(args.seeds)]
+    for name, text in cases:
+        html = _markdown(text)
+        expected, got = clean(html).strip(), sanitizer.clean(html).strip()
+        if got != expected:
+            failures.append(f"{name}: output differs\n    bleach:    {expected[:300]!r}\n    sanitizer: {got[:300]!r}")
+        rendered = rendering.render_markdown(text)
+        if rendered != highlight_code_blocks(expected):
+            failures.append(f"{name}: render_markdown differs from markdown + bleach + highlighting")
+
+    differing = 0
+    for text in MALFORMED + _fuzz_inputs(args.fuzz):
+        got = sanitizer.clean(text)
+        audit = _Audit(bleach, tags, attrs, rendering.ALLOWED_PROTOCOLS)
+        audit.feed(got)
+        audit.close()
+        if audit.problems:
+            failures.append(f"unsafe output for {text!r}: {got!r} ({', '.join(audit.problems)})")
+        if got != clean(text):
+            differing += 1
+            if args.verbose and text in MALFORMED:
+                print(f"differs (allowed): {text!r}\n    bleach:    {clean(text)!r}\n    sanitizer: {got!r}")
+
+    print(f"{len(cases)} markdown cases compared with bleach, "
+          f"{len(MALFORMED) + args.fuzz} malformed inputs audited ({differing} differ from bleach, all within the allow-list)")
+    for f in failures:
+        print(f"FAIL: {f}")
+    return 1 if failures else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
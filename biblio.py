@@ -1,11 +1,15 @@
 # biblio.py
 # biblio.py
 from __future__ import annotations
-import os, re, json, datetime as dt
-from flask import Blueprint, render_template, request, redirect, url_for, flash, send_from_directory, abort
+import os, re, json, hashlib, datetime as dt
+import click
+from flask import Blueprint, render_template, request, redirect, url_for, flash, send_file, send_from_directory, abort, current_app
 from werkzeug.utils import secure_filename
-from sqlalchemy import or_
+from sqlalchemy import or_, event
+from sqlalchemy.exc import IntegrityError
 from extensions import db   # ← IMPORTANT: no import from app
+import blobstore
+import fulltext
 from datetime import datetime
 from flask_sqlalchemy import SQLAlchemy
 from sqlalchemy import Index, UniqueConstraint
@@ -13,8 +17,7 @@ from sqlalchemy.dialects.sqlite import JSON as SQLITE_JSON
 
 biblio = Blueprint("biblio", __name__, template_folder="templates")
 
-UPLOAD_DIR = os.path.join(os.getcwd(), "uploads", "papers")
-os.makedirs(UPLOAD_DIR, exist_ok=True)
+UPLOAD_DIR = os.path.join(os.getcwd(), "uploads", "papers")  # created on first upload (blobstore)
 
 class BibEntry(db.Model):
     __tablename__ = "bib_entries"
@@ -24,11 +27,12 @@ class BibEntry(db.Model):
     authors = db.Column(db.Text, nullable=False)
     venue = db.Column(db.String(512))
     year = db.Column(db.Integer)
-    doi = db.Column(db.String(256))
+    doi = db.Column(db.String(256), index=True)
     url = db.Column(db.String(1024))
     abstract = db.Column(db.Text)
     tags = db.Column(db.String(512))
-    file_path = db.Column(db.String(1024))
+    file_path = db.Column(db.String(1024), index=True)  # blobstore path, shared by duplicates
+    fingerprint = db.Column(db.String(40), index=True)  # see make_fingerprint()
     created_at = db.Column(db.DateTime, default=dt.datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=dt.datetime.utcnow, onupdate=dt.datetime.utcnow)
 
@@ -48,6 +52,7 @@ class Citation(db.Model):
     # Store a full raw blob for lossless export (BibTeX/CSL/RIS) and easy rebuilds:
     raw = db.Column(db.Text, nullable=True)                       # original BibTeX/RIS/etc. text
     csl_json = db.Column(SQLITE_JSON, nullable=True)              # normalized CSL-JSON if you have it
+    fingerprint = db.Column(db.String(40), nullable=True)         # see make_fingerprint()
 
     created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
@@ -57,6 +62,8 @@ class Citation(db.Model):
         Index("ix_citations_user_key", "user_id", "key"),
         Index("ix_citations_user_title", "user_id", "title"),
         Index("ix_citations_user_tags", "user_id", "tags"),
+        Index("ix_citations_user_doi", "user_id", "doi"),
+        Index("ix_citations_user_fingerprint", "user_id", "fingerprint"),
     )
 
     def to_dict(self):
@@ -68,6 +75,112 @@ class Citation(db.Model):
         }
 # … keep the rest of your routes/helpers exactly as before …
 
+# --- duplicate detection -----------------------------------------------------
+
+DOI_PREFIX_RE = re.compile(r"^(?:https?://(?:dx\.)?doi\.org/|doi:\s*)", re.IGNORECASE)
+NON_WORD_RE = re.compile(r"[\W_]+", re.UNICODE)
+
+def normalize_doi(doi):
+    # "https://doi.org/10.1000/ABC" / "doi:10.1000/abc" -> "10.1000/abc"
+    if not doi:
+        return None
+    return DOI_PREFIX_RE.sub("", doi.strip()).strip().lower() or None
+
+def _first_surname(authors):
+    first = (authors or "").split(";")[0].strip()
+    if not first:
+        return ""
+    if "," in first:
+        return first.split(",", 1)[0]
+    return first.split()[-1]
+
+def make_fingerprint(title, authors, year):
+    """
+    Hash of case-folded, punctuation-stripped title + first-author surname + year.
+    Two records of the same paper imported from different sources share it.
+    None without a title, or with neither surname nor year: a bare generic
+    title ("Introduction") says nothing about which paper it is.
+    """
+    t = " ".join(NON_WORD_RE.sub(" ", (title or "").casefold()).split())
+    if not t:
+        return None
+    a = NON_WORD_RE.sub("", _first_surname(authors).casefold())
+    y = str(year or "").strip()[:4]
+    if not a and not y:
+        return None
+    return hashlib.sha1(f"{t}|{a}|{y}".encode("utf-8")).hexdigest()
+
+@event.listens_for(BibEntry, "before_insert")
+@event.listens_for(BibEntry, "before_update")
+@event.listens_for(Citation, "before_insert")
+@event.listens_for(Citation, "before_update")
+def _stamp_fingerprint(mapper, connection, target):
+    target.doi = normalize_doi(target.doi)
+    target.fingerprint = make_fingerprint(target.title, target.authors, target.year)
+
+def find_duplicate(model, doi=None, fingerprint=None, exclude_key=None, **scope):
+    """First row of `model` sharing the DOI (preferred) or fingerprint, via the indexed columns."""
+    for col, value in (("doi", normalize_doi(doi)), ("fingerprint", fingerprint)):
+        if not value:
+            continue
+        q = model.query.filter_by(**scope).filter(getattr(model, col) == value)
+        if exclude_key is not None:
+            q = q.filter(model.key != exclude_key)
+        hit = q.first()
+        if hit:
+            return hit
+    return None
+
+def duplicate_report(model=None, **scope):
+    """
+    Group rows sharing a DOI or fingerprint. Runs one GROUP BY ... HAVING
+    query per column plus one fetch for the members, never a pairwise
+    comparison. Citations are grouped per user.
+    """
+    model = model or BibEntry
+    owner = getattr(model, "user_id", None)
+    groups = []
+    for col in ("doi", "fingerprint"):
+        column = getattr(model, col)
+        group_cols = [column] if owner is None else [owner, column]
+        dupes = (db.session.query(*group_cols)
+                 .filter_by(**scope).filter(column.isnot(None))
+                 .group_by(*group_cols).having(db.func.count() > 1).all())
+        values = sorted({row[-1] for row in dupes})
+        members = {}
+        for i in range(0, len(values), 500):
+            rows = (db.session.query(model.id, model.key, model.title, *group_cols)
+                    .filter_by(**scope).filter(column.in_(values[i:i + 500]))
+                    .order_by(model.id))
+            for id_, key, title, *gkey in rows:
+                members.setdefault(tuple(gkey), []).append({"id": id_, "key": key, "title": title})
+        groups.extend({"match": col, "value": gkey[-1], "entries": m}
+                      for gkey, m in members.items() if len(m) > 1)
+    return groups
+
+def ensure_biblio_schema():
+    """Add dedup columns/indexes to pre-existing SQLite tables and backfill fingerprints."""
+    fulltext.ensure_fulltext_schema()
+    for model in (BibEntry, Citation):
+        table = model.__tablename__
+        cols = {c[1] for c in db.session.execute(db.text(f"PRAGMA table_info({table})"))}
+        if "fingerprint" not in cols:
+            db.session.execute(db.text(f"ALTER TABLE {table} ADD COLUMN fingerprint VARCHAR(40)"))
+        for index in model.__table__.indexes:
+            index.create(db.session.connection(), checkfirst=True)
+        db.session.commit()
+        last_id = 0
+        while True:
+            batch = (model.query.filter(model.fingerprint.is_(None), model.id > last_id)
+                     .order_by(model.id).limit(1000).all())
+            if not batch:
+                break
+            for row in batch:
+                row.doi = normalize_doi(row.doi)
+                row.fingerprint = make_fingerprint(row.title, row.authors, row.year)
+            last_id = batch[-1].id
+            db.session.commit()
+
 # --- helpers -----------------------------------------------------------------
 
 def parse_authors(authors_str: str):
@@ -152,8 +265,15 @@ def home():
 def index():
     q = request.args.get("q", "").strip()
     year = request.args.get("year", "").strip()
+    in_pdfs = request.args.get("fulltext") == "1"
     query = BibEntry.query
-    if q:
+    hits = {}
+    if q and in_pdfs:
+        # search inside attached PDFs; page hits are grouped per stored file
+        for h in fulltext.search(q):
+            hits.setdefault(h["file_path"], []).append(h)
+        query = query.filter(BibEntry.file_path.in_(list(hits)))
+    elif q:
         like = f"%{q}%"
         query = query.filter(or_(BibEntry.title.ilike(like),
                                  BibEntry.authors.ilike(like),
@@ -165,31 +285,89 @@ def index():
 
     # year facet options
     years = [y for (y,) in db.session.query(BibEntry.year).filter(BibEntry.year.isnot(None)).distinct().order_by(BibEntry.year.desc()).all()]
-    return render_template("bib_index.html", entries=entries, years=years, q=q, year=year)
+    if hits:
+        rank = {fp: i for i, fp in enumerate(hits)}
+        entries.sort(key=lambda e: rank[e.file_path])
+    return render_template("bib_index.html", entries=entries, years=years, q=q, year=year,
+                           fulltext=in_pdfs, hits=hits)
+
+def _key_suffixes(base_key: str):
+    """
+    Return the numeric suffixes already taken for base_key ("key" counts as 1,
+    "key-2" as 2, ...) using one range scan over the unique index on `key`.
+    """
+    # "-" sorts right before ".", so [base-, base.) covers every "base-<anything>"
+    rows = db.session.query(BibEntry.key).filter(or_(
+        BibEntry.key == base_key,
+        (BibEntry.key >= f"{base_key}-") & (BibEntry.key < f"{base_key}."),
+    )).all()
+    taken = set()
+    for (k,) in rows:
+        if k == base_key:
+            taken.add(1)
+            continue
+        tail = k[len(base_key) + 1:]
+        if tail.isdigit():
+            taken.add(int(tail))
+    return taken
 
 def _unique_key(base_key: str) -> str:
     """
     Find an available unique key by appending -2, -3, ... if needed.
     """
-    candidate = base_key
-    i = 2
-    while BibEntry.query.filter_by(key=candidate).first() is not None:
-        candidate = f"{base_key}-{i}"
-        i += 1
-    return candidate
+    taken = _key_suffixes(base_key)
+    if 1 not in taken:
+        return base_key
+    return f"{base_key}-{max(taken) + 1}"
+
+class KeyAllocator:
+    """
+    Hands out unique keys for a batch of inserts. Each base key is looked up
+    once; later collisions on the same base are resolved in memory, so
+    importing many "smith2020" entries costs one query instead of one per try.
+    """
+    def __init__(self):
+        self._next = {}
+
+    def allocate(self, base_key: str) -> str:
+        n = self._next.get(base_key)
+        if n is None:
+            taken = _key_suffixes(base_key)
+            if 1 not in taken:
+                self._next[base_key] = 2 if not taken else max(taken) + 1
+                return base_key
+            n = max(taken) + 1
+        self._next[base_key] = n + 1
+        return f"{base_key}-{n}"
+
+    def reserve(self, key: str):
+        """Mark a literal key as used by this batch (e.g. an insert under its own key)."""
+        base, _, tail = key.rpartition("-")
+        if base and tail.isdigit():
+            n = int(tail)
+        else:
+            base, n = key, 1
+        if base in self._next:
+            self._next[base] = max(self._next[base], n + 1)
+
+KEY_ALLOC_RETRIES = 5
 
 @biblio.route("/create", methods=["POST"])
 def create():
-    on_conflict = (request.form.get("on_conflict") or "update").lower()
-    raw_key = request.form["key"].strip()
-
     # Handle file upload (optional)
     f = request.files.get("pdf")
     stored = None
     if f and f.filename:
-        fn = secure_filename(f.filename)
-        stored = f"{dt.datetime.utcnow().strftime('%Y%m%d%H%M%S')}_{fn}"
-        f.save(os.path.join(UPLOAD_DIR, stored))
+        stored = blobstore.store_stream(f.stream, UPLOAD_DIR, ext=".pdf")
+    try:
+        return _create_entry(stored)
+    finally:
+        # the row referencing it is committed by now, or was never added
+        blobstore.unpin(stored)
+
+def _create_entry(stored):
+    on_conflict = (request.form.get("on_conflict") or "update").lower()
+    raw_key = request.form["key"].strip()
 
     # Prepare fields
     payload = dict(
@@ -205,21 +383,49 @@ def create():
 
     existing = BibEntry.query.filter_by(key=raw_key).first()
 
+    if not existing:
+        # same paper already stored under another key (DOI or title/author/year match)
+        dup = find_duplicate(BibEntry, payload["doi"],
+                             make_fingerprint(payload["title"], payload["authors"], payload["year"]))
+        if dup:
+            if on_conflict == "skip":
+                flash(f"Same paper already stored as '{dup.key}' — skipped.", "warning")
+                _release_file(stored, own_pins=1)
+                return redirect(url_for("biblio.index"))
+            if on_conflict == "newkey":
+                # the key is free: insert as asked, but tell the user
+                flash(f"Same paper is already stored as '{dup.key}'.", "warning")
+            else:
+                # "update": the form overwrites the stored copy of that paper
+                raw_key, existing = dup.key, dup
+
     if existing:
         if on_conflict == "skip":
             flash(f"Entry with key '{raw_key}' already exists — skipped.", "warning")
+            _release_file(stored, own_pins=1)
             return redirect(url_for("biblio.index"))
 
         if on_conflict == "newkey":
-            # allocate a new unique key and insert a fresh row
-            new_key = _unique_key(raw_key)
-            e = BibEntry(key=new_key, **payload, file_path=stored)
-            db.session.add(e)
-            db.session.commit()
+            # allocate a new unique key and insert a fresh row; a concurrent
+            # insert may grab the same suffix, so retry on the unique index
+            for _ in range(KEY_ALLOC_RETRIES):
+                new_key = _unique_key(raw_key)
+                e = BibEntry(key=new_key, **payload, file_path=stored)
+                db.session.add(e)
+                try:
+                    db.session.commit()
+                    break
+                except IntegrityError:
+                    db.session.rollback()
+            else:
+                flash(f"Could not allocate a new key for '{raw_key}'.", "danger")
+                _release_file(stored, own_pins=1)
+                return redirect(url_for("biblio.index"))
+            _index_file(stored)
             flash(f"Duplicate key. Created as '{new_key}'.", "success")
             return redirect(url_for("biblio.index"))
 
-        # default: update existing
+        # default: update existing (or the same paper under another key)
         existing.title = payload["title"]
         existing.authors = payload["authors"]
         existing.venue = payload["venue"]
@@ -228,16 +434,13 @@ def create():
         existing.url = payload["url"]
         existing.abstract = payload["abstract"]
         existing.tags = payload["tags"]
-        if stored:
-            # optional: delete previous file if you want to avoid orphan files
-            if existing.file_path:
-                try:
-                    os.remove(os.path.join(UPLOAD_DIR, existing.file_path))
-                except Exception:
-                    pass
-            existing.file_path = stored
+        previous = None
+        if stored and existing.file_path != stored:
+            previous, existing.file_path = existing.file_path, stored
 
         db.session.commit()
+        _release_file(previous)
+        _index_file(stored)
         flash(f"Updated existing entry '{raw_key}'.", "success")
         return redirect(url_for("biblio.index"))
 
@@ -246,21 +449,36 @@ def create():
     db.session.add(e)
     try:
         db.session.commit()
+        _index_file(stored)
         flash("Entry added.", "success")
     except Exception as ex:
         db.session.rollback()
         flash(f"Error adding entry: {ex}", "danger")
+        _release_file(stored, own_pins=1)
     return redirect(url_for("biblio.index"))
 
 
+def _release_file(path, own_pins=0):
+    """
+    Unlink an upload once no entry points at it any more (duplicates share
+    blobs). own_pins=1 when this request stored `path` itself (see blobstore).
+    """
+    count_refs = lambda: BibEntry.query.filter_by(file_path=path).count()
+    if path and blobstore.release(UPLOAD_DIR, path, count_refs, own_pins):
+        fulltext.drop(path)
+
+def _index_file(path):
+    # text extraction runs in the background pool; the request returns right away
+    if path and not fulltext.is_indexed(path):
+        fulltext.queue(current_app._get_current_object(), UPLOAD_DIR, path)
+
 @biblio.route("/biblio/delete/<int:entry_id>")
 def delete(entry_id):
     e = BibEntry.query.get_or_404(entry_id)
-    if e.file_path:
-        try: os.remove(os.path.join(UPLOAD_DIR, e.file_path))
-        except Exception: pass
+    path = e.file_path
     db.session.delete(e)
     db.session.commit()
+    _release_file(path)
     flash("Entry deleted.", "success")
     return redirect(url_for("biblio.index"))
 
@@ -268,7 +486,18 @@ def delete(entry_id):
 def download_pdf(entry_id):
     e = BibEntry.query.get_or_404(entry_id)
     if not e.file_path: abort(404)
-    return send_from_directory(UPLOAD_DIR, e.file_path, as_attachment=True)
+    digest = blobstore.blob_digest(e.file_path)
+    if not digest:
+        # legacy timestamped upload
+        return send_from_directory(UPLOAD_DIR, e.file_path, as_attachment=True)
+    path = os.path.join(UPLOAD_DIR, e.file_path)
+    if not os.path.isfile(path): abort(404)
+    # conditional=True gives Range / If-Range / If-None-Match handling; the
+    # content hash is a strong validator and the bytes never change
+    resp = send_file(path, as_attachment=True, download_name=f"{secure_filename(e.key) or 'paper'}.pdf",
+                     mimetype="application/pdf", conditional=True, etag=digest, max_age=31536000)
+    resp.headers["Cache-Control"] = "private, max-age=31536000, immutable"
+    return resp
 
 @biblio.route("/biblio/cite/<int:entry_id>")
 def cite(entry_id):
@@ -292,41 +521,126 @@ def export_all():
     } for e in entries]
     return json.dumps(data, indent=2), 200, {"Content-Type": "application/json; charset=utf-8"}
 
+def _fill_missing(e, title, authors, venue, year, doi, url):
+    # update minimal fields if missing
+    e.title = e.title or title
+    e.authors = e.authors or authors
+    e.venue = e.venue or venue
+    e.year = e.year or year
+    e.doi = e.doi or doi
+    e.url = e.url or url
+
+@biblio.route("/biblio/duplicates")
+def duplicates():
+    return json.dumps(duplicate_report(BibEntry), indent=2), 200, {"Content-Type": "application/json; charset=utf-8"}
+
+@biblio.cli.command("dedup-report")
+def dedup_report_command():
+    """Print groups of bibliography entries / citations that look like the same paper."""
+    for label, model in (("bib_entries", BibEntry), ("citations", Citation)):
+        groups = duplicate_report(model)
+        click.echo(f"{label}: {len(groups)} duplicate groups")
+        for g in groups:
+            keys = ", ".join(m["key"] for m in g["entries"])
+            click.echo(f"  [{g['match']}] {keys} — {g['entries'][0]['title']}")
+
+@biblio.cli.command("index-fulltext")
+@click.option("--reindex", is_flag=True, help="Re-extract files that are already indexed.")
+def index_fulltext_command(reindex):
+    """Extract and index the text of every uploaded PDF (backfill)."""
+    paths = [p for (p,) in db.session.query(BibEntry.file_path).filter(BibEntry.file_path.isnot(None)).distinct()]
+    n = fulltext.backfill(UPLOAD_DIR, paths, reindex=reindex)
+    click.echo(f"Indexed {n} of {len(paths)} files.")
+
+def _bib_fields(fields):
+    """(title, authors, venue, year, doi, url) of a parsed BibTeX entry, as stored."""
+    title = fields.get("title") or ""
+    authors_raw = fields.get("author", "")
+    authors = "; ".join([a.strip() for a in authors_raw.replace(" and ", "; ").split(";") if a.strip()])
+    venue = fields.get("journal") or fields.get("booktitle") or fields.get("howpublished") or None
+    year = fields.get("year")
+    try: year = int(year) if year else None
+    except: year = None
+    return title, authors, venue, year, fields.get("doi") or None, fields.get("url") or None
+
 @biblio.route("/biblio/import", methods=["POST"])
 def import_bib():
     f = request.files.get("bibfile")
     if not f: 
         flash("No file provided.", "danger")
         return redirect(url_for("biblio.index"))
+    on_conflict = (request.form.get("on_conflict") or "update").lower()
     text = f.read().decode("utf-8", errors="replace")
     items = parse_bibtex(text)
+
+    # one IN query per chunk instead of one lookup per entry
+    existing = {}
+    keys = list({key for key, _ in items})
+    for i in range(0, len(keys), 500):
+        for e in BibEntry.query.filter(BibEntry.key.in_(keys[i:i + 500])):
+            existing[e.key] = e
+
+    # DOI / fingerprint lookups for entries arriving under a new key
+    by_doi, by_fp = {}, {}
+    items = [(key, _bib_fields(fields)) for key, fields in items]
+    incoming = [(normalize_doi(doi), make_fingerprint(title, authors, year))
+                for _, (title, authors, _, year, doi, _) in items]
+    for col, index, values in ((BibEntry.doi, by_doi, {d for d, _ in incoming if d}),
+                               (BibEntry.fingerprint, by_fp, {fp for _, fp in incoming if fp})):
+        values = list(values)
+        for i in range(0, len(values), 500):
+            for e in BibEntry.query.filter(col.in_(values[i:i + 500])):
+                index.setdefault(getattr(e, col.key), e)
+
+    alloc = KeyAllocator()
     added = 0
-    for key, fields in items:
-        title = fields.get("title") or ""
-        authors_raw = fields.get("author", "")
-        authors = "; ".join([a.strip() for a in authors_raw.replace(" and ", "; ").split(";") if a.strip()])
-        venue = fields.get("journal") or fields.get("booktitle") or fields.get("howpublished") or None
-        year  = fields.get("year")
-        try: year = int(year) if year else None
-        except: year = None
-        doi = fields.get("doi") or None
-        url = fields.get("url") or None
+    merged = 0
+    duplicates = []  # (incoming key, stored key) inserted anyway under "newkey"
+    for key, (title, authors, venue, year, doi, url) in items:
         if not title: continue
-        exists = BibEntry.query.filter_by(key=key).first()
+        exists = existing.get(key)
+        fp = make_fingerprint(title, authors, year)
+        if not exists:
+            dup = by_doi.get(normalize_doi(doi)) or by_fp.get(fp)
+            if dup:
+                if on_conflict == "newkey":
+                    # as in create(): the key is free, insert as asked but report it
+                    duplicates.append((key, dup.key))
+                else:
+                    # same paper under a different key: update fills it in, skip leaves it
+                    if on_conflict != "skip":
+                        _fill_missing(dup, title, authors, venue, year, doi, url)
+                        merged += 1
+                    continue
+        if exists and on_conflict == "skip":
+            continue
+        if exists and on_conflict == "newkey":
+            key, exists = alloc.allocate(key), None
         if exists: 
-            # update minimal fields if missing
-            exists.title = exists.title or title
-            exists.authors = exists.authors or authors
-            exists.venue = exists.venue or venue
-            exists.year = exists.year or year
-            exists.doi = exists.doi or doi
-            exists.url = exists.url or url
+            _fill_missing(exists, title, authors, venue, year, doi, url)
         else:
-            db.session.add(BibEntry(
+            e = BibEntry(
                 key=key, title=title, authors=authors, venue=venue,
-                year=year, doi=doi, url=url
-            ))
+                year=year, doi=normalize_doi(doi), url=url, fingerprint=fp
+            )
+            db.session.add(e)
+            existing[key] = e
+            alloc.reserve(key)
+            if e.doi: by_doi.setdefault(e.doi, e)
+            if fp: by_fp.setdefault(fp, e)
         added += 1
-    db.session.commit()
-    flash(f"Imported/updated {added} entries.", "success")
+    try:
+        db.session.commit()
+    except IntegrityError as ex:
+        db.session.rollback()
+        flash(f"Import failed, a key was taken concurrently ({ex.orig}). Please retry.", "danger")
+        return redirect(url_for("biblio.index"))
+    msg = f"Imported/updated {added} entries."
+    if merged:
+        msg += f" Merged {merged} duplicates into existing entries."
+    flash(msg, "success")
+    if duplicates:
+        shown = ", ".join(f"'{new}' (as '{old}')" for new, old in duplicates[:5])
+        more = f" and {len(duplicates) - 5} more" if len(duplicates) > 5 else ""
+        flash(f"{len(duplicates)} imported entries are already stored under another key: {shown}{more}.", "warning")
     return redirect(url_for("biblio.index"))
@@ -2,7 +2,7 @@
 from flask import Blueprint, request, jsonify, render_template, abort, Response
 from flask_login import current_user, login_required
 from sqlalchemy import insert
-from biblio import db, Citation
+from biblio import db, Citation, find_duplicate, make_fingerprint, normalize_doi
 import json
 
 biblio_bp = Blueprint("biblio_bp", __name__, url_prefix="/biblio")
@@ -51,13 +51,22 @@ def save_citation():
       "venue":"...", "doi":"...", "url":"...", "tags":"a,b",
       "abstract":"...", "raw":"@article{...}", "csl_json": {...}
     }
-    Upsert by (user_id, key).
+    Upsert by (user_id, key). If the same paper (DOI or title/author/year
+    fingerprint) is already saved under another key, answers 409 unless
+    "allow_duplicate" is true.
     """
     data = request.get_json(force=True) or {}
     required = data.get("key")
     if not required:
         return jsonify({"error": "key is required"}), 400
 
+    doi = normalize_doi(data.get("doi"))
+    fingerprint = make_fingerprint(data.get("title"), data.get("authors"), data.get("year"))
+    if not data.get("allow_duplicate"):
+        dup = find_duplicate(Citation, doi, fingerprint, exclude_key=data["key"].strip(), user_id=_uid())
+        if dup:
+            return jsonify({"error": "duplicate", "duplicate_of": dup.key}), 409
+
     # Try ON CONFLICT upsert (SQLite / SQLAlchemy 2.x pattern)
     # Fallback to manual merge if your SQLAlchemy/DB doesn’t support it.
     try:
@@ -68,12 +77,13 @@ def save_citation():
             authors=data.get("authors"),
             year=data.get("year"),
             venue=data.get("venue"),
-            doi=data.get("doi"),
+            doi=doi,
             url=data.get("url"),
             tags=data.get("tags"),
             abstract=data.get("abstract"),
             raw=data.get("raw"),
             csl_json=data.get("csl_json"),
+            fingerprint=fingerprint,
         )
         stmt = stmt.on_conflict_do_update(
             index_elements=["user_id", "key"],
@@ -88,6 +98,7 @@ def save_citation():
                 "abstract": stmt.excluded.abstract,
                 "raw": stmt.excluded.raw,
                 "csl_json": stmt.excluded.csl_json,
+                "fingerprint": stmt.excluded.fingerprint,
             },
         )
         db.session.execute(stmt)
@@ -0,0 +1,89 @@
+# blobstore.py
+# Content-addressed file storage: a blob lives at <root>/sha256/<ab>/<digest><ext>,
+# so the same bytes uploaded twice are stored once.
+#
+# A blob written by store_stream() stays pinned until the caller has
+# committed (or given up on) its reference and calls unpin(); release()
+# never unlinks a pinned blob, and pinning and releasing share one lock, so
+# a concurrent release cannot remove a blob another request is about to
+# reference. Pins are per process, like the upload handlers that take them.
+import hashlib
+import os
+import tempfile
+import threading
+
+CHUNK_SIZE = 64 * 1024
+BLOB_PREFIX = "sha256"
+
+_pins = {}  # relpath -> stores not yet committed or abandoned
+_lock = threading.Lock()
+
+def blob_relpath(digest: str, ext: str = "") -> str:
+    return "/".join([BLOB_PREFIX, digest[:2], digest + ext])
+
+def is_blob(relpath: str) -> bool:
+    return bool(relpath) and relpath.startswith(BLOB_PREFIX + "/")
+
+def blob_digest(relpath: str):
+    """sha256 hex digest encoded in a blob path, or None for legacy files."""
+    if not is_blob(relpath):
+        return None
+    return os.path.splitext(os.path.basename(relpath))[0]
+
+def store_stream(stream, root: str, ext: str = "") -> str:
+    """
+    Copy `stream` to disk in CHUNK_SIZE pieces while hashing it, then move the
+    temp file to its content address. Returns the path relative to `root`,
+    pinned: call unpin() once the referencing row is committed or dropped.
+    """
+    tmp_dir = os.path.join(root, BLOB_PREFIX, "tmp")
+    os.makedirs(tmp_dir, exist_ok=True)
+    h = hashlib.sha256()
+    fd, tmp = tempfile.mkstemp(dir=tmp_dir)
+    try:
+        with os.fdopen(fd, "wb") as out:
+            while True:
+                chunk = stream.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                h.update(chunk)
+                out.write(chunk)
+        rel = blob_relpath(h.hexdigest(), ext)
+        dest = os.path.join(root, rel)
+        os.makedirs(os.path.dirname(dest), exist_ok=True)
+        with _lock:
+            _pins[rel] = _pins.get(rel, 0) + 1
+            # atomic; also re-materializes a blob a concurrent release just unlinked
+            os.replace(tmp, dest)
+        return rel
+    except Exception:
+        try: os.remove(tmp)
+        except OSError: pass
+        raise
+
+def unpin(relpath: str):
+    if not relpath:
+        return
+    with _lock:
+        n = _pins.get(relpath, 0) - 1
+        if n > 0:
+            _pins[relpath] = n
+        else:
+            _pins.pop(relpath, None)
+
+def release(root: str, relpath: str, count_refs, own_pins: int = 0) -> bool:
+    """
+    Unlink `relpath` once nothing references it. `count_refs()` runs under
+    the blob lock; `own_pins` are the caller's own uncommitted stores of it.
+    Returns True if removed.
+    """
+    if not relpath:
+        return False
+    with _lock:
+        if _pins.get(relpath, 0) > own_pins or count_refs() > 0:
+            return False
+        try:
+            os.remove(os.path.join(root, relpath))
+            return True
+        except OSError:
+            return False
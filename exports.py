@@ -0,0 +1,182 @@
+# exports.py
+# Background document exports (HTML, PDF, zip bundles). Rendering runs in a
+# bounded process pool, never on a request thread; finished files are cached
+# on disk under a key derived from (format, document id, version, content), so
+# exporting an unchanged document again is a cache hit. Job records live in
+# memory per process; the file cache is shared.
+import hashlib
+import io
+import json
+import os
+import tempfile
+import threading
+import time
+import uuid
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+
+import metrics
+from rendering import RENDER_PIPELINE
+from ttlcache import TTLCache
+
+EXPORT_WORKERS = int(os.getenv("EXPORT_WORKERS", "2"))
+EXPORT_DIR = os.path.join(os.getcwd(), "exports")  # created on first export
+EXPORT_CACHE_MAX_FILES = 500
+JOB_TTL = 60 * 60  # seconds a finished job stays queryable
+BUNDLE_MAX_DOCS = 200
+TEMPLATE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "templates")
+
+FORMATS = {
+    "html": ("text/html", ".html"),
+    "pdf": ("application/pdf", ".pdf"),
+    "zip": ("application/zip", ".zip"),
+}
+
+# --- rendering (runs in worker processes) ------------------------------------
+
+@lru_cache(maxsize=1)
+def _export_template():
+    from jinja2 import Environment, FileSystemLoader, select_autoescape
+    env = Environment(loader=FileSystemLoader(TEMPLATE_DIR), autoescape=select_autoescape(["html"]))
+    return env.get_template("export.html")
+
+def render_html(title: str, content: str) -> bytes:
+    from rendering import render_markdown
+    return _export_template().render(title=title, body_html=render_markdown(content)).encode("utf-8")
+
+def render_pdf(title: str, content: str) -> bytes:
+    try:
+        from weasyprint import HTML
+    except Exception as ex:  # missing system libraries (pango/cairo) raise OSError, not ImportError
+        raise RuntimeError(f"PDF export is unavailable: {ex}")
+    return HTML(string=render_html(title, content).decode("utf-8")).write_pdf()
+
+def render_bundle(docs) -> bytes:
+    """docs: [(title, content)] -> zip with a .md and a .html per document."""
+    buf = io.BytesIO()
+    seen = set()
+    with zipfile.ZipFile(buf, "w", zipfile.ZIP_DEFLATED) as zf:
+        for title, content in docs:
+            name = _safe_name(title)
+            stem, n = name, 2
+            while stem in seen:
+                stem, n = f"{name}-{n}", n + 1
+            seen.add(stem)
+            zf.writestr(f"{stem}.md", content)
+            zf.writestr(f"{stem}.html", render_html(title, content))
+    return buf.getvalue()
+
+def _safe_name(title: str) -> str:
+    cleaned = "".join(ch if ch.isalnum() or ch in " -_." else "_" for ch in (title or "document")).strip()
+    return cleaned[:80] or "document"
+
+RENDERERS = {"html": render_html, "pdf": render_pdf, "zip": render_bundle}
+
+# --- cache -------------------------------------------------------------------
+
+def cache_key(fmt: str, docs) -> str:
+    """docs: [(doc_id, version, title, content)]. Changes to any of them, or to RENDER_PIPELINE, give a new key."""
+    h = hashlib.sha256(f"{fmt}:{RENDER_PIPELINE}".encode())
+    for doc_id, version, title, content in docs:
+        h.update(json.dumps([doc_id, version, title]).encode())
+        h.update(hashlib.sha256((content or "").encode("utf-8")).digest())
+    return h.hexdigest()
+
+def cache_path(key: str, fmt: str) -> str:
+    return os.path.join(EXPORT_DIR, key[:2], key + FORMATS[fmt][1])
+
+def cached(key: str, fmt: str):
+    path = cache_path(key, fmt)
+    return path if os.path.isfile(path) else None
+
+def store(key: str, fmt: str, data: bytes) -> str:
+    path = cache_path(key, fmt)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path))
+    with os.fdopen(fd, "wb") as out:
+        out.write(data)
+    os.replace(tmp, path)
+    _prune()
+    return path
+
+def _prune():
+    """Drop the least recently written files beyond EXPORT_CACHE_MAX_FILES."""
+    files = []
+    for root, _, names in os.walk(EXPORT_DIR):
+        files.extend(os.path.join(root, n) for n in names)
+    if len(files) <= EXPORT_CACHE_MAX_FILES:
+        return
+    files.sort(key=lambda p: os.stat(p).st_mtime)
+    for p in files[:len(files) - EXPORT_CACHE_MAX_FILES]:
+        try: os.remove(p)
+        except OSError: pass
+
+# --- jobs --------------------------------------------------------------------
+
+_pool = None
+_lock = threading.Lock()
+_jobs = TTLCache(ttl=JOB_TTL, maxsize=10000, name="export_jobs")
+_inflight = {}  # cache key -> job id, so concurrent requests share one render
+
+def _get_pool():
+    global _pool
+    with _lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=EXPORT_WORKERS)
+        return _pool
+
+def submit(owner_id, fmt: str, docs, filename: str) -> dict:
+    """
+    Queue an export. docs: [(doc_id, version, title, content)]. Returns the job
+    dict; it is already "done" when the output is cached.
+    """
+    key = cache_key(fmt, docs)
+    with _lock:
+        running = _inflight.get(key)
+        if running is not None:
+            job = _jobs.get(running)
+            if job is not None and job["owner_id"] == owner_id:
+                metrics.EXPORT_REQUESTS.inc(format=fmt, result="joined")
+                return job
+    job = {"id": uuid.uuid4().hex, "owner_id": owner_id, "format": fmt, "key": key,
+           "filename": filename, "status": "queued", "error": None}
+    if cached(key, fmt):
+        job["status"] = "done"
+        _jobs.set(job["id"], job)
+        metrics.EXPORT_REQUESTS.inc(format=fmt, result="cached")
+        return job
+    metrics.EXPORT_REQUESTS.inc(format=fmt, result="rendered")
+    started = time.perf_counter()
+    if fmt == "zip":
+        fut = _get_pool().submit(render_bundle, [(title, content) for _, _, title, content in docs])
+    else:
+        _, _, title, content = docs[0]
+        fut = _get_pool().submit(RENDERERS[fmt], title, content)
+    _jobs.set(job["id"], job)
+    with _lock:
+        _inflight[key] = job["id"]
+
+    def _done(f):
+        try:
+            store(key, fmt, f.result())
+            job["status"] = "done"
+        except Exception as ex:
+            job["status"] = "failed"
+            job["error"] = str(ex) or type(ex).__name__
+        finally:
+            with _lock:
+                _inflight.pop(key, None)
+            metrics.EXPORT_SECONDS.observe(time.perf_counter() - started, format=fmt, status=job["status"])
+    job["status"] = "running"
+    fut.add_done_callback(_done)
+    return job
+
+def get_job(job_id: str, owner_id):
+    job = _jobs.get(job_id)
+    if job is None or job["owner_id"] != owner_id:
+        return None
+    return job
+
+def job_path(job):
+    return cached(job["key"], job["format"]) if job["status"] == "done" else None
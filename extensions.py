@@ -1,11 +1,21 @@
 from flask_sqlalchemy import SQLAlchemy
-from flask_migrate import Migrate
 from flask_login import LoginManager
 from flask_socketio import SocketIO
 from flask_wtf.csrf import CSRFProtect
 
 db = SQLAlchemy()
-migrate = Migrate()
 login_manager = LoginManager()
 socketio = SocketIO()
 csrf = CSRFProtect()
+
+_migrate = None
+
+def __getattr__(name):
+    # flask_migrate pulls in alembic (~100 ms); only load it when `migrate` is used
+    global _migrate
+    if name == "migrate":
+        if _migrate is None:
+            from flask_migrate import Migrate
+            _migrate = Migrate()
+        return _migrate
+    raise AttributeError(name)
@@ -0,0 +1,241 @@
+# fulltext.py
+# Background text extraction for uploaded papers + SQLite FTS5 page index.
+# Pages are stored zlib-compressed in paper_pages; paper_pages_fts is a
+# contentless FTS5 table whose rowid is paper_pages.id, so the index adds
+# no second copy of the text.
+import os
+import re
+import zlib
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeout
+from concurrent.futures.process import BrokenProcessPool
+from functools import lru_cache
+
+import click
+
+from extensions import db
+
+# Optional: pypdf (imported on first use; it is slow to import)
+@lru_cache(maxsize=1)
+def pdf_reader():
+    try:
+        from pypdf import PdfReader
+        return PdfReader
+    except Exception:
+        return None
+
+FULLTEXT_WORKERS = int(os.getenv("FULLTEXT_WORKERS", "2"))
+FULLTEXT_TIMEOUT = float(os.getenv("FULLTEXT_TIMEOUT", "120"))  # seconds per file
+FTS_TABLE = "paper_pages_fts"
+
+class PaperPage(db.Model):
+    __tablename__ = "paper_pages"
+    id = db.Column(db.Integer, primary_key=True)
+    file_path = db.Column(db.String(1024), index=True, nullable=False)  # blobstore path
+    page = db.Column(db.Integer, nullable=False)  # 1-based
+    text_z = db.Column(db.LargeBinary)  # zlib-compressed UTF-8
+
+    @property
+    def text(self) -> str:
+        return zlib.decompress(self.text_z).decode("utf-8") if self.text_z else ""
+
+def ensure_fulltext_schema():
+    db.session.execute(db.text(
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(body, content='')"
+    ))
+    db.session.commit()
+
+# --- extraction (runs in worker processes) -----------------------------------
+
+def extract_pages(path: str):
+    """Return the text of each page of the PDF at `path`."""
+    reader = pdf_reader()(path)
+    pages = []
+    for p in reader.pages:
+        try:
+            pages.append(p.extract_text() or "")
+        except Exception:
+            pages.append("")
+    return pages
+
+# --- indexing ----------------------------------------------------------------
+
+_pool = None
+_pool_lock = threading.Lock()
+_inflight = set()
+_pending = {}     # pool -> its extractions not finished or given up on yet
+_retired = set()  # pools taking no new files, shut down once _pending drains
+
+def _submit(path: str):
+    """(pool, future) extracting `path`; a broken pool is replaced and the submit retried once."""
+    global _pool
+    for attempt in (1, 2):
+        with _pool_lock:
+            if _pool is None:
+                _pool = ProcessPoolExecutor(max_workers=FULLTEXT_WORKERS)
+            pool = _pool
+            try:
+                fut = pool.submit(extract_pages, path)
+            except BrokenProcessPool:
+                if attempt == 2:
+                    raise
+            else:
+                _pending.setdefault(pool, set()).add(fut)
+                return pool, fut
+        _retire(pool)
+
+def _retire(pool):
+    """Send new files to a fresh pool; `pool` finishes what it has, then is shut down."""
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+        _retired.add(pool)
+    _settle(pool, None)
+
+def _settle(pool, fut):
+    """Stop counting `fut` against `pool`; tear a retired pool down when nothing is left."""
+    with _pool_lock:
+        futs = _pending.get(pool, set())
+        futs.discard(fut)
+        if futs or pool not in _retired:
+            return
+        _pending.pop(pool, None)
+        _retired.discard(pool)
+    # kills a worker stuck on a timed-out file
+    for proc in list(getattr(pool, "_processes", {}).values()):
+        proc.terminate()
+    pool.shutdown(wait=False, cancel_futures=True)
+
+def is_indexed(file_path: str) -> bool:
+    return db.session.query(PaperPage.id).filter_by(file_path=file_path).first() is not None
+
+def store_pages(file_path: str, pages):
+    """Replace the stored/indexed pages of one file."""
+    drop(file_path, commit=False)
+    for n, body in enumerate(pages, 1):
+        row = PaperPage(file_path=file_path, page=n, text_z=zlib.compress(body.encode("utf-8"), 6))
+        db.session.add(row)
+        db.session.flush()
+        db.session.execute(db.text(f"INSERT INTO {FTS_TABLE}(rowid, body) VALUES (:id, :body)"),
+                           {"id": row.id, "body": body})
+    db.session.commit()
+
+def drop(file_path: str, commit: bool = True):
+    """Remove a file's pages from storage and from the index."""
+    for row in PaperPage.query.filter_by(file_path=file_path):
+        # contentless FTS5 deletes need the original tokens back
+        db.session.execute(db.text(
+            f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, body) VALUES ('delete', :id, :body)"
+        ), {"id": row.id, "body": row.text})
+        db.session.delete(row)
+    if commit:
+        db.session.commit()
+
+def queue(app, root: str, file_path: str):
+    """
+    Extract `file_path` in the process pool without blocking the caller; the
+    result is written from the pool's callback thread inside an app context.
+    A file still extracting after FULLTEXT_TIMEOUT is given up on.
+    """
+    if not file_path or pdf_reader() is None:
+        return None
+    with _pool_lock:
+        if file_path in _inflight:
+            return None
+        _inflight.add(file_path)
+    try:
+        pool, fut = _submit(os.path.join(root, file_path))
+    except BrokenProcessPool:
+        with _pool_lock:
+            _inflight.discard(file_path)
+        raise
+
+    def _expired():
+        if fut.done():
+            return
+        app.logger.warning("fulltext: gave up on %s after %g s", file_path, FULLTEXT_TIMEOUT)
+        _retire(pool)
+        _settle(pool, fut)
+    timer = threading.Timer(FULLTEXT_TIMEOUT, _expired)
+    timer.daemon = True
+    timer.start()
+
+    def _done(f):
+        timer.cancel()
+        try:
+            pages = f.result()
+            with app.app_context():
+                store_pages(file_path, pages)
+        except BrokenProcessPool as ex:
+            _retire(pool)
+            app.logger.warning("fulltext: could not index %s: %s", file_path, ex)
+        except Exception as ex:
+            app.logger.warning("fulltext: could not index %s: %s", file_path, ex)
+        finally:
+            _settle(pool, f)
+            with _pool_lock:
+                _inflight.discard(file_path)
+    fut.add_done_callback(_done)
+    return fut
+
+def backfill(root: str, file_paths, reindex: bool = False):
+    """Synchronously index every file in `file_paths` using the pool. Returns the count."""
+    if pdf_reader() is None:
+        raise RuntimeError("pypdf is not installed")
+    todo = [p for p in dict.fromkeys(file_paths) if p and (reindex or not is_indexed(p))
+            and os.path.isfile(os.path.join(root, p))]
+    done = 0
+    jobs = [(p, *_submit(os.path.join(root, p))) for p in todo]
+    for p, pool, fut in jobs:
+        try:
+            try:
+                pages = fut.result(timeout=FULLTEXT_TIMEOUT)
+            except BrokenProcessPool:
+                # a worker died under this or another file: one more try on a fresh pool
+                _retire(pool)
+                _settle(pool, fut)
+                pool, fut = _submit(os.path.join(root, p))
+                pages = fut.result(timeout=FULLTEXT_TIMEOUT)
+            store_pages(p, pages)
+            done += 1
+        except FutureTimeout:
+            _retire(pool)
+            click.echo(f"  skipped {p}: no text after {FULLTEXT_TIMEOUT:g} s")
+        except Exception as ex:
+            click.echo(f"  skipped {p}: {ex}")
+        finally:
+            _settle(pool, fut)
+    return done
+
+# --- search ------------------------------------------------------------------
+
+TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+def _match_expr(q: str) -> str:
+    # quote every term so user input can't trip FTS5 query syntax
+    return " ".join('"%s"' % t for t in TOKEN_RE.findall(q))
+
+def _snippet(text: str, terms, width: int = 80) -> str:
+    low = text.lower()
+    pos = min([i for i in (low.find(t.lower()) for t in terms) if i >= 0] or [0])
+    start = max(0, pos - width)
+    s = " ".join(text[start:pos + width].split())
+    return ("…" if start else "") + s + ("…" if pos + width < len(text) else "")
+
+def search(q: str, limit: int = 200):
+    """
+    Ranked page hits for `q`: [{"file_path", "page", "snippet"}], best first.
+    Only the returned pages are decompressed.
+    """
+    expr = _match_expr(q)
+    if not expr:
+        return []
+    rows = db.session.execute(db.text(
+        f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH :q ORDER BY rank LIMIT :n"
+    ), {"q": expr, "n": limit}).fetchall()
+    ids = [r[0] for r in rows]
+    pages = {p.id: p for p in PaperPage.query.filter(PaperPage.id.in_(ids))} if ids else {}
+    terms = TOKEN_RE.findall(q)
+    return [{"file_path": pages[i].file_path, "page": pages[i].page, "snippet": _snippet(pages[i].text, terms)}
+            for i in ids if i in pages]
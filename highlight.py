@@ -0,0 +1,117 @@
+# highlight.py
+# Server-side syntax highlighting for fenced code blocks, run as the last
+# Markdown postprocessor, after sanitizing (see rendering.py): the spans are
+# built here from escaped text, and the sanitizer never has to walk them.
+# Pygments tokens are emitted as highlight.js class names (hljs-keyword,
+# hljs-string, ...), so the github.css theme the pages already load styles
+# them, and the client skips blocks marked `hljs` instead of re-highlighting.
+#
+# Highlighted blocks are cached by (language, code hash): while a note is
+# being edited only the block under the cursor is lexed again. Pygments is
+# imported on the first highlighted block.
+import hashlib
+import os
+import re
+from functools import lru_cache
+from html import escape, unescape
+
+from ttlcache import TTLCache
+
+HIGHLIGHT_MAX = int(os.getenv("HIGHLIGHT_MAX", str(64 * 1024)))  # larger blocks are left to the client
+
+_cache = TTLCache(ttl=60 * 60, maxsize=4096, name="code_highlight")
+
+# fenced_code output (already sanitized): the body is escaped text, never "<"
+_BLOCK = re.compile(r'<pre><code class="language-([^"\s<>]+)">([^<]*)</code></pre>')
+
+# Pygments token type (by name, most specific first) -> highlight.js classes
+_CLASSES = {
+    "Comment.Preproc": "hljs-meta",
+    "Comment": "hljs-comment",
+    "Keyword.Constant": "hljs-literal",
+    "Keyword.Type": "hljs-type",
+    "Keyword": "hljs-keyword",
+    "Name.Builtin.Pseudo": "hljs-variable language_",
+    "Name.Builtin": "hljs-built_in",
+    "Name.Class": "hljs-title class_",
+    "Name.Function": "hljs-title function_",
+    "Name.Decorator": "hljs-meta",
+    "Name.Tag": "hljs-name",
+    "Name.Attribute": "hljs-attr",
+    "Name.Variable": "hljs-variable",
+    "Name.Constant": "hljs-variable constant_",
+    "Name.Exception": "hljs-title class_",
+    "Literal.String.Regex": "hljs-regexp",
+    "Literal.String.Escape": "hljs-char escape_",
+    "Literal.String.Interpol": "hljs-subst",
+    "Literal.String": "hljs-string",
+    "Literal.Number": "hljs-number",
+    "Literal": "hljs-literal",
+    "Operator.Word": "hljs-keyword",
+    "Generic.Deleted": "hljs-deletion",
+    "Generic.Inserted": "hljs-addition",
+    "Generic.Heading": "hljs-section",
+    "Generic.Subheading": "hljs-section",
+    "Generic.Emph": "hljs-emphasis",
+    "Generic.Strong": "hljs-strong",
+}
+
+@lru_cache(maxsize=None)
+def _css_class(ttype):
+    """hljs class for a Pygments token type, walking up to its parents."""
+    while ttype is not None:
+        name = str(ttype)[len("Token."):]
+        if name in _CLASSES:
+            return _CLASSES[name]
+        ttype = ttype.parent
+    return None
+
+@lru_cache(maxsize=256)
+def _lexer(lang: str):
+    """Pygments lexer for a fence language (aliases included), or None."""
+    from pygments.lexers import get_lexer_by_name
+    from pygments.util import ClassNotFound
+    try:
+        return get_lexer_by_name(lang, stripnl=False, ensurenl=False)
+    except ClassNotFound:
+        return None
+
+def highlight(lang: str, code: str):
+    """`code` as escaped HTML with hljs-classed spans, or None if `lang` is unknown."""
+    key = (lang, hashlib.sha1(code.encode("utf-8")).digest())
+    cached = _cache.get(key)
+    if cached is not None:
+        return cached
+    lexer = _lexer(lang.lower())
+    if lexer is None:
+        return None
+    out, run, run_class = [], [], None
+    for ttype, value in lexer.get_tokens(code):
+        css = _css_class(ttype)
+        if css != run_class and run:
+            text = escape("".join(run), quote=False)
+            out.append(f'<span class="{run_class}">{text}</span>' if run_class else text)
+            run = []
+        run_class = css
+        run.append(value)
+    if run:
+        text = escape("".join(run), quote=False)
+        out.append(f'<span class="{run_class}">{text}</span>' if run_class else text)
+    html = "".join(out)
+    _cache.set(key, html)
+    return html
+
+def _highlight_block(m):
+    lang, body = m.group(1), m.group(2)
+    if len(body) > HIGHLIGHT_MAX:
+        return m.group()
+    html = highlight(lang, unescape(body))
+    if html is None:
+        return m.group()
+    return f'<pre><code class="language-{lang} hljs">{html}</code></pre>'
+
+def highlight_code_blocks(html: str) -> str:
+    """Highlight every fenced block with a known language in rendered HTML."""
+    if "<pre><code class=" not in html:
+        return html
+    return _BLOCK.sub(_highlight_block, html)
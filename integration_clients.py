@@ -0,0 +1,369 @@
+# integration_clients.py
+# Remote data for the organizer (Google Calendar events, GitHub issues):
+# client construction and incremental change feeds. Calls run concurrently in
+# a thread pool with per-provider timeouts; integration_sync stores the results.
+# Built clients are kept per user in a bounded cache and share pooled HTTP
+# connections, so a call doesn't pay token parsing or a TLS handshake each time.
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from datetime import datetime, timedelta, timezone
+from functools import lru_cache
+
+import metrics
+from ttlcache import TTLCache
+
+# Optional: PyGithub + Google API client. Both (and requests) are imported on
+# first use so that importing the organizer stays cheap.
+@lru_cache(maxsize=1)
+def _github_cls():
+    try:
+        from github import Github
+        return Github
+    except Exception:
+        return None
+
+@lru_cache(maxsize=1)
+def _google():
+    """(Credentials, build, build_from_document, HttpError), or None if not installed."""
+    try:
+        from google.oauth2.credentials import Credentials
+        from googleapiclient.discovery import build, build_from_document
+        from googleapiclient.errors import HttpError
+        return Credentials, build, build_from_document, HttpError
+    except Exception:
+        return None
+
+log = logging.getLogger(__name__)
+
+FEED_TIMEOUTS = {"google": 20, "github": 20}  # seconds per provider call during a sync run
+FEED_TIMEOUT_DEFAULT = 20
+
+_pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix="feeds")
+
+HTTP_POOL_SIZE = 16  # keep-alive connections per host
+CLIENT_CACHE_TTL = 30 * 60  # seconds a built client is reused
+CLIENT_CACHE_SIZE = 256
+TOKEN_REFRESH_MARGIN = 5 * 60  # refresh tokens expiring within this many seconds
+GOOGLE_TOKEN_URI = "https://oauth2.googleapis.com/token"
+
+@lru_cache(maxsize=1)
+def http():
+    """Pooled requests session shared by every provider call in this process."""
+    import requests
+    from requests.adapters import HTTPAdapter
+    s = requests.Session()
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=HTTP_POOL_SIZE)
+    s.mount("https://", adapter)
+    s.mount("http://", adapter)
+    return s
+
+# ---------- TOKENS ----------
+@lru_cache(maxsize=CLIENT_CACHE_SIZE)
+def _parse_token(token_json):
+    return json.loads(token_json or "{}")
+
+def parse_token(token_json) -> dict:
+    """Token dict for a stored token_json; parsed once per distinct value. Don't mutate it."""
+    try:
+        return _parse_token(token_json)
+    except (TypeError, ValueError):
+        return {}
+
+def token_expires_soon(token: dict, margin=TOKEN_REFRESH_MARGIN, now=None) -> bool:
+    expires_at = (token or {}).get("expires_at")
+    if not expires_at:
+        return False
+    return float(expires_at) - (now or time.time()) < margin
+
+def refresh_google_token(token: dict) -> dict:
+    """Exchange the refresh token for a new access token. Raises on failure."""
+    refresh_token = token.get("refresh_token")
+    if not refresh_token:
+        raise ValueError("google token has no refresh_token")
+    start = time.perf_counter()
+    resp = http().post(token.get("token_uri") or GOOGLE_TOKEN_URI, data={
+        "grant_type": "refresh_token",
+        "refresh_token": refresh_token,
+        "client_id": token.get("client_id") or os.getenv("GOOGLE_CLIENT_ID"),
+        "client_secret": token.get("client_secret") or os.getenv("GOOGLE_CLIENT_SECRET"),
+    }, timeout=10)
+    metrics.REMOTE_CALL_SECONDS.observe(time.perf_counter() - start, provider="google_token",
+                                        outcome="ok" if resp.ok else "error")
+    resp.raise_for_status()
+    fresh = dict(token, **resp.json())
+    fresh["refresh_token"] = fresh.get("refresh_token") or refresh_token  # Google omits it on refresh
+    if "expires_in" in fresh:
+        fresh["expires_at"] = int(time.time()) + int(fresh["expires_in"])
+    return fresh
+
+# ---------- CLIENTS ----------
+@lru_cache(maxsize=1)
+def _calendar_discovery():
+    """Calendar v3 discovery document, parsed once per process."""
+    try:
+        from googleapiclient.discovery_cache import get_static_doc
+        doc = get_static_doc("calendar", "v3")
+        return json.loads(doc) if doc else None
+    except Exception:
+        return None
+
+def build_calendar(token: dict, update_token=None):
+    google = _google()
+    if google is None or not (token or {}).get("access_token"):
+        return None
+    Credentials, build, build_from_document, _ = google
+    # authlib stores a plain OAuth token; client id/secret come from the environment
+    kwargs = dict(
+        token=token["access_token"],
+        refresh_token=token.get("refresh_token"),
+        token_uri=token.get("token_uri") or GOOGLE_TOKEN_URI,
+        client_id=token.get("client_id") or os.getenv("GOOGLE_CLIENT_ID"),
+        client_secret=token.get("client_secret") or os.getenv("GOOGLE_CLIENT_SECRET"),
+    )
+    if token.get("expires_at"):
+        kwargs["expiry"] = datetime.utcfromtimestamp(float(token["expires_at"]))
+    if update_token is not None and token.get("refresh_token"):
+        # refresh through refresh_google_token and hand the result to the
+        # row-bound update_token hook (google-auth only calls refresh_handler
+        # when it holds no refresh token itself)
+        def refresh_handler(request, scopes=None):
+            fresh = refresh_google_token(token)
+            update_token(fresh, refresh_token=token.get("refresh_token"))
+            expiry = datetime.utcfromtimestamp(float(fresh["expires_at"])) if fresh.get("expires_at") else None
+            return fresh["access_token"], expiry
+        kwargs["refresh_token"] = None
+        kwargs["refresh_handler"] = refresh_handler
+    creds = Credentials(**kwargs)
+    doc = _calendar_discovery()
+    if doc is not None:
+        return build_from_document(doc, credentials=creds)
+    return build("calendar", "v3", credentials=creds, cache_discovery=False)
+
+def build_github(token: dict, update_token=None):
+    access_token = (token or {}).get("access_token")
+    Github = _github_cls()
+    if Github is None or not access_token:
+        return None
+    try:
+        return Github(access_token, pool_size=HTTP_POOL_SIZE)
+    except TypeError:  # PyGithub without pool_size
+        return Github(access_token)
+
+BUILDERS = {"google": build_calendar, "github": build_github}
+
+class ClientManager:
+    """
+    Built API clients per (owner, provider), reused while the access token is
+    unchanged. Bounded LRU with a TTL; a new token (refresh, reconnect) builds
+    a new client. Google service objects use httplib2, which is not
+    thread-safe: share one only between calls for the same user that don't overlap
+    (the sync runs one job per integration at a time).
+
+    `update_token(token, refresh_token=None)` is bound by the caller to one
+    Integration row; a client that refreshes its own token persists it
+    through that hook, straight to the row.
+    """
+
+    def __init__(self, ttl=CLIENT_CACHE_TTL, maxsize=CLIENT_CACHE_SIZE):
+        self._cache = TTLCache(ttl=ttl, maxsize=maxsize, name="integration_clients")
+
+    def get(self, owner_id, provider, token: dict, update_token=None):
+        stamp = (token or {}).get("access_token")
+        if not stamp:
+            return None
+        key = (owner_id, provider)
+        hit = self._cache.get(key)
+        if hit is not None and hit[0] == stamp:
+            return hit[1]
+        client = BUILDERS[provider](token, update_token=update_token)
+        if client is not None:
+            self._cache.set(key, (stamp, client))
+        return client
+
+    def forget(self, owner_id, provider=None):
+        for key in self._cache.keys():
+            if key[0] == owner_id and provider in (None, key[1]):
+                self._cache.pop(key)
+
+clients = ClientManager()
+
+# ---------- PROVIDERS ----------
+# Each provider returns incremental changes: {"items": [...], "cursor": {...},
+# "full": bool}. `cursor` is persisted on the Integration row and handed back on
+# the next call; "full" means items is the complete set (initial or reset sync).
+# `update_token` is the row-bound refresh hook handed to ClientManager.get().
+
+GITHUB_API = "https://api.github.com"
+GOOGLE_SYNC_PAST_DAYS = 30  # how far back an initial calendar sync reaches
+
+def _utc_naive(value):
+    """RFC 3339 / ISO date string -> naive UTC datetime (the organizer's convention)."""
+    if not value:
+        return None
+    d = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    if d.tzinfo is not None:
+        d = d.astimezone(timezone.utc).replace(tzinfo=None)
+    return d
+
+class GoogleCalendarFeed:
+    name = "google"
+
+    def changes(self, owner_id, token, cursor, update_token=None):
+        service = clients.get(owner_id, "google", token, update_token=update_token)
+        if service is None:
+            return {"items": [], "cursor": cursor, "full": False}
+        params = {"calendarId": "primary", "singleEvents": True, "maxResults": 250}
+        full = not cursor.get("sync_token")
+        if full:
+            since = datetime.utcnow() - timedelta(days=GOOGLE_SYNC_PAST_DAYS)
+            params["timeMin"] = since.isoformat() + "Z"
+        else:
+            params["syncToken"] = cursor["sync_token"]
+        items = []
+        while True:
+            try:
+                resp = service.events().list(**params).execute()
+            except _google()[3] as ex:
+                if ex.resp.status == 410 and not full:
+                    # sync token expired: start over with a full sync
+                    return self.changes(owner_id, token, {}, update_token)
+                raise
+            items.extend(resp.get("items", []))
+            if not resp.get("nextPageToken"):
+                break
+            params["pageToken"] = resp["nextPageToken"]
+        return {
+            "items": [self._event(e) for e in items],
+            "cursor": {"sync_token": resp.get("nextSyncToken")},
+            "full": full,
+        }
+
+    @staticmethod
+    def _event(e):
+        start, end = e.get("start", {}), e.get("end", {})
+        return {
+            "id": e["id"],
+            "summary": e.get("summary"),
+            "start": _utc_naive(start.get("dateTime") or start.get("date")),
+            "end": _utc_naive(end.get("dateTime") or end.get("date")),
+            "all_day": "date" in start and "dateTime" not in start,
+            "cancelled": e.get("status") == "cancelled",
+        }
+
+class GitHubFeed:
+    name = "github"
+
+    def changes(self, owner_id, token, cursor, update_token=None):
+        access_token = (token or {}).get("access_token")
+        if not access_token:
+            return {"items": [], "cursor": cursor, "full": False}
+        headers = {"Authorization": f"Bearer {access_token}", "Accept": "application/vnd.github+json"}
+        since = cursor.get("since")
+        params = {"filter": "assigned", "state": "all" if since else "open", "per_page": 100}
+        if since:
+            params["since"] = since
+        if cursor.get("etag"):
+            headers["If-None-Match"] = cursor["etag"]
+        resp = http().get(f"{GITHUB_API}/issues", params=params, headers=headers, timeout=10)
+        if resp.status_code == 304:
+            # nothing changed; conditional requests don't count against the rate limit
+            return {"items": [], "cursor": cursor, "full": False}
+        resp.raise_for_status()
+        etag = resp.headers.get("ETag")
+        raw = resp.json()
+        while "next" in resp.links:
+            resp = http().get(resp.links["next"]["url"], headers={"Authorization": headers["Authorization"]}, timeout=10)
+            resp.raise_for_status()
+            raw.extend(resp.json())
+        items = [
+            {
+                "id": str(i["id"]),
+                "title": i.get("title") or "",
+                "html_url": i.get("html_url"),
+                "repo": (i.get("repository") or {}).get("full_name"),
+                "state": i.get("state"),
+                "updated_at": i.get("updated_at"),
+            }
+            for i in raw
+        ]
+        newest = max([i["updated_at"] for i in items if i["updated_at"]] + ([since] if since else []), default=None)
+        return {"items": items, "cursor": {"since": newest, "etag": etag}, "full": not since}
+
+class LocalFeed:
+    """
+    In-process stand-in for a provider (tests, offline development). Items are
+    set per owner in the provider's normalized shape and always returned as a
+    full sync; `delay` simulates a slow remote.
+    """
+    needs_token = False
+
+    def __init__(self, name, items=None, delay=0.0):
+        self.name = name
+        self.items = dict(items or {})
+        self.delay = delay
+        self.calls = 0
+
+    def changes(self, owner_id, token, cursor, update_token=None):
+        self.calls += 1
+        if self.delay:
+            threading.Event().wait(self.delay)
+        return {"items": list(self.items.get(owner_id, [])), "cursor": {}, "full": True}
+
+FEEDS = {"google": GoogleCalendarFeed(), "github": GitHubFeed()}
+if os.getenv("ORGANIZER_LOCAL_FEEDS") == "1":
+    FEEDS = {"google": LocalFeed("google"), "github": LocalFeed("github")}
+
+def set_feed(name, feed):
+    """Swap a provider, e.g. for a LocalFeed."""
+    FEEDS[name] = feed
+
+def tokens_for(integrations):
+    """{provider: token dict} from Integration rows; GITHUB_TOKEN env is the dev fallback."""
+    tokens = {}
+    for integ in integrations:
+        token = parse_token(integ.token_json)
+        if token:
+            tokens[integ.provider] = token
+    if "github" not in tokens and os.getenv("GITHUB_TOKEN"):
+        tokens["github"] = {"access_token": os.getenv("GITHUB_TOKEN")}
+    return tokens
+
+# ---------- CONCURRENT FETCH ----------
+def _timed_changes(provider, owner_id, token, cursor, update_token):
+    start = time.perf_counter()
+    outcome = "error"
+    try:
+        result = FEEDS[provider].changes(owner_id, token, cursor, update_token)
+        outcome = "ok"
+        return result
+    finally:
+        metrics.REMOTE_CALL_SECONDS.observe(time.perf_counter() - start, provider=provider, outcome=outcome)
+
+def fetch_changes(jobs):
+    """
+    jobs: [(job_id, provider, owner_id, token, cursor, update_token)]. Runs
+    every provider call concurrently; each gets FEED_TIMEOUTS[provider] from a shared start.
+    Returns {job_id: result dict or Exception}. Timed-out calls keep running
+    but their result is dropped, so the stored cursor does not advance.
+    """
+    futures = {
+        job_id: (provider, _pool.submit(_timed_changes, provider, owner_id, token, cursor, update_token))
+        for job_id, provider, owner_id, token, cursor, update_token in jobs
+    }
+    started = time.monotonic()
+    results = {}
+    for job_id, (provider, fut) in futures.items():
+        remaining = started + FEED_TIMEOUTS.get(provider, FEED_TIMEOUT_DEFAULT) - time.monotonic()
+        try:
+            results[job_id] = fut.result(timeout=max(0.0, remaining))
+        except FutureTimeout:
+            log.info("sync: %s timed out (job %s)", provider, job_id)
+            results[job_id] = TimeoutError(f"{provider} timed out")
+        except Exception as ex:
+            log.warning("sync: %s failed (job %s): %s", provider, job_id, ex)
+            results[job_id] = ex
+    return results
@@ -0,0 +1,261 @@
+# integration_sync.py
+# Background sync of Integration rows into local tables. GitHub issues become
+# Tasks keyed by external_id, Google Calendar events land in org_events. Each
+# row keeps an incremental cursor (GitHub since/ETag, Google syncToken), so a
+# run only transfers what changed. Organizer pages read the local tables only.
+# The worker also refreshes OAuth tokens shortly before they expire.
+import json
+import logging
+import os
+import threading
+from datetime import datetime, timedelta
+
+import click
+from flask import current_app
+from sqlalchemy import and_, insert, or_
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from extensions import db
+from organizer import organizer_bp, Integration, OrgEvent, Task, invalidate_widgets
+import integration_clients
+
+log = logging.getLogger(__name__)
+
+SYNC_INTERVAL = int(os.getenv("ORGANIZER_SYNC_INTERVAL", "300"))  # seconds between syncs of one row
+SYNC_POLL = 30  # how often the worker looks for due rows
+SYNC_BACKOFF_MAX = int(os.getenv("ORGANIZER_SYNC_BACKOFF_MAX", str(6 * 3600)))  # seconds
+IN_CHUNK = 500
+
+def _chunks(seq, n=IN_CHUNK):
+    seq = list(seq)
+    for i in range(0, len(seq), n):
+        yield seq[i:i + n]
+
+# ---------- APPLY ----------
+def apply_github(owner_id, items, full):
+    """Batch-upsert issues as tasks. Closed issues mark their task done."""
+    by_ext = {f"github:{i['id']}": i for i in items}
+    existing = {}
+    for chunk in _chunks(by_ext):
+        for t in Task.query.filter(Task.owner_id == owner_id, Task.external_id.in_(chunk)):
+            existing[t.external_id] = t
+    # adopt tasks imported by title before tasks had external ids
+    legacy = {f"[GH] {i['title']}": eid for eid, i in by_ext.items() if eid not in existing}
+    for chunk in _chunks(legacy):
+        for t in Task.query.filter(Task.owner_id == owner_id, Task.external_id.is_(None), Task.title.in_(chunk)):
+            eid = legacy[t.title]
+            if eid not in existing:
+                t.external_id = eid
+                existing[eid] = t
+
+    new_rows = []
+    for eid, i in by_ext.items():
+        title = f"[GH] {i['title']}"
+        closed = i.get("state") == "closed"
+        t = existing.get(eid)
+        if t is None:
+            if not closed:
+                new_rows.append(dict(owner_id=owner_id, title=title, description=i.get("html_url"),
+                                     priority=2, status="todo", external_id=eid))
+            continue
+        t.title = title
+        t.description = i.get("html_url") or t.description
+        if closed and t.status != "done":
+            t.status = "done"
+    if new_rows:
+        db.session.execute(insert(Task), new_rows)
+    return len(items)
+
+def apply_google(owner_id, items, full):
+    """Mirror events into org_events; a full sync replaces the owner's events."""
+    if full:
+        OrgEvent.query.filter_by(owner_id=owner_id, provider="google").delete()
+    gone = [e["id"] for e in items if e.get("cancelled")]
+    for chunk in _chunks(gone):
+        OrgEvent.query.filter(OrgEvent.owner_id == owner_id, OrgEvent.provider == "google",
+                              OrgEvent.external_id.in_(chunk)).delete(synchronize_session=False)
+    now = datetime.utcnow()
+    rows = [
+        dict(owner_id=owner_id, provider="google", external_id=e["id"], summary=e.get("summary"),
+             start_at=e.get("start"), end_at=e.get("end") or e.get("start"),  # no end: a point in time
+             all_day=bool(e.get("all_day")), updated_at=now)
+        for e in items if not e.get("cancelled")
+    ]
+    if rows:
+        stmt = sqlite_insert(OrgEvent)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["owner_id", "provider", "external_id"],
+            set_={c: stmt.excluded[c] for c in ("summary", "start_at", "end_at", "all_day", "updated_at")},
+        )
+        db.session.execute(stmt, rows)
+    return len(items)
+
+APPLY = {"github": apply_github, "google": apply_google}
+
+def record_failure(integ, error, now=None):
+    """Store the error and back off: SYNC_INTERVAL doubled per consecutive failure, capped."""
+    now = now or datetime.utcnow()
+    integ.sync_error = str(error)[:1000] or type(error).__name__
+    integ.sync_failures = (integ.sync_failures or 0) + 1
+    delay = min(SYNC_INTERVAL * 2 ** (integ.sync_failures - 1), SYNC_BACKOFF_MAX)
+    integ.sync_retry_at = now + timedelta(seconds=delay)
+    db.session.commit()
+    return integ.sync_error
+
+def _backing_off(integ, now):
+    return integ.sync_retry_at is not None and integ.sync_retry_at > now
+
+# ---------- TOKENS ----------
+REFRESH = {"google": integration_clients.refresh_google_token}
+
+def save_token(integ, token):
+    """Persist a (refreshed) token on its row; needs an app context, not a request."""
+    integ.token_json = json.dumps(token)
+    integ.refreshed_at = datetime.utcnow()
+    db.session.commit()
+    integration_clients.clients.forget(integ.owner_id, integ.provider)
+
+def save_refreshed_token(integration_id, token, refresh_token=None):
+    """Persist a token a client refreshed by itself on its row (primary key lookup). Returns the row or None."""
+    integ = db.session.get(Integration, integration_id)
+    if integ is None:
+        log.warning("token refresh: integration %s no longer exists", integration_id)
+        return None
+    if refresh_token and not token.get("refresh_token"):
+        token = dict(token, refresh_token=refresh_token)
+    save_token(integ, token)
+    return integ
+
+def token_saver(integration_id):
+    """update_token hook bound to one row; usable from the fetch pool threads."""
+    app = current_app._get_current_object()
+    def update_token(token, refresh_token=None):
+        with app.app_context():
+            save_refreshed_token(integration_id, token, refresh_token=refresh_token)
+    return update_token
+
+def refresh_expiring_tokens(now=None):
+    """Refresh every token that expires within TOKEN_REFRESH_MARGIN. Returns {id: "ok" or error}."""
+    outcome = {}
+    now = now or datetime.utcnow()
+    for integ in Integration.query.filter(Integration.provider.in_(list(REFRESH))).all():
+        if _backing_off(integ, now):
+            continue
+        token = integration_clients.parse_token(integ.token_json)
+        if not token.get("refresh_token") or not integration_clients.token_expires_soon(token, now=now):
+            continue
+        try:
+            save_token(integ, REFRESH[integ.provider](token))
+            outcome[integ.id] = "ok"
+        except Exception as ex:
+            db.session.rollback()
+            log.warning("token refresh failed for %s integration %s: %s", integ.provider, integ.id, ex)
+            outcome[integ.id] = record_failure(integ, f"token refresh failed: {ex}", now)
+    return outcome
+
+# ---------- SYNC ----------
+def sync_integrations(integrations):
+    """
+    Fetch changes for every row concurrently (see integration_clients.fetch_changes),
+    then store them one row per transaction. Returns {integration id: count or error}.
+    """
+    integrations = [i for i in integrations if i.provider in APPLY]
+    jobs = []
+    for integ in integrations:
+        try:
+            cursor = json.loads(integ.sync_cursor or "{}")
+        except ValueError:
+            cursor = {}
+        token = integration_clients.tokens_for([integ]).get(integ.provider)
+        jobs.append((integ.id, integ.provider, integ.owner_id, token, cursor, token_saver(integ.id)))
+    results = integration_clients.fetch_changes(jobs)
+
+    summary = {}
+    for integ in integrations:
+        res = results[integ.id]
+        if not isinstance(res, Exception):
+            try:
+                summary[integ.id] = APPLY[integ.provider](integ.owner_id, res["items"], res["full"])
+                integ.sync_cursor = json.dumps(res["cursor"])
+                integ.synced_at = datetime.utcnow()
+                integ.sync_error = None
+                integ.sync_failures = 0
+                integ.sync_retry_at = None
+                db.session.commit()
+                invalidate_widgets(integ.owner_id)
+                continue
+            except Exception as ex:
+                db.session.rollback()
+                log.exception("sync: storing %s for owner %s failed", integ.provider, integ.owner_id)
+                res = ex
+        summary[integ.id] = record_failure(integ, res)
+    return summary
+
+def due_integrations(now=None, owner_ids=()):
+    """
+    Rows not synced within SYNC_INTERVAL and not backing off after a failure,
+    plus every row of `owner_ids` (an explicit request skips the backoff).
+    """
+    now = now or datetime.utcnow()
+    cutoff = now - timedelta(seconds=SYNC_INTERVAL)
+    cond = and_(or_(Integration.synced_at.is_(None), Integration.synced_at <= cutoff),
+                or_(Integration.sync_retry_at.is_(None), Integration.sync_retry_at <= now))
+    if owner_ids:
+        cond = or_(cond, Integration.owner_id.in_(list(owner_ids)))
+    return Integration.query.filter(Integration.provider.in_(list(APPLY))).filter(cond).all()
+
+class SyncWorker(threading.Thread):
+    """Daemon thread that syncs due integrations every SYNC_POLL seconds, or when woken."""
+
+    def __init__(self, app, poll=SYNC_POLL):
+        super().__init__(name="integration-sync", daemon=True)
+        self.app = app
+        self.poll = poll
+        self._wake = threading.Event()
+        self._pending = set()
+        self._lock = threading.Lock()
+
+    def request(self, owner_id):
+        with self._lock:
+            self._pending.add(owner_id)
+        self._wake.set()
+
+    def run(self):
+        while True:
+            self._wake.wait(self.poll)
+            self._wake.clear()
+            with self._lock:
+                owners, self._pending = self._pending, set()
+            try:
+                with self.app.app_context():
+                    refresh_expiring_tokens()
+                    sync_integrations(due_integrations(owner_ids=owners))
+            except Exception:
+                log.exception("sync: run failed")
+
+_worker = None
+
+def start_sync_worker(app):
+    """Start the background worker once per process (call from the server entry point)."""
+    global _worker
+    if _worker is None:
+        _worker = SyncWorker(app)
+        _worker.start()
+    return _worker
+
+def request_sync(owner_id):
+    """Ask the worker to sync this user's integrations now. False if no worker runs here."""
+    if _worker is None:
+        return False
+    _worker.request(owner_id)
+    return True
+
+@organizer_bp.cli.command("sync")
+@click.option("--all", "sync_all", is_flag=True, help="Sync every integration, not only the due ones.")
+def sync_command(sync_all):
+    """Run one integration sync pass (for cron, or when no worker thread runs)."""
+    for integ_id, outcome in refresh_expiring_tokens().items():
+        click.echo(f"integration {integ_id}: token refresh {outcome}")
+    rows = Integration.query.all() if sync_all else due_integrations()
+    for integ_id, outcome in sync_integrations(rows).items():
+        click.echo(f"integration {integ_id}: {outcome}")
@@ -1,19 +1,32 @@
 # integrations.py
 import os, json
 from datetime import datetime
-from flask import Blueprint, redirect, url_for, render_template, flash
+from flask import Blueprint, redirect, url_for, render_template, flash, current_app
 from flask_login import login_required, current_user
-from authlib.integrations.flask_client import OAuth
 from extensions import db
-from organizer import Integration  # your model
+from organizer import Integration, OrgEvent  # your model
+import integration_clients
+from integration_sync import request_sync
 
 integrations_bp = Blueprint("integrations", __name__, template_folder="templates")
-oauth = OAuth()  # NOTE: no app bound here yet
+OAUTH_EXT = "integrations.oauth"
 
 def init_oauth(app):
-    """Call this from app.py after creating the Flask app."""
-    oauth.init_app(app)
+    """Set up OAuth eagerly. Optional: get_oauth() does it on the first OAuth request."""
+    with app.app_context():
+        get_oauth()
 
+def get_oauth():
+    """The app's authlib registry; authlib is imported and providers registered on first use."""
+    oauth = current_app.extensions.get(OAUTH_EXT)
+    if oauth is None:
+        from authlib.integrations.flask_client import OAuth
+        oauth = OAuth(current_app)
+        _register_providers(oauth)
+        current_app.extensions[OAUTH_EXT] = oauth
+    return oauth
+
+def _register_providers(oauth):
     # ---- GitHub OAuth ----
     oauth.register(
         name="github",
@@ -42,20 +55,10 @@ def init_oauth(app):
             "access_type": "offline",
             "include_granted_scopes": "true",
         },
-        # Persist refreshed tokens automatically:
-        update_token=lambda token, refresh_token=None, access_token=None: _save_google_token(token),
+        # Refreshed tokens are persisted per row by the clients integration_sync
+        # builds (see integration_sync.token_saver), not by a registry-wide hook.
     )
 
-def _save_google_token(token):
-    try:
-        entry = Integration.query.filter_by(owner_id=current_user.id, provider="google").first()
-        if entry:
-            entry.token_json = json.dumps(token)
-            entry.refreshed_at = datetime.utcnow()
-            db.session.commit()
-    except Exception:
-        pass  # avoid failing the request on token update path
-
 # --------- Views (unchanged from before) ---------
 @integrations_bp.route("/settings/connections")
 @login_required
@@ -67,12 +70,12 @@ def connections():
 @integrations_bp.route("/auth/github")
 @login_required
 def auth_github():
-    return oauth.github.authorize_redirect(url_for("integrations.auth_github_callback", _external=True))
+    return get_oauth().github.authorize_redirect(url_for("integrations.auth_github_callback", _external=True))
 
 @integrations_bp.route("/auth/github/callback")
 @login_required
 def auth_github_callback():
-    token = oauth.github.authorize_access_token()
+    token = get_oauth().github.authorize_access_token()
     if not token or "access_token" not in token:
         flash("GitHub authorization failed", "warning")
         return redirect(url_for("integrations.connections"))
@@ -90,12 +93,12 @@ def auth_github_disconnect():
 @integrations_bp.route("/auth/google")
 @login_required
 def auth_google():
-    return oauth.google.authorize_redirect(url_for("integrations.auth_google_callback", _external=True))
+    return get_oauth().google.authorize_redirect(url_for("integrations.auth_google_callback", _external=True))
 
 @integrations_bp.route("/auth/google/callback")
 @login_required
 def auth_google_callback():
-    token = oauth.google.authorize_access_token()
+    token = get_oauth().google.authorize_access_token()
     if not token or "access_token" not in token:
         flash("Google authorization failed", "warning")
         return redirect(url_for("integrations.connections"))
@@ -118,9 +121,14 @@ def _upsert_token(provider, token):
     entry.token_json = json.dumps(token)
     entry.refreshed_at = datetime.utcnow()
     db.session.commit()
+    integration_clients.clients.forget(current_user.id, provider)
+    request_sync(current_user.id)
 
 def _delete_token(provider):
     entry = Integration.query.filter_by(owner_id=current_user.id, provider=provider).first()
     if entry:
         db.session.delete(entry)
+        if provider == "google":
+            OrgEvent.query.filter_by(owner_id=current_user.id, provider="google").delete()
         db.session.commit()
+        integration_clients.clients.forget(current_user.id, provider)
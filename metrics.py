@@ -0,0 +1,301 @@
+# metrics.py
+# In-process counters, gauges and histograms, exposed in the Prometheus text
+# format at /metrics. Recording a sample is a bisect plus two additions under
+# a per-metric lock (about a microsecond), so this stays on in production.
+# Numbers are per process; with several workers, scrape each one.
+#
+#   init_app(app)        request latency + per-request DB query counts, /metrics
+#   track_event          decorator for Socket.IO handlers (time + DB queries)
+#   timed("op")          decorator -> operation_duration_seconds{op}
+#   waited(lock, "name") acquire a lock, recording how long the wait took
+import contextvars
+import hmac
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from functools import wraps
+
+import sqlprofile
+import ttlcache
+
+DEFAULT_BUCKETS = (.001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10, 30)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 250, 1000)
+
+_registry = []
+
+def _fmt_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    esc = lambda v: str(v).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+    return "{" + ",".join(f'{k}="{esc(v)}"' for k, v in pairs) + "}"
+
+def _fmt_num(v):
+    if v == float("inf"):
+        return "+Inf"
+    return repr(float(v)) if isinstance(v, float) else str(v)
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def _key(self, labels):
+        return tuple(labels.get(n, "") for n in self.labels)
+
+    def header(self):
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name, help, labels=()):
+        super().__init__(name, help, labels)
+        self._values = {}
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            items = list(self._values.items())
+        return [f"{self.name}{_fmt_labels(self.labels, k)} {_fmt_num(v)}" for k, v in items]
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+class Collected(_Metric):
+    """Computed on scrape: fn() returns {label values tuple: value}."""
+
+    def __init__(self, name, help, labels, fn, kind="gauge"):
+        super().__init__(name, help, labels)
+        self.fn = fn
+        self.kind = kind
+
+    def samples(self):
+        return [f"{self.name}{_fmt_labels(self.labels, k)} {_fmt_num(v)}" for k, v in self.fn().items()]
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}  # label values -> [bucket counts..., +Inf count, sum]
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        i = bisect_left(self.buckets, value)
+        with self._lock:
+            s = self._series.get(key)
+            if s is None:
+                s = self._series[key] = [0] * (len(self.buckets) + 2)
+            s[i] += 1
+            s[-1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def samples(self):
+        with self._lock:
+            items = [(k, list(s)) for k, s in self._series.items()]
+        out = []
+        for key, s in items:
+            cumulative = 0
+            for bound, n in zip(self.buckets + (float("inf"),), s[:-1]):
+                cumulative += n
+                out.append(f"{self.name}_bucket{_fmt_labels(self.labels, key, [('le', _fmt_num(bound))])} {cumulative}")
+            out.append(f"{self.name}_sum{_fmt_labels(self.labels, key)} {s[-1]!r}")
+            out.append(f"{self.name}_count{_fmt_labels(self.labels, key)} {cumulative}")
+        return out
+
+def render() -> str:
+    lines = []
+    for m in list(_registry):
+        lines.extend(m.header())
+        lines.extend(m.samples())
+    return "\n".join(lines) + "\n"
+
+# ---------- app metrics ----------
+REQUEST_SECONDS = Histogram("http_request_duration_seconds", "HTTP request latency.",
+                            ["method", "endpoint", "status"])
+REQUEST_QUERIES = Histogram("http_request_db_queries", "SQL statements executed per HTTP request.",
+                            ["endpoint"], buckets=COUNT_BUCKETS)
+EVENT_SECONDS = Histogram("socketio_event_duration_seconds", "Socket.IO event handling time.", ["event"])
+EVENT_QUERIES = Histogram("socketio_event_db_queries", "SQL statements executed per Socket.IO event.",
+                          ["event"], buckets=COUNT_BUCKETS)
+SOCKET_CONNECTIONS = Gauge("socketio_connections", "Open Socket.IO connections.")
+DB_QUERIES = Counter("db_queries_total", "SQL statements executed.", ["database"])
+DB_QUERY_SECONDS = Histogram("db_query_duration_seconds", "SQL statement execution time.", ["database"])
+DB_COMMIT_SECONDS = Histogram("db_commit_duration_seconds", "Session commit time, flush included.")
+LOCK_WAIT_SECONDS = Histogram("lock_wait_seconds", "Time spent waiting for an in-process lock.", ["lock"])
+OPERATION_SECONDS = Histogram("operation_duration_seconds", "Duration of instrumented hot-path functions.", ["op"])
+REMOTE_CALL_SECONDS = Histogram("remote_call_duration_seconds", "Calls to external APIs.", ["provider", "outcome"])
+EXPORT_SECONDS = Histogram("export_duration_seconds", "Export rendering time, queue wait included.",
+                           ["format", "status"])
+EXPORT_REQUESTS = Counter("export_requests_total", "Export submissions by outcome.", ["format", "result"])
+RENDER_REQUESTS = Counter("render_requests_total",
+                          "Markdown renders by outcome (inline, pool, superseded, timeout, too_large, error).", ["outcome"])
+
+def _cache_stats(attr):
+    return lambda: {(name,): (len(c) if attr == "size" else getattr(c, attr)) for name, c in ttlcache.CACHES.items()}
+
+Collected("cache_hits_total", "Hits on named in-process caches.", ["cache"], _cache_stats("hits"), kind="counter")
+Collected("cache_misses_total", "Misses on named in-process caches.", ["cache"], _cache_stats("misses"), kind="counter")
+Collected("cache_entries", "Entries held by named in-process caches.", ["cache"], _cache_stats("size"))
+
+# ---------- helpers ----------
+def timed(op):
+    """Decorator recording the call's duration as operation_duration_seconds{op=...}."""
+    def deco(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                OPERATION_SECONDS.observe(time.perf_counter() - start, op=op)
+        return wrapper
+    return deco
+
+@contextmanager
+def waited(lock, name):
+    """`with waited(save_lock, "save_lock"):` -- like `with save_lock:`, plus the wait time."""
+    start = time.perf_counter()
+    with lock:
+        LOCK_WAIT_SECONDS.observe(time.perf_counter() - start, lock=name)
+        yield
+
+# Per request / event SQL statement counter; None outside a scope.
+_queries = contextvars.ContextVar("metrics_queries", default=None)
+
+@contextmanager
+def query_scope():
+    """Count SQL statements executed in this block; yields a one-item list holding the count."""
+    counter = [0]
+    token = _queries.set(counter)
+    try:
+        yield counter
+    finally:
+        _queries.reset(token)
+
+def track_event(fn):
+    """Put under @socketio.on(...): time the handler and count (and, if enabled, profile) its queries."""
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        from flask import request
+        event = (getattr(request, "event", None) or {}).get("message") or fn.__name__
+        start = time.perf_counter()
+        with query_scope() as counter, sqlprofile.scope(f"socket {event}"):
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                EVENT_SECONDS.observe(time.perf_counter() - start, event=event)
+                EVENT_QUERIES.observe(counter[0], event=event)
+    return wrapper
+
+# ---------- SQLAlchemy hooks (every engine and session in the process) ----------
+_db_names = {}
+
+def _db_name(engine):
+    name = _db_names.get(engine.url)
+    if name is None:
+        name = _db_names[engine.url] = os.path.basename(engine.url.database or "") or engine.url.drivername
+    return name
+
+def _before_execute(conn, cursor, statement, parameters, context, executemany):
+    context._metrics_start = time.perf_counter()
+
+def _after_execute(conn, cursor, statement, parameters, context, executemany):
+    name = _db_name(conn.engine)
+    DB_QUERY_SECONDS.observe(time.perf_counter() - context._metrics_start, database=name)
+    DB_QUERIES.inc(database=name)
+    counter = _queries.get()
+    if counter is not None:
+        counter[0] += 1
+
+def _before_commit(session):
+    session.info["metrics_commit_start"] = time.perf_counter()
+
+def _after_commit(session):
+    start = session.info.pop("metrics_commit_start", None)
+    if start is not None:
+        DB_COMMIT_SECONDS.observe(time.perf_counter() - start)
+
+_hooked = False
+
+def install_db_hooks():
+    global _hooked
+    if _hooked:
+        return
+    from sqlalchemy import event
+    from sqlalchemy.engine import Engine
+    from sqlalchemy.orm import Session
+    event.listen(Engine, "before_cursor_execute", _before_execute)
+    event.listen(Engine, "after_cursor_execute", _after_execute)
+    event.listen(Session, "before_commit", _before_commit)
+    event.listen(Session, "after_commit", _after_commit)
+    _hooked = True
+
+# ---------- Flask ----------
+def init_app(app):
+    """Request timing + query counts, DB hooks and the /metrics endpoint (METRICS_TOKEN guards it)."""
+    from flask import Response, abort, g, request
+
+    install_db_hooks()
+
+    @app.before_request
+    def _start_request():
+        counter = [0]
+        g._metrics = (time.perf_counter(), counter, _queries.set(counter))
+
+    @app.teardown_request
+    def _finish_request(exc):
+        started = g.pop("_metrics", None)
+        if started is None:
+            return
+        start, counter, token = started
+        try:
+            _queries.reset(token)
+        except ValueError:  # teardown ran in another context (streamed response)
+            pass
+        endpoint = request.endpoint or "unmatched"
+        status = getattr(g, "_metrics_status", 500 if exc else 200)
+        REQUEST_SECONDS.observe(time.perf_counter() - start, method=request.method, endpoint=endpoint, status=status)
+        REQUEST_QUERIES.observe(counter[0], endpoint=endpoint)
+
+    @app.after_request
+    def _record_status(response):
+        g._metrics_status = response.status_code
+        return response
+
+    def metrics_view():
+        expected = app.config.get("METRICS_TOKEN")
+        if expected:
+            given = request.headers.get("Authorization", "").removeprefix("Bearer ").strip()
+            if not hmac.compare_digest(given, expected):
+                abort(401)
+        return Response(render(), mimetype="text/plain; version=0.0.4")
+
+    app.add_url_rule("/metrics", "metrics", metrics_view)
@@ -4,24 +4,14 @@ import json
 import os
 from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify, current_app
 from flask_login import login_required, current_user
-from sqlalchemy.orm import joinedload
+from sqlalchemy import Integer, case, cast, event, func, insert, or_
+from sqlalchemy.orm import joinedload, selectinload
 
 # If your app exposes these:
 # from app import db, requires_oauth  # adjust as needed
 from extensions import db
 
-# Optional: PyGithub + Google API client
-try:
-    from github import Github
-except Exception:
-    Github = None
-
-try:
-    from google.oauth2.credentials import Credentials
-    from googleapiclient.discovery import build
-except Exception:
-    Credentials = None
-    build = None
+from ttlcache import TTLCache
 
 organizer_bp = Blueprint("organizer", __name__, template_folder="templates")
 
@@ -51,10 +41,72 @@ class Task(db.Model):
     due_date = db.Column(db.DateTime)
     estimate_minutes = db.Column(db.Integer)  # rough estimate
     time_spent_minutes = db.Column(db.Integer, default=0)
-    labels = db.Column(db.Text)  # CSV or JSON
+    labels = db.Column(db.Text)  # CSV or JSON as entered; org_task_labels holds the parsed names
+    external_id = db.Column(db.String(128))  # e.g. "github:<issue id>" for synced tasks
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
+    label_rows = db.relationship("TaskLabel", backref="task", cascade="all, delete-orphan")
+
+    __table_args__ = (
+        db.Index("ix_org_tasks_owner_status_due", "owner_id", "status", "due_date"),
+        db.Index("ix_org_tasks_owner_priority", "owner_id", "priority"),
+        db.Index("ix_org_tasks_owner_project", "owner_id", "project_id"),
+        db.Index("ux_org_tasks_owner_external", "owner_id", "external_id", unique=True),
+    )
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "project_id": self.project_id,
+            "title": self.title,
+            "description": self.description,
+            "priority": self.priority,
+            "status": self.status,
+            "due": self.due_date.strftime("%Y-%m-%d") if self.due_date else None,
+            "estimate_minutes": self.estimate_minutes,
+            "time_spent_minutes": self.time_spent_minutes,
+            "labels": self.labels,
+        }
+
+    @db.validates("labels")
+    def _sync_label_rows(self, key, value):
+        # keep rows whose name survives so (task_id, name) is never deleted and re-inserted
+        existing = {r.name: r for r in self.label_rows}
+        self.label_rows = [existing.get(n) or TaskLabel(name=n, owner_id=self.owner_id) for n in parse_labels(value)]
+        return value
+
+class TaskLabel(db.Model):
+    """One row per (task, label); filters and counts use the owner/name index."""
+    __tablename__ = "org_task_labels"
+    task_id = db.Column(db.Integer, db.ForeignKey("org_tasks.id", ondelete="CASCADE"), primary_key=True)
+    name = db.Column(db.String(64), primary_key=True)
+    owner_id = db.Column(db.Integer)
+
+    __table_args__ = (
+        db.Index("ix_org_task_labels_owner_name", "owner_id", "name", "task_id"),
+    )
+
+@event.listens_for(TaskLabel, "before_insert")
+def _label_owner(mapper, connection, target):
+    if target.owner_id is None and target.task is not None:
+        target.owner_id = target.task.owner_id
+
+LABEL_MAX = 64
+
+def parse_labels(raw):
+    """Label names from the free-form CSV or JSON-list text, de-duplicated in order."""
+    raw = (raw or "").strip()
+    names = None
+    if raw.startswith("["):
+        try:
+            names = [str(x) for x in json.loads(raw)]
+        except ValueError:
+            pass
+    if names is None:
+        names = raw.split(",")
+    return list(dict.fromkeys(n.strip()[:LABEL_MAX] for n in names if n.strip()))
+
 class Dashboard(db.Model):
     __tablename__ = "org_dashboards"
     id = db.Column(db.Integer, primary_key=True)
@@ -72,49 +124,184 @@ class Integration(db.Model):
     token_json = db.Column(db.Text)  # store OAuth tokens (encrypt at rest in prod)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     refreshed_at = db.Column(db.DateTime)
+    sync_cursor = db.Column(db.Text)  # provider cursor JSON (GitHub since/ETag, Google syncToken)
+    synced_at = db.Column(db.DateTime)
+    sync_error = db.Column(db.Text)
+    sync_failures = db.Column(db.Integer, default=0)  # consecutive failed syncs/refreshes
+    sync_retry_at = db.Column(db.DateTime)  # set after a failure; the worker skips the row until then
+
+class OrgEvent(db.Model):
+    """Calendar events mirrored locally by integration_sync."""
+    __tablename__ = "org_events"
+    id = db.Column(db.Integer, primary_key=True)
+    owner_id = db.Column(db.Integer, nullable=False)
+    provider = db.Column(db.String(32), default="google")
+    external_id = db.Column(db.String(256), nullable=False)
+    summary = db.Column(db.String(512))
+    start_at = db.Column(db.DateTime)  # naive UTC
+    end_at = db.Column(db.DateTime)
+    all_day = db.Column(db.Boolean, default=False)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    __table_args__ = (
+        db.Index("ux_org_events_owner_external", "owner_id", "provider", "external_id", unique=True),
+        db.Index("ix_org_events_owner_start", "owner_id", "start_at"),
+        db.Index("ix_org_events_owner_end", "owner_id", "end_at"),
+    )
+
+    def to_dict(self):
+        fmt = "%Y-%m-%d" if self.all_day else "%Y-%m-%dT%H:%M:%SZ"
+        return {
+            "id": self.id,
+            "summary": self.summary,
+            "start": self.start_at.strftime(fmt) if self.start_at else None,
+            "end": self.end_at.strftime(fmt) if self.end_at else None,
+            "all_day": bool(self.all_day),
+        }
+
+SCHEMA_COLUMNS = {
+    Task: {"external_id": "VARCHAR(128)"},
+    Integration: {"sync_cursor": "TEXT", "synced_at": "DATETIME", "sync_error": "TEXT",
+                  "sync_failures": "INTEGER DEFAULT 0", "sync_retry_at": "DATETIME"},
+}
+
+def ensure_organizer_schema():
+    """create_all() skips columns/indexes on tables that already exist; add them."""
+    for model, columns in SCHEMA_COLUMNS.items():
+        table = model.__tablename__
+        have = {c[1] for c in db.session.execute(db.text(f"PRAGMA table_info({table})"))}
+        for name, ddl in columns.items():
+            if name not in have:
+                db.session.execute(db.text(f"ALTER TABLE {table} ADD COLUMN {name} {ddl}"))
+    for model in (Project, Task, TaskLabel, Dashboard, Integration, OrgEvent):
+        for index in model.__table__.indexes:
+            index.create(db.session.connection(), checkfirst=True)
+    # events synced without an end: a point in time (see local_events)
+    OrgEvent.query.filter(OrgEvent.end_at.is_(None)).update(
+        {OrgEvent.end_at: OrgEvent.start_at}, synchronize_session=False)
+    db.session.commit()
+    backfill_task_labels()
+
+def backfill_task_labels(batch=1000):
+    """Parse Task.labels into org_task_labels for tasks that have text but no rows yet."""
+    has_rows = db.session.query(TaskLabel.task_id).filter(TaskLabel.task_id == Task.id).exists()
+    last_id = 0
+    while True:
+        rows = (db.session.query(Task.id, Task.owner_id, Task.labels)
+                .filter(Task.id > last_id, Task.labels.isnot(None), Task.labels != "", ~has_rows)
+                .order_by(Task.id).limit(batch).all())
+        if not rows:
+            break
+        values = [dict(task_id=tid, owner_id=owner_id, name=n) for tid, owner_id, raw in rows for n in parse_labels(raw)]
+        if values:
+            db.session.execute(insert(TaskLabel), values)
+        db.session.commit()
+        last_id = rows[-1][0]
 
 # ---------- HELPERS ----------
+PRIO_SCORES = {1: 100, 2: 60, 3: 30}
+TASKS_PER_PAGE = 50
+
 def _prio_score(priority: int) -> int:
     # Lower is more important; convert to a positive score (bigger = higher priority)
     # 1->100, 2->60, 3->30
-    return {1: 100, 2: 60, 3: 30}.get(priority or 2, 60)
+    return PRIO_SCORES.get(priority or 2, 60)
 
-def task_rank(task: Task) -> float:
+def task_rank(task: Task, now=None) -> float:
     """Simple prioritization: priority weight + due-date proximity."""
     base = _prio_score(task.priority)
     if task.due_date:
-        days_left = (task.due_date - datetime.utcnow()).days
+        days_left = (task.due_date - (now or datetime.utcnow())).days
         urgency = max(0, 30 - days_left)  # closer due dates get more bump
     else:
         urgency = 0
     return base + urgency
 
-def get_github_client(owner_id):
-    if Github is None:
-        return None
-    integ = Integration.query.filter_by(owner_id=owner_id, provider="github").first()
-    token = None
-    if integ:
-        try:
-            token = json.loads(integ.token_json).get("access_token")
-        except Exception:
-            token = None
-    if not token:
-        token = os.getenv("GITHUB_TOKEN")  # fallback to env for dev
-    return Github(token) if token else None
-
-def get_google_calendar(owner_id):
-    if Credentials is None or build is None:
-        return None
-    integ = Integration.query.filter_by(owner_id=owner_id, provider="google").first()
-    if not integ:
-        return None
-    try:
-        creds = Credentials.from_authorized_user_info(json.loads(integ.token_json))
-        service = build("calendar", "v3", credentials=creds)
-        return service
-    except Exception:
-        return None
+def task_rank_expr(now):
+    """task_rank() as a SQL expression, so ranking + LIMIT happen in the database."""
+    base = case(PRIO_SCORES, value=func.coalesce(Task.priority, 2), else_=60)
+    delta = func.julianday(Task.due_date) - func.julianday(now)
+    # floor() (what timedelta.days does); SQLite's CAST truncates toward zero
+    days_left = cast(delta, Integer) - case((delta < cast(delta, Integer), 1), else_=0)
+    urgency = case(
+        (Task.due_date.is_(None), 0),
+        (days_left >= 30, 0),
+        else_=30 - days_left,
+    )
+    return base + urgency
+
+def with_label(q, owner_id, label):
+    """Restrict a Task query to tasks carrying `label` (index lookup on org_task_labels)."""
+    if not label:
+        return q
+    tagged = db.session.query(TaskLabel.task_id).filter(TaskLabel.owner_id == owner_id, TaskLabel.name == label)
+    return q.filter(Task.id.in_(tagged))
+
+def ranked_tasks(owner_id, until, include_done=False, page=1, per_page=TASKS_PER_PAGE, now=None, label=None):
+    """One page of owner's tasks due before `until` (or undated), best first, plus a has-next flag."""
+    now = now or datetime.utcnow()
+    q = with_label(Task.query.filter(Task.owner_id == owner_id), owner_id, label)
+    if not include_done:
+        q = q.filter(or_(Task.status.is_(None), Task.status != "done"))
+    rows = (
+        q.filter(or_(Task.due_date.is_(None), Task.due_date <= until))
+        .options(joinedload(Task.project), selectinload(Task.label_rows))
+        .order_by(task_rank_expr(now).desc(), Task.id.asc())
+        .offset((page - 1) * per_page)
+        .limit(per_page + 1)  # one extra row tells us whether there is a next page
+        .all()
+    )
+    return rows[:per_page], len(rows) > per_page
+
+EVENTS_MAX_RANGE = timedelta(days=366)
+
+def local_events(owner_id, start, end, limit=500):
+    """
+    Synced calendar events overlapping [start, end), earliest first, as a
+    UNION ALL of two index scans. Events starting inside the window are a
+    bounded range on (owner_id, start_at). Events that started earlier and
+    are still running use (owner_id, end_at) from `start` upward. That scan
+    is bounded below only, so it also reads every event ending later (all
+    future events). They are filtered out by start_at < start, and the cost
+    grows with the owner's future events, not with the whole table.
+    An event without an end is a point in time at start_at. Sync and the
+    schema backfill store end_at = start_at for those, so none has NULL end_at.
+    """
+    starts_inside = OrgEvent.query.filter(
+        OrgEvent.owner_id == owner_id, OrgEvent.start_at >= start, OrgEvent.start_at < end)
+    still_running = OrgEvent.query.filter(
+        OrgEvent.owner_id == owner_id, OrgEvent.end_at > start, OrgEvent.start_at < start)
+    return (
+        starts_inside.union_all(still_running)
+        .order_by(OrgEvent.start_at.asc())
+        .limit(limit)
+        .all()
+    )
+
+def _event_window(now):
+    """[start, end) from ?start=/&end= (ISO dates or datetimes); defaults to the next 7 days."""
+    start = _safe_date(request.args.get("start")) or now.replace(hour=0, minute=0, second=0, microsecond=0)
+    end = _safe_date(request.args.get("end")) or start + timedelta(days=7)
+    if end <= start:
+        end = start + timedelta(days=1)
+    return start, min(end, start + EVENTS_MAX_RANGE)
+
+def local_github_issues(owner_id, limit=10):
+    """Open synced GitHub issues, most recently touched first."""
+    rows = (
+        Task.query.filter(Task.owner_id == owner_id, Task.external_id.like("github:%"))
+        .filter(or_(Task.status.is_(None), Task.status != "done"))
+        .order_by(Task.updated_at.desc())
+        .limit(limit)
+        .all()
+    )
+    issues = []
+    for t in rows:
+        # https://github.com/<owner>/<repo>/issues/<n>
+        parts = (t.description or "").split("/")
+        repo = "/".join(parts[3:5]) if len(parts) > 4 else ""
+        issues.append({"title": t.title.removeprefix("[GH] "), "repo": repo, "html_url": t.description})
+    return issues
 
 # ---------- ROUTES ----------
 @organizer_bp.route("/organizer")
@@ -123,47 +310,15 @@ def index():
     # upcoming tasks (next 14 days), ranked
     now = datetime.utcnow()
     soon = now + timedelta(days=14)
-    tasks = (
-        Task.query.filter(Task.owner_id == current_user.id)
-        .filter((Task.due_date == None) | (Task.due_date <= soon))  # noqa: E711
-        .options(joinedload(Task.project))
-        .all()
-    )
-    tasks_sorted = sorted(tasks, key=task_rank, reverse=True)[:50]
+    show_done = request.args.get("show_done") == "1"
+    page = max(1, request.args.get("page", 1, type=int))
+    label = request.args.get("label") or None
+    tasks_sorted, has_next = ranked_tasks(current_user.id, soon, include_done=show_done, page=page, now=now,
+                                          label=label)
 
-    # events (Google)
-    events = []
-    service = get_google_calendar(current_user.id)
-    if service:
-        try:
-            resp = (
-                service.events()
-                .list(
-                    calendarId="primary",
-                    timeMin=now.isoformat() + "Z",
-                    timeMax=soon.isoformat() + "Z",
-                    singleEvents=True,
-                    orderBy="startTime",
-                )
-                .execute()
-            )
-            for e in resp.get("items", []):
-                start = e.get("start", {}).get("dateTime") or e.get("start", {}).get("date")
-                events.append({"summary": e.get("summary"), "start": start})
-        except Exception:
-            events = []
-
-    # GitHub heads-up
-    gh_issues = []
-    gh = get_github_client(current_user.id)
-    if gh:
-        try:
-            for i in gh.get_user().get_issues(state="open")[:10]:
-                gh_issues.append(
-                    {"title": i.title, "repo": i.repository.full_name, "html_url": i.html_url}
-                )
-        except Exception:
-            gh_issues = []
+    # events + GitHub heads-up come from the local mirror kept by integration_sync
+    events = [e.to_dict() for e in local_events(current_user.id, now, soon)]
+    gh_issues = local_github_issues(current_user.id)
 
     projects = Project.query.filter_by(owner_id=current_user.id, status="active").all()
     return render_template(
@@ -172,6 +327,11 @@ def index():
         events=events,
         gh_issues=gh_issues,
         projects=projects,
+        page=page,
+        has_next=has_next,
+        show_done=show_done,
+        label=label,
+        labels=owner_labels(current_user.id),
     )
 
 @organizer_bp.route("/organizer/projects", methods=["GET", "POST"])
@@ -212,12 +372,15 @@ def _safe_date(s):
 @login_required
 def project_detail(pid):
     p = Project.query.filter_by(id=pid, owner_id=current_user.id).first_or_404()
+    label = request.args.get("label") or None
     tasks = (
-        Task.query.filter_by(project_id=p.id)
+        with_label(Task.query.filter_by(project_id=p.id), current_user.id, label)
+        .options(selectinload(Task.label_rows))
         .order_by(Task.status.asc(), Task.priority.asc(), Task.due_date.asc().nullslast())
         .all()
     )
-    return render_template("organizer/project_detail.html", p=p, tasks=tasks)
+    return render_template("organizer/project_detail.html", p=p, tasks=tasks, label=label,
+                           labels=owner_labels(current_user.id, project_id=p.id))
 
 @organizer_bp.route("/organizer/tasks", methods=["POST"])
 @login_required
@@ -239,6 +402,7 @@ def create_task():
     )
     db.session.add(t)
     db.session.commit()
+    invalidate_widgets(current_user.id)
     flash("Task created", "success")
     return redirect(request.referrer or url_for("organizer.index"))
 
@@ -256,6 +420,7 @@ def update_task(tid):
     if "due_date" in request.form:
         t.due_date = _safe_date(request.form.get("due_date"))
     db.session.commit()
+    invalidate_widgets(current_user.id)
     flash("Task updated", "success")
     return redirect(request.referrer or url_for("organizer.index"))
 
@@ -265,61 +430,163 @@ def toggle_task(tid):
     t = Task.query.filter_by(id=tid, owner_id=current_user.id).first_or_404()
     t.status = "done" if t.status != "done" else "todo"
     db.session.commit()
+    invalidate_widgets(current_user.id)
     return jsonify({"ok": True, "status": t.status})
 
+# ---------- BATCH ----------
+BATCH_MAX_OPS = 500
+TASK_STATUSES = ("todo", "doing", "done", "blocked")
+TASK_TEXT_FIELDS = ("title", "description", "labels")
+TASK_INT_FIELDS = ("priority", "estimate_minutes", "time_spent_minutes", "project_id")
+
+class BatchError(ValueError):
+    pass
+
+def _task_values(fields, project_ids):
+    """Validate a JSON field dict into Task attributes; raises BatchError."""
+    if not isinstance(fields, dict):
+        raise BatchError("fields must be an object")
+    values = {}
+    for k in TASK_TEXT_FIELDS:
+        if k in fields:
+            values[k] = None if fields[k] is None else str(fields[k])
+    for k in TASK_INT_FIELDS:
+        if k in fields:
+            try:
+                values[k] = None if fields[k] in (None, "") else int(fields[k])
+            except (TypeError, ValueError):
+                raise BatchError(f"{k} must be an integer")
+    if "status" in fields:
+        if fields["status"] not in TASK_STATUSES:
+            raise BatchError("unknown status")
+        values["status"] = fields["status"]
+    if "due_date" in fields:
+        values["due_date"] = _safe_date(fields["due_date"])
+    if "title" in values and not (values["title"] or "").strip():
+        raise BatchError("title is required")
+    if values.get("project_id") is not None and values["project_id"] not in project_ids:
+        raise BatchError("unknown project")
+    return values
+
+def apply_task_ops(owner_id, ops):
+    """
+    Apply create/update/status/toggle/delete ops for one owner. All referenced
+    tasks are loaded with one query; results are per op, in order:
+    {"ok": True, "id", "task"} / {"ok": True, "id", "deleted": True} / {"ok": False, "error"}.
+    The caller commits.
+    """
+    ids = {op.get("id") for op in ops if isinstance(op, dict) and isinstance(op.get("id"), int)}
+    tasks = {t.id: t for t in Task.query.filter(Task.owner_id == owner_id, Task.id.in_(ids))} if ids else {}
+    project_ids = {pid for (pid,) in db.session.query(Project.id).filter(Project.owner_id == owner_id)}
+    results, created = [], []
+    for op in ops:
+        try:
+            if not isinstance(op, dict):
+                raise BatchError("op must be an object")
+            kind = op.get("op")
+            if kind == "create":
+                values = _task_values(op.get("fields") or {}, project_ids)
+                if not values.get("title"):
+                    raise BatchError("title is required")
+                values.setdefault("priority", 2)
+                values.setdefault("status", "todo")
+                t = Task(owner_id=owner_id, **values)
+                db.session.add(t)
+                created.append((len(results), t))
+                results.append({"ok": True})
+                continue
+            t = tasks.get(op.get("id"))
+            if t is None:
+                raise BatchError("task not found")
+            if kind == "update":
+                for k, v in _task_values(op.get("fields") or {}, project_ids).items():
+                    setattr(t, k, v)
+            elif kind == "status":
+                t.status = _task_values({"status": op.get("status")}, project_ids)["status"]
+            elif kind == "toggle":
+                t.status = "done" if t.status != "done" else "todo"
+            elif kind == "delete":
+                db.session.delete(t)
+                del tasks[t.id]
+                results.append({"ok": True, "id": t.id, "deleted": True})
+                continue
+            else:
+                raise BatchError("unknown op")
+            results.append({"ok": True, "id": t.id, "task": t})
+        except BatchError as ex:
+            results.append({"ok": False, "error": str(ex)})
+    db.session.flush()  # assigns ids to created tasks in one round trip
+    for i, t in created:
+        results[i].update(id=t.id, task=t)
+    for r in results:
+        if "task" in r:
+            r["task"] = r["task"].to_dict()
+    return results
+
+@organizer_bp.route("/organizer/tasks/batch", methods=["POST"])
+@login_required
+def tasks_batch():
+    """
+    Many task changes in one transaction:
+    {"ops": [{"op": "create", "fields": {...}}, {"op": "update", "id": 1, "fields": {...}},
+             {"op": "status", "id": 2, "status": "done"}, {"op": "toggle", "id": 3},
+             {"op": "delete", "id": 4}], "atomic": false}
+    With "atomic": true nothing is saved if any op fails.
+    """
+    data = request.get_json(silent=True) or {}
+    ops = data.get("ops")
+    if not isinstance(ops, list) or not ops:
+        return jsonify({"error": "ops must be a non-empty list"}), 400
+    if len(ops) > BATCH_MAX_OPS:
+        return jsonify({"error": f"at most {BATCH_MAX_OPS} ops per batch"}), 400
+    results = apply_task_ops(current_user.id, ops)
+    ok = all(r["ok"] for r in results)
+    if data.get("atomic") and not ok:
+        db.session.rollback()
+        return jsonify({"ok": False, "committed": False, "results": results}), 409
+    db.session.commit()
+    invalidate_widgets(current_user.id)
+    return jsonify({"ok": ok, "committed": True, "results": results})
+
 # ---------- INTEGRATIONS ----------
 @organizer_bp.route("/organizer/github/sync", methods=["POST"])
 @login_required
 def github_sync():
-    """Import open GitHub issues assigned to user as tasks (lightweight)."""
-    gh = get_github_client(current_user.id)
-    if not gh:
-        return jsonify({"ok": False, "error": "GitHub not configured"}), 400
-    created = 0
-    try:
-        for i in gh.get_user().get_issues(state="open"):
-            title = f"[GH] {i.title}"
-            exists = Task.query.filter_by(owner_id=current_user.id, title=title).first()
-            if exists:
-                continue
-            t = Task(owner_id=current_user.id, title=title, description=i.html_url, priority=2)
-            db.session.add(t)
-            created += 1
+    """Sync the user's GitHub issues into tasks (queued on the background worker when it runs)."""
+    from integration_sync import request_sync, sync_integrations
+    integ = Integration.query.filter_by(owner_id=current_user.id, provider="github").first()
+    if not integ and os.getenv("GITHUB_TOKEN"):
+        # dev setup: no OAuth connection, tokens_for() falls back to GITHUB_TOKEN;
+        # the row only holds the sync cursor
+        integ = Integration(owner_id=current_user.id, provider="github")
+        db.session.add(integ)
         db.session.commit()
-    except Exception as e:
-        return jsonify({"ok": False, "error": str(e)}), 400
-    return jsonify({"ok": True, "created": created})
+    if not integ:
+        return jsonify({"ok": False, "error": "GitHub not configured"}), 400
+    if request_sync(current_user.id):
+        return jsonify({"ok": True, "queued": True}), 202
+    outcome = sync_integrations([integ])[integ.id]
+    if isinstance(outcome, str):
+        return jsonify({"ok": False, "error": outcome}), 400
+    return jsonify({"ok": True, "synced": outcome})
+
+@organizer_bp.route("/organizer/events.json")
+@login_required
+def events_json():
+    """Local events for any window: /organizer/events.json?start=2025-01-06&end=2025-01-13"""
+    start, end = _event_window(datetime.utcnow())
+    return jsonify({
+        "start": start.isoformat() + "Z",
+        "end": end.isoformat() + "Z",
+        "events": [e.to_dict() for e in local_events(current_user.id, start, end)],
+    })
 
 @organizer_bp.route("/organizer/google/events.json")
 @login_required
 def google_events_json():
-    service = get_google_calendar(current_user.id)
-    if not service:
-        return jsonify({"events": []})
     now = datetime.utcnow()
     soon = now + timedelta(days=14)
-    try:
-        resp = (
-            service.events()
-            .list(
-                calendarId="primary",
-                timeMin=now.isoformat() + "Z",
-                timeMax=soon.isoformat() + "Z",
-                singleEvents=True,
-                orderBy="startTime",
-            )
-            .execute()
-        )
-        items = [
-            {
-                "summary": e.get("summary"),
-                "start": e.get("start", {}).get("dateTime") or e.get("start", {}).get("date"),
-            }
-            for e in resp.get("items", [])
-        ]
-        return jsonify({"events": items})
-    except Exception:
-        return jsonify({"events": []})
+    return jsonify({"events": [e.to_dict() for e in local_events(current_user.id, now, soon)]})
 
 # ---------- DASHBOARDS ----------
 @organizer_bp.route("/organizer/dashboards", methods=["GET", "POST"])
@@ -339,7 +606,149 @@ def dashboards():
 def dashboard_detail(did):
     d = Dashboard.query.filter_by(id=did, owner_id=current_user.id).first_or_404()
     layout = json.loads(d.layout_json or "{}")
-    return render_template("organizer/dashboard_detail.html", d=d, layout=layout)
+    start, end = _event_window(datetime.utcnow())
+    events = [e.to_dict() for e in local_events(current_user.id, start, end)]
+    projects = Project.query.filter_by(owner_id=current_user.id).order_by(Project.name).all()
+    return render_template("organizer/dashboard_detail.html", d=d, layout=layout, events=events,
+                           projects=projects)
+
+# ---------- DASHBOARD DATA ----------
+# Every widget is computed with GROUP BY / SUM queries over the owner's tasks
+# (served by the owner_id composite indexes) and the whole dashboard is returned
+# in one response, cached briefly per user + filters.
+WIDGET_CACHE_SECONDS = 15
+_widget_cache = TTLCache(ttl=WIDGET_CACHE_SECONDS, maxsize=1024, name="dashboard_widgets")
+
+def invalidate_widgets(owner_id):
+    for key in _widget_cache.keys():
+        if key[0] == owner_id:
+            _widget_cache.pop(key)
+
+def _task_scope(owner_id, filters):
+    q = db.session.query(Task).filter(Task.owner_id == owner_id)
+    if filters.get("project"):
+        q = q.filter(Task.project_id == filters["project"])
+    if filters.get("status"):
+        q = q.filter(Task.status == filters["status"])
+    return q
+
+def _open(q):
+    return q.filter(or_(Task.status.is_(None), Task.status != "done"))
+
+def _counts(q, column):
+    return {str(k) if k is not None else "none": n
+            for k, n in q.with_entities(column, func.count()).group_by(column).all()}
+
+def widget_kpis(owner_id, filters, now):
+    q = _task_scope(owner_id, filters)
+    until = now + timedelta(days=filters["window"])
+    total, due, est = _open(q).with_entities(
+        func.count(),
+        func.sum(case((Task.due_date <= until, 1), else_=0)),
+        func.sum(case((or_(Task.due_date.is_(None), Task.due_date <= until),
+                       func.coalesce(Task.estimate_minutes, 0)), else_=0)),
+    ).one()
+    return {"total": total, "due_in_window": due or 0, "estimate_minutes": est or 0}
+
+def widget_top_tasks(owner_id, filters, now):
+    until = now + timedelta(days=filters["window"])
+    q = _open(_task_scope(owner_id, filters)).filter(or_(Task.due_date.is_(None), Task.due_date <= until))
+    top = q.order_by(task_rank_expr(now).desc(), Task.id.asc()).limit(8).all()
+    return {
+        "tasks": [{"id": t.id, "title": t.title, "priority": t.priority,
+                   "due": t.due_date.strftime("%Y-%m-%d") if t.due_date else None} for t in top],
+        "by_priority": _counts(q, Task.priority),
+    }
+
+def widget_breakdown(owner_id, filters, now):
+    q = _task_scope(owner_id, filters)
+    projects = dict(db.session.query(Project.id, Project.name).filter(Project.owner_id == owner_id).all())
+    by_project = {projects.get(int(k), "(none)") if k != "none" else "(none)": n
+                  for k, n in _counts(q, Task.project_id).items()}
+    overdue = _open(q).filter(Task.due_date < now).with_entities(func.count()).scalar()
+    return {
+        "by_status": _counts(q, Task.status),
+        "by_priority": _counts(q, Task.priority),
+        "by_project": by_project,
+        "by_label": label_counts(owner_id, filters),
+        "overdue": overdue,
+    }
+
+def widget_burndown(owner_id, filters, now):
+    """Estimate vs time spent, overall and per status."""
+    rows = (_task_scope(owner_id, filters)
+            .with_entities(Task.status,
+                           func.sum(func.coalesce(Task.estimate_minutes, 0)),
+                           func.sum(func.coalesce(Task.time_spent_minutes, 0)))
+            .group_by(Task.status).all())
+    per_status = {(st or "none"): {"estimate": est or 0, "spent": spent or 0} for st, est, spent in rows}
+    est = sum(v["estimate"] for v in per_status.values())
+    spent = sum(v["spent"] for v in per_status.values())
+    open_est = sum(v["estimate"] for k, v in per_status.items() if k != "done")
+    return {"estimate": est, "spent": spent, "remaining_estimate": open_est, "by_status": per_status}
+
+def widget_calendar(owner_id, filters, now):
+    start = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    events = local_events(owner_id, start, start + timedelta(days=filters["window"]))
+    return {"events": [e.to_dict() for e in events]}
+
+def widget_github(owner_id, filters, now):
+    return {"issues": local_github_issues(owner_id)}
+
+def label_counts(owner_id, filters):
+    q = (_task_scope(owner_id, filters)
+         .join(TaskLabel, TaskLabel.task_id == Task.id)
+         .filter(TaskLabel.owner_id == owner_id))
+    return dict(q.with_entities(TaskLabel.name, func.count()).group_by(TaskLabel.name).all())
+
+def owner_labels(owner_id, project_id=None):
+    """[(name, task count)] for the label filter pills, most used first."""
+    q = db.session.query(TaskLabel.name, func.count()).filter(TaskLabel.owner_id == owner_id)
+    if project_id is not None:
+        q = q.join(Task, Task.id == TaskLabel.task_id).filter(Task.project_id == project_id)
+    return q.group_by(TaskLabel.name).order_by(func.count().desc(), TaskLabel.name).all()
+
+WIDGETS = {
+    "w.top_tasks": widget_top_tasks,
+    "w.breakdown": widget_breakdown,
+    "w.burndown": widget_burndown,
+    "w.calendar": widget_calendar,
+    "w.github": widget_github,
+}
+
+def dashboard_payload(owner_id, layout, filters, now=None):
+    """KPIs plus data for every visible data widget of a layout."""
+    now = now or datetime.utcnow()
+    # saved layouts are client JSON: anything but {widget: {...}} gets the default (all shown)
+    if not isinstance(layout, dict) or not all(isinstance(v, dict) for v in layout.values()):
+        layout = {}
+    keys = [k for k in WIDGETS if layout.get(k, {}).get("show", True) is not False]
+    cache_key = (owner_id, tuple(keys), tuple(sorted(filters.items())))
+    cached = _widget_cache.get(cache_key)
+    if cached is not None:
+        return cached
+    payload = {
+        "kpis": widget_kpis(owner_id, filters, now),
+        "widgets": {k: WIDGETS[k](owner_id, filters, now) for k in keys},
+    }
+    _widget_cache.set(cache_key, payload)
+    return payload
+
+@organizer_bp.route("/organizer/dashboards/<int:did>/data")
+@login_required
+def dashboard_data(did):
+    """All widget data for one dashboard: ?project=&status=&window=14"""
+    d = Dashboard.query.filter_by(id=did, owner_id=current_user.id).first_or_404()
+    try:
+        layout = json.loads(d.layout_json or "{}")
+    except ValueError:
+        layout = {}
+    filters = {
+        "project": request.args.get("project", type=int),
+        "status": request.args.get("status") or None,
+        "window": min(max(request.args.get("window", 14, type=int), 1), 366),
+    }
+    return jsonify(dashboard_payload(current_user.id, layout, filters))
 
 @organizer_bp.route("/organizer/dashboards/<int:did>/save", methods=["POST"])
 @login_required
@@ -347,4 +756,5 @@ def dashboard_save(did):
     d = Dashboard.query.filter_by(id=did, owner_id=current_user.id).first_or_404()
     d.layout_json = request.data.decode("utf-8") or "{}"
     db.session.commit()
+    invalidate_widgets(current_user.id)
     return jsonify({"ok": True})
@@ -0,0 +1,287 @@
+# rendering.py
+# Markdown -> HTML (server-side)
+# We keep math as-is ($...$, $$...$$) and let KaTeX render it on the client.
+# markdown is imported on the first render, not at app import; fenced code is
+# highlighted by highlight.py and the output sanitized against the allow-list
+# below by sanitizer.py.
+#
+# Request paths call render(), not render_markdown(): small documents render
+# inline, large ones in a bounded process pool so a 500 KB preview does not
+# hold the GIL for every other request and Socket.IO handler. render()
+# enforces an input limit and a timeout, and drops a queued render once the
+# same client has asked for a newer one.
+import itertools
+import os
+import threading
+import time
+from concurrent.futures import CancelledError, ProcessPoolExecutor, TimeoutError as FutureTimeout
+from concurrent.futures.process import BrokenProcessPool
+from functools import lru_cache
+
+import metrics
+from highlight import highlight_code_blocks
+from metrics import timed
+from sanitizer import Sanitizer
+from ttlcache import TTLCache
+
+RENDER_WORKERS = int(os.getenv("RENDER_WORKERS", "2"))
+RENDER_INLINE_MAX = int(os.getenv("RENDER_INLINE_MAX", str(32 * 1024)))  # chars rendered on the calling thread
+RENDER_MAX_INPUT = int(os.getenv("RENDER_MAX_INPUT", str(2 * 1024 * 1024)))
+RENDER_TIMEOUT = float(os.getenv("RENDER_TIMEOUT", "10"))  # seconds, queue wait included
+RENDER_QUEUE = RENDER_WORKERS * 2  # pool renders admitted at once; the rest wait (and may be dropped)
+# Bump when the same Markdown renders to different HTML (extensions, sanitizer,
+# highlighting, export template): stored renders and cached exports key on it.
+RENDER_PIPELINE = "3"
+
+MD_EXTS = [
+    "fenced_code",
+    "tables",
+    "toc",
+    "sane_lists",
+    "admonition",
+]
+
+# bleach's default allow-list plus what the Markdown extensions emit
+BASE_TAGS = {"a","abbr","acronym","b","blockquote","code","em","i","li","ol","strong","ul"}
+BASE_ATTRS = {"a": ["href", "title"], "abbr": ["title"], "acronym": ["title"]}
+EXTRA_TAGS = {"p","pre","code","span","div","h1","h2","h3","h4","h5","h6",
+              "table","thead","tbody","tr","th","td","hr","br","blockquote","ul","ol","li"}
+EXTRA_ATTRS = {
+    "a": ["href", "title", "target", "rel"],
+    "span": ["class"],
+    "div": ["class"],
+    "code": ["class"],
+    "pre": ["class"],
+}
+ALLOWED_TAGS = frozenset(BASE_TAGS | EXTRA_TAGS)
+ALLOWED_ATTRS = {**BASE_ATTRS, **EXTRA_ATTRS}
+ALLOWED_PROTOCOLS = ["http", "https", "mailto"]
+
+_sanitizer = Sanitizer(ALLOWED_TAGS, ALLOWED_ATTRS, ALLOWED_PROTOCOLS)
+
+@lru_cache(maxsize=1)
+def _libs():
+    import markdown
+    from markdown.extensions import Extension
+    from markdown.postprocessors import Postprocessor
+
+    class HighlightPostprocessor(Postprocessor):
+        def run(self, text):
+            return highlight_code_blocks(text)
+
+    class SanitizePostprocessor(Postprocessor):
+        def run(self, text):
+            return _sanitizer.clean(text)
+
+    class PostprocessExtension(Extension):
+        # after raw_html (30) restores stashed HTML and amp_substitute (20);
+        # highlighting goes last, its spans are built from already-clean text
+        def extendMarkdown(self, md):
+            md.postprocessors.register(SanitizePostprocessor(md), "sanitize", 5)
+            md.postprocessors.register(HighlightPostprocessor(md), "highlight", 1)
+
+    return markdown, PostprocessExtension
+
+@timed("render_markdown")
+def render_markdown(text: str) -> str:
+    # Convert markdown to HTML, leaving $...$ for KaTeX to handle in the browser.
+    # The sanitizer runs inside the pipeline, so raw HTML in the note is covered.
+    md, PostprocessExtension = _libs()
+    return md.markdown(text, extensions=[*MD_EXTS, PostprocessExtension()], output_format="html5")
+
+# ---------- render service ----------
+class RenderError(Exception):
+    pass
+
+class RenderTooLarge(RenderError):
+    pass
+
+class RenderTimeout(RenderError):
+    pass
+
+class RenderSuperseded(RenderError):
+    """A newer render for the same client arrived while this one was waiting."""
+
+_pool = None
+_pool_lock = threading.Lock()
+_pool_users = {}   # pool -> requests waiting on one of its futures
+_retired = set()   # pools taking no new renders, shut down once _pool_users drains
+_slots = threading.BoundedSemaphore(RENDER_QUEUE)
+_tickets = itertools.count(1)
+_latest = {}  # client key -> newest ticket
+_latest_lock = threading.Lock()
+
+def _acquire_pool():
+    """The current pool, counted as in use until _release_pool()."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=RENDER_WORKERS)
+        _pool_users[_pool] = _pool_users.get(_pool, 0) + 1
+        return _pool
+
+def _release_pool(pool):
+    with _pool_lock:
+        users = _pool_users[pool] - 1
+        if users or pool not in _retired:
+            _pool_users[pool] = users
+            return
+        del _pool_users[pool]
+        _retired.discard(pool)
+    # nobody waits on it any more: kill the worker stuck on a timed-out render
+    for proc in list(getattr(pool, "_processes", {}).values()):
+        proc.terminate()
+    pool.shutdown(wait=False, cancel_futures=True)
+
+def _retire_pool(pool):
+    """
+    Send new renders to a fresh pool. Renders already running on `pool` for
+    other requests finish there; it is torn down when the last one is done.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+        _retired.add(pool)
+
+def _superseded(client_key, ticket):
+    return client_key is not None and _latest.get(client_key, ticket) != ticket
+
+def render(text: str, client_key=None, timeout: float = RENDER_TIMEOUT) -> str:
+    """
+    render_markdown(text) for request paths. client_key (e.g. (user, doc))
+    lets a newer call from the same client drop this one while it waits.
+    Raises RenderTooLarge, RenderTimeout or RenderSuperseded.
+    """
+    text = text or ""
+    if len(text) > RENDER_MAX_INPUT:
+        metrics.RENDER_REQUESTS.inc(outcome="too_large")
+        raise RenderTooLarge(f"document is larger than {RENDER_MAX_INPUT // 1024} KB")
+    ticket = next(_tickets)
+    if client_key is not None:
+        with _latest_lock:
+            _latest[client_key] = ticket
+    try:
+        if len(text) <= RENDER_INLINE_MAX:
+            metrics.RENDER_REQUESTS.inc(outcome="inline")
+            return render_markdown(text)
+
+        deadline = time.monotonic() + timeout
+        if _superseded(client_key, ticket):
+            metrics.RENDER_REQUESTS.inc(outcome="superseded")
+            raise RenderSuperseded()
+        if not _slots.acquire(timeout=timeout):
+            metrics.RENDER_REQUESTS.inc(outcome="timeout")
+            raise RenderTimeout("renderer is busy")
+        try:
+            if _superseded(client_key, ticket):
+                metrics.RENDER_REQUESTS.inc(outcome="superseded")
+                raise RenderSuperseded()
+            pool = _acquire_pool()
+            try:
+                html = pool.submit(render_markdown, text).result(timeout=max(0.0, deadline - time.monotonic()))
+            except FutureTimeout:
+                metrics.RENDER_REQUESTS.inc(outcome="timeout")
+                _retire_pool(pool)
+                raise RenderTimeout(f"rendering took longer than {timeout:g} s")
+            except (BrokenProcessPool, CancelledError):  # a worker died (e.g. killed for memory)
+                metrics.RENDER_REQUESTS.inc(outcome="error")
+                _retire_pool(pool)
+                raise RenderError("renderer crashed, try again")
+            finally:
+                _release_pool(pool)
+            metrics.RENDER_REQUESTS.inc(outcome="pool")
+            return html
+        finally:
+            _slots.release()
+    finally:
+        if client_key is not None:
+            with _latest_lock:
+                if _latest.get(client_key) == ticket:
+                    del _latest[client_key]
+
+# ---------- preview scheduling ----------
+class _PreviewState:
+    __slots__ = ("latest", "pending", "running", "done", "waiters")
+
+    def __init__(self):
+        self.latest = 0      # newest seq seen
+        self.pending = None  # (seq, text) waiting to be rendered; newer requests replace it
+        self.running = False
+        self.done = None     # (seq, html, error) of the last finished render
+        self.waiters = 0
+
+class PreviewScheduler:
+    """
+    Coalesces preview renders per client key (a tab's (session, document), or
+    a collab room). Each request carries a sequence number that grows with
+    every keystroke batch; at most one render per key runs at a time, and
+    when it finishes only the newest pending text is rendered next. Requests
+    overtaken before their text was rendered get RenderSuperseded, so the
+    CPU spent per client is bounded by the previews it can actually show.
+    """
+
+    def __init__(self, timeout: float = RENDER_TIMEOUT):
+        self.timeout = timeout
+        self._cond = threading.Condition()
+        self._states = {}
+        # newest seq of idle keys, so a request that arrives late is still refused
+        self._last_seq = TTLCache(ttl=10 * 60, maxsize=10000)
+
+    def submit(self, key, seq: int, text: str) -> str:
+        """HTML for `text` (request number `seq` of `key`); raises RenderError subclasses."""
+        deadline = time.monotonic() + self.timeout
+        with self._cond:
+            st = self._states.get(key)
+            if st is None:
+                st = self._states[key] = _PreviewState()
+                st.latest = self._last_seq.get(key, 0)
+            if seq < st.latest:
+                metrics.RENDER_REQUESTS.inc(outcome="superseded")
+                raise RenderSuperseded()
+            st.latest = seq
+            if st.pending is None or st.pending[0] <= seq:
+                st.pending = (seq, text)
+            st.waiters += 1
+        try:
+            return self._wait(key, st, seq, deadline)
+        finally:
+            with self._cond:
+                st.waiters -= 1
+                if not st.waiters and not st.running and st.pending is None:
+                    self._states.pop(key, None)
+                    self._last_seq.set(key, st.latest)
+
+    def _wait(self, key, st, seq, deadline):
+        while True:
+            with self._cond:
+                while True:
+                    if st.done is not None and st.done[0] >= seq:
+                        done_seq, html, error = st.done
+                        if done_seq > seq:
+                            metrics.RENDER_REQUESTS.inc(outcome="superseded")
+                            raise RenderSuperseded()
+                        if error is not None:
+                            raise error
+                        return html
+                    if not st.running and st.pending is not None:
+                        job_seq, job_text = st.pending
+                        st.pending = None
+                        st.running = True
+                        break
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise RenderTimeout("preview is still rendering")
+                    self._cond.wait(remaining)
+            # render the newest pending text (ours or a later one) outside the lock
+            html, error = None, None
+            try:
+                html = render(job_text, client_key=key, timeout=max(0.0, deadline - time.monotonic()))
+            except Exception as ex:  # handed to every request waiting on this render
+                error = ex
+            with self._cond:
+                st.running = False
+                st.done = (job_seq, html, error)
+                self._cond.notify_all()
+
+previews = PreviewScheduler()
@@ -0,0 +1,126 @@
+# sanitizer.py
+# Allow-list HTML sanitizer for rendered Markdown, run as the last Markdown
+# postprocessor (see rendering.py) instead of a bleach.clean() reparse.
+#
+# One regex pass over the output: every tag is rebuilt from the allow-list
+# with escaped attribute values, everything else is emitted as escaped text,
+# so nothing the scanner misreads can get through as markup. Output matches
+# bleach.clean(..., strip=True) on what Markdown produces; bench/sanitize_check.py
+# checks that. For malformed raw HTML it only balances tags (no html5lib tree
+# fix-ups such as foster-parenting), and still never emits anything off the list.
+import re
+from html import unescape
+from html.entities import html5 as _ENTITIES
+
+VOID_TAGS = frozenset({"br", "hr", "img", "wbr", "area", "col", "embed", "input", "source", "track"})
+URI_ATTRS = frozenset({"href", "src", "cite", "action", "longdesc", "poster"})
+
+_TOKEN = re.compile(r"""
+    (?P<comment><!--.*?(?:-->|\Z))
+  | <(?P<end>/?)(?P<tag>[a-zA-Z][^\t\n\f\r />]*)(?P<attrs>(?:[^>"']|"[^"]*"|'[^']*')*)>
+  | (?P<bogus><[!?/][^>]*>?)
+  | &(?P<entity>\#[0-9]+;|\#[xX][0-9a-fA-F]+;|[a-zA-Z][a-zA-Z0-9]*;)
+  | (?P<char>[<>&])
+""", re.S | re.X)
+_ATTR = re.compile(r"""([^\t\n\f\r />][^\t\n\f\r />=]*)(?:\s*=\s*("[^"]*"|'[^']*'|[^\t\n\f\r >]*))?""")
+_URI_JUNK = re.compile(r"[`\000-\040\177-\240\s\ufffd]+")
+_SCHEME_CHARS = frozenset("abcdefghijklmnopqrstuvwxyz0123456789+-.")
+_ESCAPE_CHAR = {"<": "&lt;", ">": "&gt;", "&": "&amp;"}
+_AMP = re.compile(r"&(\#[0-9]+;|\#[xX][0-9a-fA-F]+;|[a-zA-Z][a-zA-Z0-9]*;)?")
+
+def _entity(entity) -> str:
+    """A character reference as written if it is one, else an escaped &."""
+    if entity and (entity[0] == "#" or entity in _ENTITIES):
+        return "&" + entity
+    return "&amp;" + (entity or "")
+
+def _attr(name: str, value: str) -> str:
+    """Serialize as bleach does: entities kept as written, bare & and < escaped."""
+    value = _AMP.sub(lambda m: _entity(m.group(1)), value).replace("<", "&lt;")
+    if '"' in value and "'" not in value:
+        return f" {name}='{value}'"
+    value = value.replace('"', "&quot;")
+    return f' {name}="{value}"'
+
+def _scheme(uri: str) -> str:
+    """URL scheme as bleach's urlparse sees it ("" for relative, "host:80" etc.)."""
+    i = uri.find(":")
+    if i <= 0 or not _SCHEME_CHARS.issuperset(uri[:i]):
+        return ""
+    rest = uri[i + 1:]
+    if rest and rest.isdigit():
+        return ""
+    return uri[:i]
+
+class Sanitizer:
+    """bleach.Cleaner(tags, attributes, protocols, strip=True, strip_comments=True)."""
+
+    def __init__(self, tags, attributes, protocols):
+        self.tags = frozenset(tags)
+        self.attributes = {tag: frozenset(names) for tag, names in attributes.items()}
+        self.protocols = frozenset(protocols)
+
+    def uri_allowed(self, value: str) -> bool:
+        uri = _URI_JUNK.sub("", unescape(value)).lower()
+        scheme = _scheme(uri)
+        if scheme:
+            return scheme in self.protocols
+        if uri.startswith("#"):
+            return True
+        if ":" in uri and uri.split(":", 1)[0] in self.protocols:
+            return True
+        return "http" in self.protocols or "https" in self.protocols
+
+    def _start_tag(self, tag: str, raw_attrs: str) -> str:
+        allowed = self.attributes.get(tag)
+        if not allowed or not raw_attrs.strip():
+            return f"<{tag}>"
+        out, seen = [], set()
+        for name, value in _ATTR.findall(raw_attrs):
+            name = name.lower()
+            if name in seen:
+                continue  # first occurrence wins, as in the HTML parser
+            seen.add(name)
+            if name not in allowed:
+                continue
+            if value[:1] in ("'", '"'):
+                value = value[1:-1]
+            if name in URI_ATTRS and not self.uri_allowed(value):
+                continue
+            out.append(_attr(name, value))
+        return f"<{tag}{''.join(out)}>"
+
+    def clean(self, html: str) -> str:
+        out, stack, pos = [], [], 0
+        append = out.append
+        for m in _TOKEN.finditer(html):
+            start = m.start()
+            if start > pos:
+                append(html[pos:start])
+            pos = m.end()
+            kind = m.lastgroup
+            if kind == "attrs":  # a tag; lastgroup is its final group
+                tag = m.group("tag").lower()
+                if tag not in self.tags:
+                    continue
+                if m.group("end"):
+                    if tag in stack:
+                        while True:
+                            open_tag = stack.pop()
+                            append(f"</{open_tag}>")
+                            if open_tag == tag:
+                                break
+                    continue
+                append(self._start_tag(tag, m.group("attrs")))
+                if tag not in VOID_TAGS:
+                    stack.append(tag)
+            elif kind == "entity":
+                append(_entity(m.group("entity")))
+            elif kind == "char":
+                append(_ESCAPE_CHAR[m.group()])
+            # comments and bogus markup (<!DOCTYPE>, <?pi?>, </ x>) are dropped
+        if pos < len(html):
+            append(html[pos:])
+        while stack:
+            append(f"</{stack.pop()}>")
+        return "".join(out)
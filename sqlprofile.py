@@ -0,0 +1,179 @@
+# sqlprofile.py
+# Opt-in SQL profiler (SQL_PROFILE=1). Every HTTP request and Socket.IO event
+# gets a profile: query count, DB time, and statements grouped by shape
+# (literals and IN-lists collapsed). A shape repeated SQL_PROFILE_NPLUS1 times
+# or more in one scope is reported as a likely N+1, with the innermost app
+# frames that issued it. Profiles go to the "sqlprofile" logger as one line
+# each, and the last SQL_PROFILE_KEEP are browsable at /_sqlprofile.
+#
+# Off by default (and meant for development: the report shows raw SQL): when
+# disabled no engine listeners are installed and scope() is a no-op.
+import contextvars
+import logging
+import os
+import re
+import threading
+import time
+import traceback
+from collections import deque
+from contextlib import contextmanager, nullcontext
+from functools import lru_cache
+
+log = logging.getLogger("sqlprofile")
+
+APP_ROOT = os.path.dirname(os.path.abspath(__file__))
+NPLUS1_THRESHOLD = int(os.getenv("SQL_PROFILE_NPLUS1", "5"))
+KEEP = int(os.getenv("SQL_PROFILE_KEEP", "200"))
+
+_enabled = False
+_current = contextvars.ContextVar("sqlprofile_current", default=None)
+_recent = deque(maxlen=KEEP)
+_recent_lock = threading.Lock()
+
+# ---------- statement shapes ----------
+_STRING_RE = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_RE = re.compile(r"\b\d+(?:\.\d+)?\b")
+_IN_LIST_RE = re.compile(r"\bIN\s*\((?:\s*\?\s*,)*\s*\?\s*\)", re.IGNORECASE)
+_SPACE_RE = re.compile(r"\s+")
+
+@lru_cache(maxsize=4096)
+def shape(statement: str) -> str:
+    """Statement with literals -> ? and IN (?, ?, ...) -> IN (...), whitespace collapsed."""
+    s = _STRING_RE.sub("?", statement)
+    s = _NUMBER_RE.sub("?", s)
+    s = _IN_LIST_RE.sub("IN (...)", s)
+    return _SPACE_RE.sub(" ", s).strip()
+
+def _call_site(depth=3):
+    """Innermost app frames outside the profiler/metrics: 'app.py:144 in f < app.py:600 in g'."""
+    sites = []
+    for frame in reversed(traceback.extract_stack(limit=60)):
+        path = frame.filename
+        if path.startswith(APP_ROOT) and os.path.basename(path) not in ("sqlprofile.py", "metrics.py"):
+            sites.append(f"{os.path.relpath(path, APP_ROOT)}:{frame.lineno} in {frame.name}")
+            if len(sites) == depth:
+                break
+    return " < ".join(sites) or "?"
+
+# ---------- profiles ----------
+class Profile:
+    def __init__(self, name):
+        self.name = name
+        self.started_at = time.time()
+        self.start = time.perf_counter()
+        self.duration = 0.0
+        self.queries = 0
+        self.db_time = 0.0
+        self.shapes = {}  # shape -> [count, seconds, call site]
+
+    def record(self, statement, seconds):
+        key = shape(statement)
+        entry = self.shapes.get(key)
+        if entry is None:
+            entry = self.shapes[key] = [0, 0.0, _call_site()]
+        entry[0] += 1
+        entry[1] += seconds
+        self.queries += 1
+        self.db_time += seconds
+
+    def repeated(self, threshold=None):
+        """[(shape, count, seconds, call site)] for SELECT shapes at or above the N+1 threshold."""
+        threshold = threshold or NPLUS1_THRESHOLD
+        return sorted(((s, n, t, site) for s, (n, t, site) in self.shapes.items()
+                       if n >= threshold and s.upper().startswith("SELECT")), key=lambda r: -r[1])
+
+    def summary(self) -> str:
+        line = (f"{self.name}: {self.queries} queries, {self.db_time * 1000:.1f} ms db "
+                f"/ {self.duration * 1000:.1f} ms total")
+        for s, n, _, site in self.repeated():
+            line += f"; N+1? {n}x [{site}] {s[:120]}"
+        return line
+
+@contextmanager
+def _profiling(name):
+    profile = Profile(name)
+    token = _current.set(profile)
+    try:
+        yield profile
+    finally:
+        _current.reset(token)
+        _finish(profile)
+
+def _finish(profile):
+    profile.duration = time.perf_counter() - profile.start
+    if not profile.queries:
+        return
+    with _recent_lock:
+        _recent.append(profile)
+    if profile.repeated():
+        log.warning(profile.summary())
+    else:
+        log.info(profile.summary())
+
+def scope(name):
+    """Profile the SQL run inside the block (no-op unless profiling is enabled)."""
+    return _profiling(name) if _enabled else nullcontext()
+
+def recent():
+    with _recent_lock:
+        return list(_recent)
+
+# ---------- engine hooks ----------
+def _before_execute(conn, cursor, statement, parameters, context, executemany):
+    if _current.get() is not None:
+        context._sqlprofile_start = time.perf_counter()
+
+def _after_execute(conn, cursor, statement, parameters, context, executemany):
+    profile = _current.get()
+    start = getattr(context, "_sqlprofile_start", None)
+    if profile is not None and start is not None:
+        profile.record(statement, time.perf_counter() - start)
+
+def enable():
+    """Install the listeners on every Engine (both the SessionLocal engine and Flask-SQLAlchemy's)."""
+    global _enabled
+    if _enabled:
+        return
+    from sqlalchemy import event
+    from sqlalchemy.engine import Engine
+    event.listen(Engine, "before_cursor_execute", _before_execute)
+    event.listen(Engine, "after_cursor_execute", _after_execute)
+    _enabled = True
+
+# ---------- Flask ----------
+def init_app(app):
+    """When app.config["SQL_PROFILE"] is set: profile each request and serve /_sqlprofile."""
+    if not app.config.get("SQL_PROFILE"):
+        return
+    from flask import g, render_template, request
+
+    enable()
+    log.setLevel(logging.INFO)
+
+    @app.before_request
+    def _start_profile():
+        if request.endpoint != "sqlprofile":
+            profile = Profile(f"{request.method} {request.endpoint or request.path}")
+            g._sqlprofile = (profile, _current.set(profile))
+
+    @app.teardown_request
+    def _end_profile(exc):
+        started = g.pop("_sqlprofile", None)
+        if started is None:
+            return
+        profile, token = started
+        try:
+            _current.reset(token)
+        except ValueError:  # teardown ran in another context (streamed response)
+            pass
+        _finish(profile)
+
+    def report():
+        profiles = sorted(recent(), key=lambda p: p.started_at, reverse=True)
+        only_flagged = request.args.get("flagged") == "1"
+        if only_flagged:
+            profiles = [p for p in profiles if p.repeated()]
+        return render_template("sqlprofile.html", profiles=profiles, threshold=NPLUS1_THRESHOLD,
+                               only_flagged=only_flagged)
+
+    app.add_url_rule("/_sqlprofile", "sqlprofile", report)
@@ -0,0 +1,182 @@
+# workspace.py
+# Whole-workspace backup/migration as one zip archive of JSON-lines sections.
+# Export streams: rows are read with yield_per and the zip is written to an
+# unseekable sink that is drained after every batch, so memory stays flat no
+# matter how big the workspace is. Import reads the sections back and writes
+# them with batched executemany inserts, remapping ids between sections.
+#
+# The document sections (documents / revisions / shares) use the models in
+# app.py and are wired up there; this module owns the archive format and the
+# organizer + citation sections.
+import io
+import json
+import zipfile
+from datetime import date, datetime
+
+from sqlalchemy import Date, DateTime, insert, select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from extensions import db
+from biblio import Citation
+from organizer import Project, Task, TaskLabel, parse_labels, invalidate_widgets
+
+ARCHIVE_FORMAT = "notes-workspace"
+ARCHIVE_VERSION = 1
+BATCH = 500  # rows per yield_per batch / executemany insert
+
+# ---------- rows ----------
+def _dump(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return value
+
+def to_row(obj, exclude=()):
+    """Column values of a model instance as JSON-safe values."""
+    return {c.key: _dump(getattr(obj, c.key)) for c in obj.__table__.columns if c.key not in exclude}
+
+def from_row(model, row, exclude=("id",)):
+    """Archive row -> insert values for `model`: unknown keys dropped, dates parsed."""
+    values = {}
+    for c in model.__table__.columns:
+        if c.key in exclude or c.key not in row:
+            continue
+        v = row[c.key]
+        if v is not None and isinstance(c.type, DateTime):
+            v = datetime.fromisoformat(v)
+        elif v is not None and isinstance(c.type, Date):
+            v = date.fromisoformat(v)
+        values[c.key] = v
+    return values
+
+def batches(rows, n=BATCH):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= n:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+# ---------- archive ----------
+class _Sink(io.RawIOBase):
+    """Write-only, unseekable buffer; zipfile then streams entries with data descriptors."""
+
+    def __init__(self):
+        self._chunks = []
+        self._pos = 0
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        self._chunks.append(bytes(b))
+        self._pos += len(b)
+        return len(b)
+
+    def tell(self):
+        return self._pos
+
+    def drain(self) -> bytes:
+        out = b"".join(self._chunks)
+        self._chunks.clear()
+        return out
+
+def stream_archive(manifest: dict, sections):
+    """
+    Yield the zip archive in chunks. sections: [(name, iterable of dicts)],
+    each written as <name>.jsonl; iterables are consumed lazily.
+    """
+    sink = _Sink()
+    with zipfile.ZipFile(sink, "w", zipfile.ZIP_DEFLATED) as zf:
+        counts = {}
+        for name, rows in sections:
+            n = 0
+            with zf.open(f"{name}.jsonl", "w", force_zip64=True) as f:
+                for row in rows:
+                    f.write(json.dumps(row, ensure_ascii=False).encode("utf-8") + b"\n")
+                    n += 1
+                    if n % BATCH == 0:
+                        yield sink.drain()
+            counts[name] = n
+            yield sink.drain()
+        # written last so it can carry the row counts
+        zf.writestr("manifest.json", json.dumps(dict(manifest, format=ARCHIVE_FORMAT,
+                                                     version=ARCHIVE_VERSION, counts=counts), indent=2))
+    yield sink.drain()
+
+def open_archive(fileobj):
+    """(ZipFile, manifest) for an uploaded/opened archive; raises ValueError if it isn't one."""
+    try:
+        zf = zipfile.ZipFile(fileobj)
+        manifest = json.loads(zf.read("manifest.json"))
+    except (zipfile.BadZipFile, KeyError, ValueError):
+        raise ValueError("not a workspace archive")
+    if manifest.get("format") != ARCHIVE_FORMAT or manifest.get("version", 0) > ARCHIVE_VERSION:
+        raise ValueError("unsupported workspace archive")
+    return zf, manifest
+
+def read_section(zf, name):
+    """Rows of <name>.jsonl, one at a time; missing sections are empty."""
+    try:
+        f = zf.open(f"{name}.jsonl")
+    except KeyError:
+        return
+    with f:
+        for line in io.TextIOWrapper(f, encoding="utf-8"):
+            if line.strip():
+                yield json.loads(line)
+
+# ---------- organizer + citations ----------
+def user_sections(user_id):
+    """Sections owned by the Flask-SQLAlchemy models; needs an app context while consumed."""
+    def rows(model, owner_col, exclude):
+        stmt = select(model).filter_by(**{owner_col: user_id}).order_by(model.id)
+        for obj in db.session.scalars(stmt.execution_options(yield_per=BATCH)):
+            yield to_row(obj, exclude)
+    return [
+        ("citations", rows(Citation, "user_id", ("user_id",))),
+        ("projects", rows(Project, "owner_id", ("owner_id",))),
+        ("tasks", rows(Task, "owner_id", ("owner_id",))),
+    ]
+
+def insert_many(model, rows, returning=False):
+    """executemany insert; with returning=True gives the new ids in row order."""
+    if not rows:
+        return []
+    if returning:
+        stmt = insert(model).returning(model.id, sort_by_parameter_order=True)
+        return [r[0] for r in db.session.execute(stmt, rows)]
+    db.session.execute(insert(model), rows)
+    return []
+
+def import_user_sections(zf, user_id) -> dict:
+    """Import citations, projects and tasks for `user_id` in one transaction."""
+    counts = {"citations": 0, "projects": 0, "tasks": 0}
+    for batch in batches(read_section(zf, "citations")):
+        values = [dict(from_row(Citation, r), user_id=user_id) for r in batch]
+        # keys are unique per user: keep what is already there
+        stmt = sqlite_insert(Citation).on_conflict_do_nothing(index_elements=["user_id", "key"])
+        result = db.session.connection().execute(stmt, values)
+        counts["citations"] += result.rowcount  # rows actually inserted
+
+    project_ids = {}
+    for batch in batches(read_section(zf, "projects")):
+        new_ids = insert_many(Project, [dict(from_row(Project, r), owner_id=user_id) for r in batch], returning=True)
+        project_ids.update(zip((r["id"] for r in batch), new_ids))
+        counts["projects"] += len(batch)
+
+    for batch in batches(read_section(zf, "tasks")):
+        values = []
+        for r in batch:
+            v = dict(from_row(Task, r), owner_id=user_id, project_id=project_ids.get(r.get("project_id")))
+            v["external_id"] = None  # sync ids belong to the source account
+            values.append(v)
+        new_ids = insert_many(Task, values, returning=True)
+        labels = [dict(task_id=tid, owner_id=user_id, name=n)
+                  for tid, v in zip(new_ids, values) for n in parse_labels(v.get("labels"))]
+        insert_many(TaskLabel, labels)
+        counts["tasks"] += len(batch)
+    db.session.commit()
+    invalidate_widgets(user_id)
+    return counts